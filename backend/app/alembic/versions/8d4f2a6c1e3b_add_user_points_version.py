@@ -0,0 +1,29 @@
+"""Add user_points.version for the balance cache
+
+Revision ID: 8d4f2a6c1e3b
+Revises: 7c2d4e6f8a10
+Create Date: 2026-10-16
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d4f2a6c1e3b"
+down_revision = "7c2d4e6f8a10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Constant server default: PostgreSQL adds the column without rewriting the table.
+    op.add_column(
+        "user_points",
+        sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("user_points", "version")
@@ -0,0 +1,75 @@
+"""Add (user_id, id DESC) indexes for cursor-paginated lists
+
+Revision ID: 9e5b3c7d2f41
+Revises: 8d4f2a6c1e3b
+Create Date: 2026-10-16
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9e5b3c7d2f41"
+down_revision = "8d4f2a6c1e3b"
+branch_labels = None
+depends_on = None
+
+# List endpoints filter by user_id and page on id DESC (snowflake ids are
+# time-ordered), so these indexes return a page without sorting the user's rows.
+# Each replaces the table's single-column user_id index: the composite index
+# has the same leading column, so it serves the user_id lookups and the
+# ON DELETE CASCADE from users as well.
+INDEXES = (
+    ("ix_emoji_tasks_user_id_id", "ix_emoji_tasks_user_id", "emoji_tasks"),
+    ("ix_point_transactions_user_id_id", "ix_point_transactions_user_id", "point_transactions"),
+    ("ix_orders_user_id_id", "ix_orders_user_id", "orders"),
+)
+
+
+def _drop_if_invalid(name: str, table: str) -> None:
+    # A CREATE INDEX CONCURRENTLY that failed halfway leaves an INVALID index
+    # behind, which IF NOT EXISTS would silently keep; drop it and build again.
+    invalid = op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_index i"
+            " JOIN pg_class c ON c.oid = i.indexrelid"
+            " JOIN pg_namespace n ON n.oid = c.relnamespace"
+            " WHERE c.relname = :name AND n.nspname = current_schema() AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def _create_index(name: str, table: str, columns: list) -> None:
+    _drop_if_invalid(name, table)
+    op.create_index(
+        name,
+        table,
+        columns,
+        unique=False,
+        postgresql_concurrently=True,
+        if_not_exists=True,
+    )
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction and doesn't block writes.
+    with op.get_context().autocommit_block():
+        for name, old_name, table in INDEXES:
+            _create_index(name, table, ["user_id", sa.text("id DESC")])
+            op.drop_index(
+                old_name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, old_name, table in INDEXES:
+            _create_index(old_name, table, ["user_id"])
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
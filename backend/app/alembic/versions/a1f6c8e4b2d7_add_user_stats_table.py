@@ -0,0 +1,50 @@
+"""Add user_stats counters for list totals
+
+Revision ID: a1f6c8e4b2d7
+Revises: 9e5b3c7d2f41
+Create Date: 2026-10-16
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a1f6c8e4b2d7"
+down_revision = "9e5b3c7d2f41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_stats",
+        sa.Column(
+            "user_id",
+            sa.BigInteger(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+            autoincrement=False,
+        ),
+        sa.Column("emoji_tasks", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("point_transactions", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("orders", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    # Backfill from the existing rows; new writes keep the counters in step.
+    op.execute(
+        """
+        INSERT INTO user_stats (user_id, emoji_tasks, point_transactions, orders, updated_at)
+        SELECT u.id,
+               (SELECT count(*) FROM emoji_tasks t WHERE t.user_id = u.id),
+               (SELECT count(*) FROM point_transactions p WHERE p.user_id = u.id),
+               (SELECT count(*) FROM orders o WHERE o.user_id = u.id),
+               now()
+        FROM users u
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_stats")
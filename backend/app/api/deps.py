@@ -7,23 +7,34 @@ FastAPI 的依赖注入系统会自动处理这些依赖的创建和注入。
 关键概念：
 - Depends: FastAPI 的依赖注入装饰器
 - Generator: 用于创建需要清理的资源（如数据库会话）
+- AsyncSession: 异步数据库会话，供 async def 路由使用（不占用线程池）
 - OAuth2PasswordBearer: OAuth2 密码流，用于从请求头提取 token
 """
-from collections.abc import Generator  # 生成器类型，用于资源管理
+import secrets  # 常量时间比较
+from collections.abc import AsyncGenerator, Generator  # 生成器类型，用于资源管理
 from typing import Annotated  # 类型注解，用于依赖注入
 
 import jwt  # JWT 解析库
-from fastapi import Depends, HTTPException, status  # FastAPI 核心功能
+from fastapi import Depends, Header, HTTPException, status  # FastAPI 核心功能
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer  # Bearer 方案
 from jwt.exceptions import InvalidTokenError  # JWT 无效异常
 from pydantic import ValidationError  # Pydantic 验证异常
 from sqlmodel import Session  # 数据库会话
+from sqlmodel.ext.asyncio.session import AsyncSession  # 异步数据库会话
 
 from app.api.schemas import TokenPayload
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, engine
 from app.models import User
+from app.services.user_cache import (
+    cache_generation,
+    cache_generation_async,
+    cache_user,
+    cache_user_async,
+    get_cached_user,
+    get_cached_user_async,
+)
 
 # Bearer 认证配置
 # 告诉 FastAPI 从请求头的 Authorization: Bearer <token> 中提取 token
@@ -50,36 +61,34 @@ def get_db() -> Generator[Session, None, None]:
         yield session  # yield 确保会话在请求结束后自动关闭
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取异步数据库会话（依赖注入）
+
+    供 async def 路由使用，数据库 I/O 在事件循环中等待，不占用 Starlette 线程池。
+    expire_on_commit=False：提交后不过期对象属性，避免访问属性时触发隐式的同步加载。
+
+    Yields:
+        AsyncSession: 异步数据库会话对象
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 # 类型别名，简化依赖注入的写法
 SessionDep = Annotated[Session, Depends(get_db)]  # 数据库会话依赖
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]  # 异步数据库会话依赖
 TokenDep = Annotated[
     HTTPAuthorizationCredentials, Depends(reusable_oauth2)
 ]  # JWT token 依赖
 
 
-def get_current_user(
-    session: SessionDep, token: TokenDep
-) -> User:
+def _user_id_from_token(token: HTTPAuthorizationCredentials) -> int:
     """
-    获取当前登录用户（依赖注入）
-
-    从 JWT token 中解析用户信息，并查询数据库获取完整用户对象。
-    如果 token 无效或用户不存在，抛出 401 未授权错误。
-
-    Args:
-        session: 数据库会话（自动注入）
-        token: JWT token（自动从请求头提取）
-
-    Returns:
-        User: 当前登录的用户对象
+    校验 JWT token 并返回用户 ID
 
     Raises:
-        HTTPException: 当 token 无效、用户不存在或认证失败时
-
-    使用示例：
-        @app.get("/profile")
-        def get_profile(user: User = Depends(get_current_user)):
-            return user
+        HTTPException: 当 token 无效或用户标识格式错误时
     """
     try:
         # 解析 JWT token
@@ -110,12 +119,103 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
         )
-    # 从数据库查询用户
+    return user_id
+
+
+def get_current_user(
+    session: SessionDep, token: TokenDep
+) -> User:
+    """
+    获取当前登录用户（依赖注入）
+
+    从 JWT token 中解析用户信息，并获取完整用户对象。
+    用户对象优先从用户缓存读取（见 app.services.user_cache），未命中才查询数据库；
+    缓存命中时返回的是游离态对象，修改后 session.add 即可按 UPDATE 持久化。
+    如果 token 无效或用户不存在，抛出 401 未授权错误。
+
+    Args:
+        session: 数据库会话（自动注入）
+        token: JWT token（自动从请求头提取）
+
+    Returns:
+        User: 当前登录的用户对象
+
+    Raises:
+        HTTPException: 当 token 无效、用户不存在或认证失败时
+
+    使用示例：
+        @app.get("/profile")
+        def get_profile(user: User = Depends(get_current_user)):
+            return user
+    """
+    user_id = _user_id_from_token(token)
+    # 优先从缓存读取（命中时不访问数据库）
+    user = get_cached_user(user_id)
+    if user is not None:
+        return user
+    # 缓存未命中，从数据库查询用户并回填缓存
+    # 查询前记录失效代数，期间用户被修改时放弃回填，避免把旧数据写回缓存
+    generation = cache_generation(user_id)
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    cache_user(user, generation)
+    return user
+
+
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    """
+    获取当前登录用户（async 版本，依赖注入）
+
+    与 get_current_user 逻辑相同，但使用异步会话和异步 Redis 客户端，
+    供 async def 路由使用，整个认证过程不占用线程池。
+
+    Args:
+        session: 异步数据库会话（自动注入）
+        token: JWT token（自动从请求头提取）
+
+    Returns:
+        User: 当前登录的用户对象
+
+    Raises:
+        HTTPException: 当 token 无效、用户不存在或认证失败时
+    """
+    user_id = _user_id_from_token(token)
+    user = await get_cached_user_async(user_id)
+    if user is not None:
+        return user
+    generation = await cache_generation_async(user_id)
+    user = await session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    await cache_user_async(user, generation)
     return user
 
 
 # 类型别名，简化需要认证的路由写法
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]  # async 路由使用
+
+
+def require_ops_token(authorization: str | None = Header(default=None)) -> None:
+    """
+    校验运维接口的访问令牌（依赖注入）
+
+    要求 Authorization: Bearer <OPS_API_TOKEN>。未配置 OPS_API_TOKEN 时拒绝所有请求，
+    避免连接池等内部状态在未配置的环境中被公开访问。
+
+    Raises:
+        HTTPException: 令牌未配置或不匹配时返回 401
+    """
+    token = settings.OPS_API_TOKEN
+    if not token or not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {token}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+
+
+# 运维接口使用：dependencies=[OpsTokenDep]
+OpsTokenDep = Depends(require_ops_token)
@@ -0,0 +1,111 @@
+"""
+分页工具模块
+
+列表接口（表情历史、积分流水、订单列表）共用的分页逻辑。
+
+支持两种方式：
+- 游标分页（推荐）：按 (user_id, id DESC) 做 keyset 分页，
+  WHERE user_id = :uid AND id < :cursor ORDER BY id DESC LIMIT n，
+  深翻页不再扫描并丢弃前面的行。雪花 ID 按时间递增，id 倒序即创建时间倒序。
+- 页码分页（兼容旧客户端）：page/page_size 仍然可用，内部使用 OFFSET。
+
+两种方式都会返回 next_cursor（不透明字符串），客户端可以随时切换到游标分页。
+总数 count 读取 user_stats 计数器（O(1) 主键查询），不再对用户的所有行 count(*)；
+客户端传 with_count=false 时不返回。
+"""
+from __future__ import annotations
+
+import base64  # 游标编码
+from typing import Any, TypeVar  # 类型提示
+
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.api.errors import AppError
+
+T = TypeVar("T")
+
+# 游标格式版本，便于以后更换编码而不破坏已发出的游标
+_CURSOR_PREFIX = "v1:"
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    把本页最后一行的 id 编码为不透明游标
+
+    Args:
+        last_id: 本页最后一行的 id
+
+    Returns:
+        str: URL 安全的游标字符串
+    """
+    raw = f"{_CURSOR_PREFIX}{last_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    解析游标
+
+    Args:
+        cursor: encode_cursor 生成的游标
+
+    Returns:
+        int: 上一页最后一行的 id
+
+    Raises:
+        AppError: 游标格式不正确时抛出 400010
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not raw.startswith(_CURSOR_PREFIX):
+            raise ValueError(raw)
+        return int(raw[len(_CURSOR_PREFIX):])
+    except ValueError as exc:  # binascii.Error / UnicodeDecodeError 都是 ValueError 的子类
+        raise AppError(code=400010, message="Invalid cursor", status_code=400) from exc
+
+
+def paginate_by_user(
+    session: Session,
+    model: type[T],
+    *,
+    user_id: int,
+    cursor: str | None,
+    page: int,
+    page_size: int,
+    with_count: bool,
+) -> tuple[list[T], str | None, int | None]:
+    """
+    按用户分页查询（游标优先，未传游标时按页码）
+
+    多查询一行用于判断是否还有下一页，不需要额外的 count 查询。
+
+    Args:
+        session: 数据库会话
+        model: 带 id、user_id 字段、在 user_stats 中有计数器的表模型
+        user_id: 当前用户 ID
+        cursor: 游标（为空时使用 page）
+        page: 页码（从 1 开始，仅在没有游标时使用）
+        page_size: 每页数量
+        with_count: 是否返回总数
+
+    Returns:
+        (本页数据, 下一页游标（没有下一页时为 None）, 总数（未请求时为 None）)
+    """
+    m: Any = model
+    stmt = select(m).where(m.user_id == user_id).order_by(col(m.id).desc())
+    if cursor:
+        stmt = stmt.where(m.id < decode_cursor(cursor))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    rows = list(session.exec(stmt.limit(page_size + 1)).all())
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].id)
+
+    count = None
+    if with_count:
+        count = crud.get_user_count(session=session, user_id=user_id, model=model)
+    return rows, next_cursor, count
@@ -11,7 +11,7 @@ from datetime import timedelta  # 时间间隔
 from fastapi import APIRouter  # FastAPI 路由器
 
 from app import crud  # 数据库操作
-from app.api.deps import SessionDep  # 数据库会话依赖
+from app.api.deps import AsyncSessionDep  # 异步数据库会话依赖
 from app.api.schemas import ApiEnvelope, AuthLoginData, AuthLoginRequest, UserProfile
 from app.core import security  # 安全模块（JWT）
 from app.core.config import settings
@@ -21,17 +21,18 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/login", response_model=ApiEnvelope)
-def login(session: SessionDep, body: AuthLoginRequest) -> ApiEnvelope:
+async def login(session: AsyncSessionDep, body: AuthLoginRequest) -> ApiEnvelope:
     """
     用户登录接口
 
     使用设备 ID 登录，如果用户不存在则自动创建。
     登录成功后返回 JWT token 和用户信息。
+    使用异步会话运行在事件循环中，不占用线程池。
 
     请求路径: POST /api/v1/auth/login
 
     Args:
-        session: 数据库会话（自动注入）
+        session: 异步数据库会话（自动注入）
         body: 登录请求数据（包含 device_id）
 
     Returns:
@@ -55,9 +56,11 @@ def login(session: SessionDep, body: AuthLoginRequest) -> ApiEnvelope:
         }
     """
     # 获取或创建用户（如果不存在则自动创建）
-    user = crud.get_or_create_user_by_device_id(session=session, device_id=body.device_id)
-    # 获取用户积分账户
-    points_row = crud.get_user_points(session=session, user_id=user.id)
+    user = await crud.get_or_create_user_by_device_id_async(
+        session=session, device_id=body.device_id
+    )
+    # 获取用户积分余额（优先读余额缓存）
+    points_balance = await crud.get_points_balance_async(session=session, user_id=user.id)
 
     # 生成 JWT token
     access_token_expires = timedelta(days=settings.ACCESS_TOKEN_EXPIRE_DAYS)
@@ -72,7 +75,7 @@ def login(session: SessionDep, body: AuthLoginRequest) -> ApiEnvelope:
         is_vip=user.is_vip,
         vip_type=user.vip_type,
         vip_expire_time=user.vip_expire_time,
-        points_balance=points_row.balance,
+        points_balance=points_balance,
     )
     # 构建登录响应数据
     data = AuthLoginData(access_token=token, expires_in=expires_in, user=profile)
@@ -3,7 +3,10 @@
 
 处理表情生成相关的 API 端点，包括：
 - 上传图片并检测人脸
+- 客户端直传 OSS（PostObject 签名表单）后检测人脸
 - 创建表情生成任务（扣除积分，异步处理）
+- 查询任务状态（轮询，或通过 SSE 订阅状态推送）
+- 接收 DashScope 任务完成回调（可选）
 - 查询表情生成历史（分页）
 """
 from __future__ import annotations
@@ -11,33 +14,82 @@ from __future__ import annotations
 import json
 import secrets
 import time
-from io import BytesIO
+from collections.abc import AsyncIterator
+from typing import Any
 
-from fastapi import APIRouter, Query, UploadFile
-from sqlmodel import func, select
+from fastapi import APIRouter, Header, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep, CurrentUser, SessionDep
 from app.api.errors import AppError
+from app.api.pagination import paginate_by_user
 from app.api.schemas import (
     ApiEnvelope,
     EmojiCreateRequest,
     EmojiDetectData,
+    EmojiDetectUploadedRequest,
     EmojiHistoryData,
     EmojiTaskData,
+    EmojiUploadUrlData,
+    EmojiUploadUrlRequest,
 )
 from app.core.config import settings
-from app.core.redis import get_redis
-from app.enums import EmojiTaskStatus, PointTransactionType
+from app.core.offload import run_blocking
+from app.enums import PointTransactionType
 from app.integrations.aliyun_emoji import aliyun_emoji_client
-from app.integrations.oss import upload_file
-from app.models import EmojiTask, utc_now
+from app.integrations.oss import (
+    build_object_url,
+    delete_object,
+    get_object_size,
+    presign_upload,
+    upload_file,
+)
+from app.models import EmojiTask
+from app.services import outbox, task_events
 from app.services.config_service import get_config
 
 router = APIRouter(prefix="/emoji", tags=["emoji"])
 
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# 直传时按扩展名确定的 MIME 类型（写入签名的 Policy）
+CONTENT_TYPES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+
+def _file_ext(filename: str | None) -> str:
+    """
+    校验文件名并返回小写扩展名
+
+    Raises:
+        AppError: 缺少文件名或扩展名不在允许列表中时
+    """
+    if not filename:
+        raise AppError(code=400001, message="No filename", status_code=400)
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext not in ALLOWED_EXTENSIONS:
+        raise AppError(code=400002, message="Invalid file type", status_code=400)
+    return ext
+
+
+def _new_upload_key(user_id: int, ext: str) -> str:
+    """生成用户上传图片的 OSS key：{OSS_DIR_PREFIX}/{user_id}/{时间戳}_{随机串}.{ext}"""
+    ts = int(time.time())
+    rand = secrets.token_hex(8)
+    return f"{settings.OSS_DIR_PREFIX}/{user_id}/{ts}_{rand}.{ext}"
+
+
+async def _detect_image(image_url: str) -> EmojiDetectData:
+    """调用阿里云 API 检测人脸（异步 HTTP 调用）"""
+    r = await aliyun_emoji_client.detect_async(image_url=image_url)
+    return EmojiDetectData(
+        image_url=image_url,
+        passed=r.passed,
+        face_bbox=r.face_bbox,
+        ext_bbox=r.ext_bbox,
+        raw=r.raw,
+    )
 
 
 @router.post("/detect", response_model=ApiEnvelope)
@@ -45,7 +97,11 @@ async def detect(current_user: CurrentUser, file: UploadFile) -> ApiEnvelope:
     """
     上传图片并检测人脸
 
-    接收图片文件，上传到 OSS，然后调用阿里云 API 检测人脸。
+    接收图片文件，流式上传到 OSS（每个请求的内存占用与文件大小无关），
+    然后调用阿里云 API 检测人脸。
+    OSS 上传在有界线程池中执行，人脸检测使用异步 HTTP 客户端，整个过程不阻塞事件循环。
+
+    新客户端应优先使用 /upload/presign + /upload/complete 直传 OSS，图片不经过 API 服务器。
 
     请求路径: POST /api/v1/emoji/detect
     Content-Type: multipart/form-data
@@ -58,38 +114,105 @@ async def detect(current_user: CurrentUser, file: UploadFile) -> ApiEnvelope:
         ApiEnvelope: 包含图片 URL 和检测结果
     """
     # 验证文件类型
-    if not file.filename:
-        raise AppError(code=400001, message="No filename", status_code=400)
-    ext = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else ""
-    if ext not in ALLOWED_EXTENSIONS:
-        raise AppError(code=400002, message="Invalid file type", status_code=400)
+    ext = _file_ext(file.filename)
 
-    # 验证文件大小
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
+    # 验证文件大小：已知大小时直接拒绝，不触发任何上传
+    if file.size is not None and file.size > MAX_FILE_SIZE:
         raise AppError(code=400003, message="File too large", status_code=400)
 
     # 生成 OSS key 并上传
-    ts = int(time.time())
-    rand = secrets.token_hex(8)
-    key = f"{settings.OSS_DIR_PREFIX}/{current_user.id}/{ts}_{rand}.{ext}"
+    key = _new_upload_key(current_user.id, ext)
+
+    # 流式分片上传：直接读取 UploadFile 底层文件，边读边校验大小，不把整个文件读入内存
+    # oss2 是同步 SDK，放到有界线程池中执行，避免阻塞事件循环
+    image_url = await run_blocking(
+        upload_file,
+        file=file.file,
+        key=key,
+        content_type=file.content_type,
+        max_size=MAX_FILE_SIZE,
+    )
+
+    return ApiEnvelope(data=await _detect_image(image_url))
+
+
+@router.post("/upload/presign", response_model=ApiEnvelope)
+def presign(current_user: CurrentUser, body: EmojiUploadUrlRequest) -> ApiEnvelope:
+    """
+    申请图片直传 URL
 
-    image_url = upload_file(file=BytesIO(content), key=key, content_type=file.content_type)
+    生成短期有效的 PostObject 表单参数，客户端直接上传到 OSS 的
+    {OSS_DIR_PREFIX}/{user_id}/ 目录下，API 服务器不接触图片数据。
+    签名的 Policy 限制了文件大小（MAX_FILE_SIZE）和 Content-Type，超限上传由 OSS 拒绝。
+    上传完成后调用 /upload/complete 进行人脸检测。
 
-    # 检测人脸
-    r = aliyun_emoji_client.detect(image_url=image_url)
+    请求路径: POST /api/v1/emoji/upload/presign
+
+    Args:
+        current_user: 当前登录用户
+        body: 文件名和 MIME 类型
+
+    Returns:
+        ApiEnvelope: 包含 key、上传 URL、必须携带的表单字段和有效期
+    """
+    ext = _file_ext(body.filename)
+    content_type = body.content_type or CONTENT_TYPES[ext]
+    if not content_type.startswith("image/"):
+        raise AppError(code=400002, message="Invalid file type", status_code=400)
+    key = _new_upload_key(current_user.id, ext)
+    # 签名是本地计算，不产生网络请求
+    upload_url, fields = presign_upload(key=key, content_type=content_type, max_size=MAX_FILE_SIZE)
 
     return ApiEnvelope(
-        data=EmojiDetectData(
-            image_url=image_url,
-            passed=r.passed,
-            face_bbox=r.face_bbox,
-            ext_bbox=r.ext_bbox,
-            raw=r.raw,
+        data=EmojiUploadUrlData(
+            key=key,
+            upload_url=upload_url,
+            fields=fields,
+            expires_in=settings.OSS_UPLOAD_EXPIRE_SECONDS,
+            image_url=build_object_url(key=key),
         )
     )
 
 
+@router.post("/upload/complete", response_model=ApiEnvelope)
+async def upload_complete(
+    current_user: CurrentUser, body: EmojiDetectUploadedRequest
+) -> ApiEnvelope:
+    """
+    直传完成后检测人脸
+
+    校验 key 属于当前用户的上传目录、对象已存在且不超过大小限制，
+    然后对该图片进行人脸检测。返回格式与 /detect 相同。
+
+    请求路径: POST /api/v1/emoji/upload/complete
+
+    Args:
+        current_user: 当前登录用户
+        body: 直传时使用的 key
+
+    Returns:
+        ApiEnvelope: 包含图片 URL 和检测结果
+
+    Raises:
+        AppError: key 不属于当前用户、对象不存在或文件过大时
+    """
+    key = body.key
+    prefix = f"{settings.OSS_DIR_PREFIX}/{current_user.id}/"
+    if not key.startswith(prefix) or "/" in key[len(prefix) :] or ".." in key:
+        raise AppError(code=400004, message="Invalid upload key", status_code=400)
+    _file_ext(key)
+
+    size = await run_blocking(get_object_size, key=key)
+    if size is None:
+        raise AppError(code=404102, message="Uploaded file not found", status_code=404)
+    if size > MAX_FILE_SIZE:
+        # Policy 已限制大小，这里兜底：超限文件直接删除
+        await run_blocking(delete_object, key=key)
+        raise AppError(code=400003, message="File too large", status_code=400)
+
+    return ApiEnvelope(data=await _detect_image(build_object_url(key=key)))
+
+
 @router.post("/create", response_model=ApiEnvelope)
 def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequest) -> ApiEnvelope:
     """
@@ -98,6 +221,10 @@ def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequ
     创建表情生成任务，扣除积分，并将任务加入 Redis Streams 队列等待后台处理。
     如果用户没有提供人脸位置信息，会自动调用检测接口。
 
+    积分扣减、任务记录和发件箱消息在同一个事务中提交，请求路径上不访问 Redis；
+    后台 relay（worker/outbox_relay.py）把发件箱消息批量发布到 emoji_tasks 队列。
+    Redis 暂时不可用时任务保持 pending，恢复后自动入队，不会出现"已扣费但未入队"。
+
     重要：积分在任务创建时立即扣除，即使后续生成失败也不会退款。
 
     请求路径: POST /api/v1/emoji/create
@@ -111,7 +238,7 @@ def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequ
         ApiEnvelope: 包含任务信息的响应
 
     Raises:
-        AppError: 当积分不足、图片检测失败或 Redis 队列不可用时
+        AppError: 当积分不足或图片检测失败时
     """
     cfg = get_config()
     # 从配置获取表情生成消耗的积分（默认 200）
@@ -145,6 +272,7 @@ def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequ
         delta=-points_cost,  # 负数表示扣除
         tx_type=PointTransactionType.consume,
         task_type="emoji",
+        commit=False,
     )
 
     # 创建表情生成任务
@@ -155,38 +283,15 @@ def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequ
         driven_id=body.driven_id,
         detect_result=detect_result,
         points_cost=points_cost,
+        commit=False,
     )
 
-    # 将任务加入 Redis Streams 队列，等待后台 worker 异步处理
-    redis_enqueue_failed = False
-    redis_error_msg = ""
-    try:
-        rds = get_redis()
-        # 使用 Redis Streams 的 XADD 命令添加任务
-        rds.xadd(
-            "emoji_tasks",  # Stream 名称
-            {
-                "task_id": str(task.id),
-                "user_id": str(current_user.id),
-                "image_url": body.image_url,
-                "driven_id": body.driven_id,
-                "detect_result": json.dumps(detect_result),  # JSON 序列化
-            },
-        )
-    except Exception as e:
-        # Redis 队列不可用，标记失败，稍后更新任务状态
-        redis_enqueue_failed = True
-        redis_error_msg = f"Queue unavailable: {e}"
-
-    # 如果 Redis 入队失败，在单独的事务中更新任务状态为失败
-    if redis_enqueue_failed:
-        task.status = EmojiTaskStatus.failed
-        task.error_message = redis_error_msg
-        task.completed_at = utc_now()
-        session.add(task)
-        session.commit()
-        session.refresh(task)
+    # 写入发件箱消息，由后台 relay 发布到 Redis Streams
+    # 开启 worker 快速路径时消息携带任务数据，worker 不再读库
+    fields = outbox.emoji_task_fields(task, with_data=settings.EMOJI_WORKER_FAST_PATH)
+    outbox.enqueue(session, stream=outbox.EMOJI_TASK_STREAM, fields=fields)
 
+    # 响应数据全部在客户端生成，提交前构建，避免提交后重新加载
     data = EmojiTaskData(
         id=task.id,
         status=task.status,
@@ -196,20 +301,26 @@ def create(session: SessionDep, current_user: CurrentUser, body: EmojiCreateRequ
         created_at=task.created_at,
         completed_at=task.completed_at,
     )
+    # 积分扣减 + 任务 + 发件箱消息，一次提交
+    session.commit()
     return ApiEnvelope(data=data)
 
 
 @router.get("/task/{task_id}", response_model=ApiEnvelope)
-def task_status(session: SessionDep, current_user: CurrentUser, task_id: int) -> ApiEnvelope:
+async def task_status(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, task_id: int
+) -> ApiEnvelope:
     """
     查询任务状态
 
     查询指定表情生成任务的状态和结果。
+    客户端会高频轮询此接口：优先读取 worker 写入 Redis 的状态快照（按快照中的 user_id
+    校验归属），未命中时查询数据库并回填快照；使用异步会话运行在事件循环中，不占用线程池。
 
     请求路径: GET /api/v1/emoji/task/{task_id}
 
     Args:
-        session: 数据库会话
+        session: 异步数据库会话
         current_user: 当前登录用户
         task_id: 任务 ID
 
@@ -219,9 +330,18 @@ def task_status(session: SessionDep, current_user: CurrentUser, task_id: int) ->
     Raises:
         AppError: 当任务不存在或不属于当前用户时抛出 404101 错误
     """
-    task = session.get(EmojiTask, task_id)
-    if not task or task.user_id != current_user.id:
+    cached = await task_events.get_cached_task_async(task_id)
+    if cached is not None:
+        if cached["user_id"] != current_user.id:
+            raise AppError(code=404101, message="Task not found", status_code=404)
+        return ApiEnvelope(data=EmojiTaskData.model_validate(cached))
+
+    task = await crud.get_user_emoji_task_async(
+        session=session, user_id=current_user.id, task_id=task_id
+    )
+    if not task:
         raise AppError(code=404101, message="Task not found", status_code=404)
+    await task_events.cache_task_async(task)
     data = EmojiTaskData(
         id=task.id,
         status=task.status,
@@ -234,46 +354,170 @@ def task_status(session: SessionDep, current_user: CurrentUser, task_id: int) ->
     return ApiEnvelope(data=data)
 
 
+async def _task_event_stream(pubsub: Any | None, snapshot: dict[str, Any]) -> AsyncIterator[str]:
+    """
+    生成 SSE 事件流
+
+    先推送当前状态，之后转发该任务的状态变化，到达终态、连接超过
+    EMOJI_EVENTS_MAX_SECONDS 或客户端断开时结束；空闲时定期发送心跳注释，
+    避免中间代理断开空闲连接。
+    """
+    final = {s.value for s in task_events.FINAL_STATUSES}
+    try:
+        yield task_events.format_sse(snapshot)
+        last_status = snapshot["status"]
+        if pubsub is None or last_status in final:
+            return
+        deadline = time.monotonic() + settings.EMOJI_EVENTS_MAX_SECONDS
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(
+                timeout=min(settings.EMOJI_EVENTS_KEEPALIVE_SECONDS, remaining)
+            )
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            data = json.loads(message["data"])
+            # 频道按用户划分，这里只转发当前任务、且状态有变化的事件
+            if data.get("id") != snapshot["id"] or data.get("status") == last_status:
+                continue
+            last_status = data["status"]
+            yield task_events.format_sse(EmojiTaskData.model_validate(data).model_dump(mode="json"))
+            if last_status in final:
+                return
+    finally:
+        if pubsub is not None:
+            await task_events.close(pubsub)
+
+
+@router.get("/task/{task_id}/events")
+async def task_events_stream(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, task_id: int
+) -> StreamingResponse:
+    """
+    订阅任务状态推送（Server-Sent Events）
+
+    代替对 GET /emoji/task/{task_id} 的轮询：一个长连接内依次收到
+    event: task 事件（data 与 EmojiTaskData 相同），任务到达 completed/failed 后连接结束。
+    Redis 不可用时只推送当前状态后结束，客户端可以退回轮询。
+
+    请求路径: GET /api/v1/emoji/task/{task_id}/events
+
+    Args:
+        session: 异步数据库会话
+        current_user: 当前登录用户
+        task_id: 任务 ID
+
+    Returns:
+        StreamingResponse: text/event-stream 响应
+
+    Raises:
+        AppError: 当任务不存在或不属于当前用户时抛出 404101 错误
+    """
+    # 先订阅再读取当前状态，读取之后发生的变化不会丢失
+    pubsub = await task_events.subscribe(current_user.id)
+    task = await crud.get_user_emoji_task_async(
+        session=session, user_id=current_user.id, task_id=task_id
+    )
+    if not task:
+        if pubsub is not None:
+            await task_events.close(pubsub)
+        raise AppError(code=404101, message="Task not found", status_code=404)
+    snapshot = EmojiTaskData.model_validate(task, from_attributes=True).model_dump(mode="json")
+    return StreamingResponse(
+        _task_event_stream(pubsub, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _callback_authorized(authorization: str | None, secret: str) -> bool:
+    """校验回调的 Authorization 头（接受原始密钥或 Bearer 格式，常量时间比较）"""
+    value = (authorization or "").encode()
+    return secrets.compare_digest(value, secret.encode()) | secrets.compare_digest(
+        value, f"Bearer {secret}".encode()
+    )
+
+
+@router.post("/callback/dashscope", response_model=ApiEnvelope)
+def dashscope_callback(
+    payload: dict[str, Any],
+    authorization: str | None = Header(default=None),
+) -> ApiEnvelope:
+    """
+    DashScope 任务完成回调（可选，EMOJI_CALLBACK_ENABLED 开启时可用）
+
+    接收任务状态通知（DashScope 任务查询接口的响应格式，即 output.task_id，
+    也接受顶层 task_id），转发给 worker 立即查询该任务，而不是等到下一次轮询；
+    结果仍由 worker 查询、上传和落库，回调内容本身不作为任务结果。
+    本服务不会向 DashScope 注册回调，请求需要由另外部署的事件桥接转发过来；
+    任务完成仍以 worker 轮询为主，开启回调后轮询间隔放宽为 EMOJI_CALLBACK_FALLBACK_POLL_SECONDS。
+
+    请求路径: POST /api/v1/emoji/callback/dashscope
+
+    Args:
+        payload: 回调数据
+        authorization: 授权头（与 EMOJI_CALLBACK_SECRET 比较）
+
+    Returns:
+        ApiEnvelope: 接收确认响应
+
+    Raises:
+        AppError: 未开启时 404，授权失败 401，缺少 task_id 400，Redis 不可用 503（回调方重试）
+    """
+    if not settings.EMOJI_CALLBACK_ENABLED:
+        raise AppError(code=404103, message="Not found", status_code=404)
+    # 未配置密钥时拒绝所有请求（配置校验也不允许只开启回调不配置密钥）
+    secret = settings.EMOJI_CALLBACK_SECRET
+    if not secret or not _callback_authorized(authorization, secret):
+        raise AppError(code=401001, message="Unauthorized", status_code=401)
+
+    output = payload.get("output")
+    aliyun_task_id = (output if isinstance(output, dict) else payload).get("task_id")
+    if not aliyun_task_id:
+        raise AppError(code=400005, message="Missing task_id", status_code=400)
+    try:
+        task_events.publish_poll_hint(str(aliyun_task_id))
+    except RedisError as exc:
+        raise AppError(code=503101, message="Callback queue unavailable", status_code=503) from exc
+    return ApiEnvelope(data={"received": True})
+
+
 @router.get("/history", response_model=ApiEnvelope)
 def history(
     session: SessionDep,
     current_user: CurrentUser,
-    page: int = Query(default=1, ge=1),  # 页码，从 1 开始
+    page: int = Query(default=1, ge=1),  # 页码，从 1 开始（兼容旧客户端）
     page_size: int = Query(default=20, ge=1, le=100),  # 每页数量，1-100
+    cursor: str | None = Query(default=None),  # 上一页返回的 next_cursor，传入时忽略 page
+    with_count: bool = Query(default=True),  # 是否返回总数（读取 user_stats 计数器）
 ) -> ApiEnvelope:
     """
     获取表情生成历史（分页）
 
     查询当前登录用户的所有表情生成任务，按创建时间倒序排列。
 
-    请求路径: GET /api/v1/emoji/history?page=1&page_size=20
+    请求路径: GET /api/v1/emoji/history?page_size=20&cursor=...（或 ?page=1&page_size=20）
 
     Args:
         session: 数据库会话
         current_user: 当前登录用户
         page: 页码（从 1 开始）
         page_size: 每页数量（1-100）
+        cursor: 游标（上一页的 next_cursor）
+        with_count: 是否返回总数
 
     Returns:
         ApiEnvelope: 包含任务列表和总数的响应
     """
-    offset = (page - 1) * page_size  # 计算偏移量
-
-    count_stmt = (
-        select(func.count())
-        .select_from(EmojiTask)
-        .where(EmojiTask.user_id == current_user.id)
-    )
-    count = session.exec(count_stmt).one()
-
-    stmt = (
-        select(EmojiTask)
-        .where(EmojiTask.user_id == current_user.id)
-        .order_by(EmojiTask.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
+    tasks, next_cursor, count = paginate_by_user(
+        session,
+        EmojiTask,
+        user_id=current_user.id,
+        cursor=cursor,
+        page=page,
+        page_size=page_size,
+        with_count=with_count,
     )
-    tasks = session.exec(stmt).all()
 
     data = [
         EmojiTaskData(
@@ -287,7 +531,7 @@ def history(
         )
         for t in tasks
     ]
-    return ApiEnvelope(data=EmojiHistoryData(data=data, count=count))
+    return ApiEnvelope(data=EmojiHistoryData(data=data, count=count, next_cursor=next_cursor))
 
 
 @router.delete("/task/{task_id}", response_model=ApiEnvelope)
@@ -314,5 +558,7 @@ def delete_task(session: SessionDep, current_user: CurrentUser, task_id: int) ->
     if not task or task.user_id != current_user.id:
         raise AppError(code=404101, message="Task not found", status_code=404)
     session.delete(task)
+    crud.bump_user_stats(session=session, user_id=current_user.id, emoji_tasks=-1)
     session.commit()
+    task_events.forget_task(task_id)  # 删除状态快照，避免轮询继续返回已删除的任务
     return ApiEnvelope(data={"deleted": True})
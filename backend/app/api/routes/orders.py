@@ -14,10 +14,12 @@ import secrets  # 生成随机字符串
 import time  # 时间处理
 
 from fastapi import APIRouter, Query  # FastAPI 路由和查询参数
-from sqlmodel import func, select  # SQLModel 查询函数
+from sqlmodel import select  # SQLModel 查询函数
 
+from app import crud  # 数据库操作
 from app.api.deps import CurrentUser, SessionDep  # 依赖注入
 from app.api.errors import AppError  # 自定义异常
+from app.api.pagination import paginate_by_user  # 分页工具
 from app.api.schemas import ApiEnvelope, OrderCreateRequest, OrderData, OrdersData
 from app.enums import OrderStatus  # 订单状态枚举
 from app.models import Order  # 订单模型
@@ -83,6 +85,7 @@ def create_order(session: SessionDep, current_user: CurrentUser, body: OrderCrea
         transaction_id=None,
     )
     session.add(order)
+    crud.bump_user_stats(session=session, user_id=current_user.id, orders=1)
     session.commit()
     session.refresh(order)
     return ApiEnvelope(data=_to_order_data(order))
@@ -92,44 +95,40 @@ def create_order(session: SessionDep, current_user: CurrentUser, body: OrderCrea
 def list_orders(
     session: SessionDep,
     current_user: CurrentUser,
-    page: int = Query(default=1, ge=1),  # 页码，从 1 开始
+    page: int = Query(default=1, ge=1),  # 页码，从 1 开始（兼容旧客户端）
     page_size: int = Query(default=20, ge=1, le=100),  # 每页数量，1-100
+    cursor: str | None = Query(default=None),  # 上一页返回的 next_cursor，传入时忽略 page
+    with_count: bool = Query(default=True),  # 是否返回总数（读取 user_stats 计数器）
 ) -> ApiEnvelope:
     """
     获取订单列表（分页）
 
     查询当前用户的所有订单，按创建时间倒序排列。
 
-    请求路径: GET /api/v1/order/list?page=1&page_size=20
+    请求路径: GET /api/v1/order/list?page_size=20&cursor=...（或 ?page=1&page_size=20）
 
     Args:
         session: 数据库会话
         current_user: 当前登录用户
         page: 页码（从 1 开始）
         page_size: 每页数量（1-100）
+        cursor: 游标（上一页的 next_cursor）
+        with_count: 是否返回总数
 
     Returns:
         ApiEnvelope: 包含订单列表和总数的响应
     """
-    offset = (page - 1) * page_size  # 计算偏移量
-
-    count_stmt = (
-        select(func.count())
-        .select_from(Order)
-        .where(Order.user_id == current_user.id)
-    )
-    count = session.exec(count_stmt).one()
-
-    stmt = (
-        select(Order)
-        .where(Order.user_id == current_user.id)
-        .order_by(Order.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
+    rows, next_cursor, count = paginate_by_user(
+        session,
+        Order,
+        user_id=current_user.id,
+        cursor=cursor,
+        page=page,
+        page_size=page_size,
+        with_count=with_count,
     )
-    rows = session.exec(stmt).all()
     data = [_to_order_data(o) for o in rows]
-    return ApiEnvelope(data=OrdersData(data=data, count=count))
+    return ApiEnvelope(data=OrdersData(data=data, count=count, next_cursor=next_cursor))
 
 
 @router.get("/{order_no}", response_model=ApiEnvelope)
@@ -8,10 +8,15 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Query  # FastAPI 路由和查询参数
-from sqlmodel import func, select  # SQLModel 查询函数
 
 from app import crud  # 数据库操作
-from app.api.deps import CurrentUser, SessionDep  # 依赖注入
+from app.api.deps import (  # 依赖注入
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    CurrentUser,
+    SessionDep,
+)
+from app.api.pagination import paginate_by_user
 from app.api.schemas import (
     ApiEnvelope,
     PointsBalanceData,
@@ -24,65 +29,62 @@ router = APIRouter(prefix="/points", tags=["points"])
 
 
 @router.get("/balance", response_model=ApiEnvelope)
-def balance(session: SessionDep, current_user: CurrentUser) -> ApiEnvelope:
+async def balance(session: AsyncSessionDep, current_user: AsyncCurrentUser) -> ApiEnvelope:
     """
     获取积分余额
 
     查询当前登录用户的积分余额。
+    高频接口，使用异步会话运行在事件循环中，不占用线程池。
 
     请求路径: GET /api/v1/points/balance
 
     Args:
-        session: 数据库会话
+        session: 异步数据库会话
         current_user: 当前登录用户
 
     Returns:
         ApiEnvelope: 包含积分余额的响应
     """
-    points = crud.get_user_points(session=session, user_id=current_user.id)
-    return ApiEnvelope(data=PointsBalanceData(balance=points.balance))
+    balance = await crud.get_points_balance_async(session=session, user_id=current_user.id)
+    return ApiEnvelope(data=PointsBalanceData(balance=balance))
 
 
 @router.get("/transactions", response_model=ApiEnvelope)
 def transactions(
     session: SessionDep,
     current_user: CurrentUser,
-    page: int = Query(default=1, ge=1),  # 页码，从 1 开始
+    page: int = Query(default=1, ge=1),  # 页码，从 1 开始（兼容旧客户端）
     page_size: int = Query(default=20, ge=1, le=100),  # 每页数量，1-100
+    cursor: str | None = Query(default=None),  # 上一页返回的 next_cursor，传入时忽略 page
+    with_count: bool = Query(default=True),  # 是否返回总数（读取 user_stats 计数器）
 ) -> ApiEnvelope:
     """
     获取积分交易历史（分页）
 
     查询当前登录用户的所有积分变动记录，按时间倒序排列。
 
-    请求路径: GET /api/v1/points/transactions?page=1&page_size=20
+    请求路径: GET /api/v1/points/transactions?page_size=20&cursor=...（或 ?page=1&page_size=20）
 
     Args:
         session: 数据库会话
         current_user: 当前登录用户
         page: 页码（从 1 开始）
         page_size: 每页数量（1-100）
+        cursor: 游标（上一页的 next_cursor）
+        with_count: 是否返回总数
 
     Returns:
         ApiEnvelope: 包含交易记录列表和总数的响应
     """
-    offset = (page - 1) * page_size  # 计算偏移量
-
-    count_stmt = (
-        select(func.count())
-        .select_from(PointTransaction)
-        .where(PointTransaction.user_id == current_user.id)
+    rows, next_cursor, count = paginate_by_user(
+        session,
+        PointTransaction,
+        user_id=current_user.id,
+        cursor=cursor,
+        page=page,
+        page_size=page_size,
+        with_count=with_count,
     )
-    count = session.exec(count_stmt).one()
-
-    stmt = (
-        select(PointTransaction)
-        .where(PointTransaction.user_id == current_user.id)
-        .order_by(PointTransaction.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
-    )
-    rows = session.exec(stmt).all()
 
     data = [
         PointTransactionPublic(
@@ -97,5 +99,7 @@ def transactions(
         )
         for row in rows
     ]
-    return ApiEnvelope(data=PointsTransactionsData(data=data, count=count))
+    return ApiEnvelope(
+        data=PointsTransactionsData(data=data, count=count, next_cursor=next_cursor)
+    )
 
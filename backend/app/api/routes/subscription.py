@@ -37,6 +37,7 @@ from app.models import (
     User,
 )
 from app.services.config_service import get_config  # 配置服务
+from app.services.user_cache import invalidate_user  # 用户缓存失效
 
 router = APIRouter(prefix="/subscription", tags=["subscription"])
 
@@ -250,6 +251,7 @@ def webhook(
             transaction_id=transaction_id,
         )
         session.add(order)
+        crud.bump_user_stats(session=session, user_id=user_id, orders=1)
         session.commit()
 
         # 发放积分（通过 event_id + order_no 唯一性保证幂等性）
@@ -323,6 +325,7 @@ def webhook(
             user.updated_at = now
             session.add(user)
             session.commit()
+            invalidate_user(user_id)  # VIP 状态变化，清除用户缓存
 
         return ApiEnvelope(data={"received": True})
 
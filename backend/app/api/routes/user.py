@@ -13,6 +13,7 @@ from app import crud  # 数据库操作
 from app.api.deps import CurrentUser, SessionDep  # 依赖注入
 from app.api.schemas import ApiEnvelope, UserProfile, UserProfileUpdateRequest
 from app.models import utc_now  # UTC 时间工具
+from app.services.user_cache import invalidate_user  # 用户缓存失效
 
 router = APIRouter(prefix="/user", tags=["user"])
 
@@ -33,7 +34,7 @@ def profile(session: SessionDep, current_user: CurrentUser) -> ApiEnvelope:
     Returns:
         ApiEnvelope: 包含用户资料的响应
     """
-    points_row = crud.get_user_points(session=session, user_id=current_user.id)
+    points_balance = crud.get_points_balance(session=session, user_id=current_user.id)
     data = UserProfile(
         id=current_user.id,
         device_id=current_user.device_id,
@@ -41,7 +42,7 @@ def profile(session: SessionDep, current_user: CurrentUser) -> ApiEnvelope:
         is_vip=current_user.is_vip,
         vip_type=current_user.vip_type,
         vip_expire_time=current_user.vip_expire_time,
-        points_balance=points_row.balance,
+        points_balance=points_balance,
     )
     return ApiEnvelope(data=data)
 
@@ -80,8 +81,9 @@ def update_profile(
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    invalidate_user(current_user.id)  # 资料已变更，清除用户缓存
 
-    points_row = crud.get_user_points(session=session, user_id=current_user.id)
+    points_balance = crud.get_points_balance(session=session, user_id=current_user.id)
     data = UserProfile(
         id=current_user.id,
         device_id=current_user.device_id,
@@ -89,6 +91,6 @@ def update_profile(
         is_vip=current_user.is_vip,
         vip_type=current_user.vip_type,
         vip_expire_time=current_user.vip_expire_time,
-        points_balance=points_row.balance,
+        points_balance=points_balance,
     )
     return ApiEnvelope(data=data)
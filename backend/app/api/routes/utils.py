@@ -1,10 +1,15 @@
 """
 工具路由模块
 
-提供系统工具类的 API 端点，如健康检查等。
+提供系统工具类的 API 端点，如健康检查、连接池监控等。
 """
+from typing import Any
+
 from fastapi import APIRouter
 
+from app.api.deps import OpsTokenDep
+from app.core.db import async_engine, get_pool_stats
+
 router = APIRouter(prefix="/utils", tags=["utils"])
 
 
@@ -27,3 +32,24 @@ async def health_check() -> bool:
     - 容器编排系统（如 Kubernetes）的存活探针
     """
     return True
+
+
+@router.get("/db-pool/", dependencies=[OpsTokenDep])
+def db_pool() -> dict[str, Any]:
+    """
+    数据库连接池监控指标
+
+    分别返回同步引擎（engine）和异步引擎（async_engine）连接池的
+    当前状态（使用中/空闲/溢出连接数）和累计统计
+    （获取连接次数、溢出次数、超时次数、等待时间），供监控系统采集。
+    连接池频繁溢出、超时或等待时间上升时，应调大 DB_POOL_SIZE / DB_MAX_OVERFLOW
+    （或 DB_ASYNC_*），注意总连接数预算（见 config 中的说明）。
+
+    需要运维令牌：Authorization: Bearer <OPS_API_TOKEN>，未配置时拒绝访问。
+
+    请求路径: GET /api/v1/utils/db-pool/
+
+    Returns:
+        dict: 连接池指标
+    """
+    return {"engine": get_pool_stats(), "async_engine": get_pool_stats(async_engine)}
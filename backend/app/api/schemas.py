@@ -159,7 +159,8 @@ class PointsTransactionsData(BaseModel):
     返回积分交易历史列表和总数。
     """
     data: list[PointTransactionPublic]  # 交易记录列表
-    count: int  # 总记录数
+    count: int | None = None  # 总记录数（仅在请求时返回）
+    next_cursor: str | None = None  # 下一页游标，没有下一页时为 null
 
 
 class ConfigData(BaseModel):
@@ -190,6 +191,38 @@ class EmojiDetectData(BaseModel):
     raw: dict[str, Any] | None = None  # 原始检测数据（用于调试）
 
 
+class EmojiUploadUrlRequest(BaseModel):
+    """
+    申请直传 URL 请求模型
+
+    客户端提供文件名（用于校验扩展名）和 MIME 类型。
+    """
+    filename: str = Field(min_length=1, max_length=255)  # 原始文件名
+    content_type: str | None = Field(default=None, max_length=128)  # 文件 MIME 类型
+
+
+class EmojiUploadUrlData(BaseModel):
+    """
+    直传 URL 响应模型
+
+    客户端以 multipart/form-data 把 fields 和文件（字段名 file，放在最后）
+    POST 到 upload_url，直接上传到 OSS，上传完成后用 key 调用检测接口。
+    """
+    key: str  # OSS 对象键名
+    upload_url: str  # 上传 URL（存储桶域名）
+    method: str = "POST"  # 上传使用的 HTTP 方法
+    fields: dict[str, str] = {}  # 上传时必须携带的表单字段（含签名的 Policy）
+    expires_in: int  # 签名有效期（秒）
+    image_url: str  # 上传完成后的图片 URL
+
+
+class EmojiDetectUploadedRequest(BaseModel):
+    """
+    检测已直传图片请求模型
+    """
+    key: str = Field(min_length=1, max_length=1024)  # 申请直传 URL 时返回的 key
+
+
 class EmojiCreateRequest(BaseModel):
     """
     创建表情任务请求模型
@@ -224,7 +257,8 @@ class EmojiHistoryData(BaseModel):
     返回用户的表情生成历史。
     """
     data: list[EmojiTaskData]  # 任务列表
-    count: int  # 总记录数
+    count: int | None = None  # 总记录数（仅在请求时返回）
+    next_cursor: str | None = None  # 下一页游标，没有下一页时为 null
 
 
 class SubscriptionStatusData(BaseModel):
@@ -274,4 +308,5 @@ class OrdersData(BaseModel):
     返回用户的订单历史。
     """
     data: list[OrderData]  # 订单列表
-    count: int  # 总记录数
+    count: int | None = None  # 总记录数（仅在请求时返回）
+    next_cursor: str | None = None  # 下一页游标，没有下一页时为 null
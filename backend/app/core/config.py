@@ -117,6 +117,26 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # 数据库连接池配置（API 和 worker 各自独立的连接池，按进程、按引擎计算）
+    # 每个 API 进程有同步 engine 和 async_engine 两个连接池，单进程最多占用
+    #   (DB_POOL_SIZE + DB_MAX_OVERFLOW) + (DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW)
+    # 个连接（默认 10 + 10 = 20），乘以 API 进程数、再加上 worker 进程后，
+    # 总数必须低于数据库的 max_connections（需要预留迁移、运维连接）
+    DB_POOL_SIZE: int = 5  # 同步 engine 常驻连接数
+    DB_MAX_OVERFLOW: int = 5  # 同步 engine 突发时允许额外创建的连接数
+    DB_ASYNC_POOL_SIZE: int = 5  # async_engine 常驻连接数
+    DB_ASYNC_MAX_OVERFLOW: int = 5  # async_engine 突发时允许额外创建的连接数
+    DB_POOL_TIMEOUT_SECONDS: float = 10  # 连接池耗尽时等待空闲连接的最长时间（秒）
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # 连接最长存活时间（秒），避免被代理/防火墙静默断开
+    DB_POOL_PRE_PING: bool = True  # 取出连接前先检测是否可用
+    DB_CONNECT_TIMEOUT_SECONDS: int = 5  # 建立数据库连接的超时时间（秒）
+    DB_STATEMENT_TIMEOUT_MS: int = 30_000  # 服务端 statement_timeout（毫秒，0 表示不限制）
+    DB_POOL_SLOW_CHECKOUT_SECONDS: float = 1.0  # 获取连接等待超过该值时记录警告日志
+
+    # 运维接口（如 GET /utils/db-pool/）的访问令牌，通过 Authorization: Bearer <token> 传递
+    # 未配置时运维接口一律拒绝访问
+    OPS_API_TOKEN: str | None = None
+
     # SMTP 邮件服务器配置（用于发送邮件）
     SMTP_TLS: bool = True  # 是否使用 TLS
     SMTP_SSL: bool = False  # 是否使用 SSL
@@ -133,6 +153,19 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0  # Redis 数据库编号（0-15）
     REDIS_PASSWORD: str | None = None  # Redis 密码（可选）
 
+    # async 路由中阻塞调用（如 oss2 上传）的线程池上限，见 app.core.offload
+    OFFLOAD_MAX_THREADS: int = 64
+
+    # 用户缓存配置（get_current_user 的进程内 LRU + Redis 两级缓存）
+    USER_CACHE_ENABLED: bool = True  # 是否启用用户缓存
+    USER_CACHE_MAX_SIZE: int = 10_000  # 进程内 LRU 最大条目数
+    USER_CACHE_LOCAL_TTL_SECONDS: int = 10  # 进程内缓存过期时间（秒），决定跨进程最大陈旧时间
+    USER_CACHE_REDIS_TTL_SECONDS: int = 300  # Redis 缓存过期时间（秒）
+
+    # 积分余额缓存配置（Redis 写穿透，见 app.services.points_cache）
+    POINTS_CACHE_ENABLED: bool = True  # 是否启用余额缓存
+    POINTS_CACHE_TTL_SECONDS: int = 86_400  # Redis 缓存过期时间（秒），每次写入刷新
+
     # 阿里云 OSS（对象存储）配置
     OSS_ENDPOINT: str | None = None  # OSS 端点地址
     OSS_BUCKET: str | None = None  # OSS 存储桶名称
@@ -143,16 +176,79 @@ class Settings(BaseSettings):
     OSS_UPLOAD_EXPIRE_SECONDS: int = 60  # 上传 URL 过期时间（秒）
     OSS_OBJECT_ACL: str = "public-read"  # 对象访问权限（公开读）
     OSS_PUBLIC_BASE_URL: str | None = None  # OSS 公开访问的基础 URL
+    OSS_MULTIPART_PART_SIZE: int = 1024 * 1024  # 流式分片上传的分片大小（字节，OSS 最小 100KB）
+    OSS_MULTIPART_CONCURRENCY: int = 4  # 单个对象分片上传的并行分片数
 
     # 阿里云 DashScope（表情生成 API）配置
     ALIYUN_EMOJI_MOCK: bool = True  # 是否使用模拟模式（本地开发时）
     DASHSCOPE_BASE_URL: str = "https://dashscope.aliyuncs.com"  # API 基础 URL
     DASHSCOPE_API_KEY: str | None = None  # DashScope API 密钥
 
-    # 表情生成任务轮询配置
-    EMOJI_POLL_INTERVAL_SECONDS: int = 15  # 轮询间隔（秒）
+    # DashScope HTTP 传输配置（长连接连接池）
+    DASHSCOPE_TIMEOUT_SECONDS: float = 30  # 单次请求超时（秒）
+    DASHSCOPE_MAX_CONNECTIONS: int = 100  # 连接池最大连接数
+    DASHSCOPE_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 最大空闲 keep-alive 连接数
+    DASHSCOPE_KEEPALIVE_EXPIRY_SECONDS: float = 30  # 空闲连接保留时间（秒）
+    DASHSCOPE_HTTP2: bool = True  # 是否启用 HTTP/2（h2 由 httpx[http2] 依赖安装）
+    DASHSCOPE_MAX_RETRIES: int = 3  # 429/5xx/网络错误的最大重试次数
+    DASHSCOPE_RETRY_BACKOFF_SECONDS: float = 0.5  # 重试退避基数（秒，指数增长 + 随机抖动）
+    DASHSCOPE_RETRY_MAX_BACKOFF_SECONDS: float = 8  # 单次重试最大等待（秒）
+
+    # 表情生成任务轮询配置（自适应：开始时快速查询，之后按倍数退避，不超过最大间隔）
+    EMOJI_POLL_INITIAL_SECONDS: float = 2.0  # 创建远程任务后第一次查询前的等待（秒）
+    EMOJI_POLL_BACKOFF_FACTOR: float = 1.5  # 每次查询后间隔的增长倍数
+    EMOJI_POLL_INTERVAL_SECONDS: int = 15  # 最大轮询间隔（秒）
     EMOJI_POLL_TIMEOUT_SECONDS: int = 10 * 60  # 轮询超时时间（10 分钟）
 
+    # DashScope 任务完成回调（可选，见 POST /emoji/callback/dashscope）
+    # 本服务不会向 DashScope 注册回调：需要另外部署事件桥接（例如把 DashScope 的任务
+    # 事件转发到回调接口），否则不要开启。任务完成仍以 worker 轮询为主，回调只是提示
+    # worker 提前查询；开启后轮询间隔放宽为 EMOJI_CALLBACK_FALLBACK_POLL_SECONDS
+    EMOJI_CALLBACK_ENABLED: bool = False  # 仅在已部署外部事件桥接时开启
+    EMOJI_CALLBACK_SECRET: str | None = None  # 回调请求 Authorization 头的校验值（开启回调时必填）
+    EMOJI_CALLBACK_FALLBACK_POLL_SECONDS: int = 60  # 回调模式下的兜底轮询间隔（秒）
+
+    # 表情生成 worker 配置
+    # sync: 逐条阻塞处理；async: asyncio 并发处理多个任务（共享 httpx.AsyncClient）
+    EMOJI_WORKER_MODE: Literal["sync", "async"] = "sync"
+    # async 模式下单进程同时处理的最大任务数，worker 的线程池（DB / OSS 操作）按此大小创建
+    EMOJI_WORKER_CONCURRENCY: int = 200
+    EMOJI_WORKER_PROCESSES: int = 2  # worker/supervisor.py 在单机上启动的 worker 进程数
+    EMOJI_WORKER_METRICS_INTERVAL_SECONDS: int = 15  # 队列指标采集和死消费者清理的间隔（秒）
+    EMOJI_WORKER_DEAD_CONSUMER_SECONDS: int = 60 * 60  # 消费者空闲超过该时间且无待确认消息时删除（秒）
+
+    # worker 快速路径（可选）：队列消息携带任务数据，worker 不再读库，状态变更批量写入
+    EMOJI_WORKER_FAST_PATH: bool = False  # API 和 worker 需同时开启才生效，单独开启任一方都安全
+    EMOJI_STATUS_BATCH_SIZE: int = 200  # 累计到该数量的任务时立即批量写入
+    EMOJI_STATUS_FLUSH_INTERVAL_SECONDS: float = 0.2  # 批量写入状态的最长间隔（秒）
+
+    # 表情任务队列保留策略（见 worker/stream_janitor.py）
+    EMOJI_STREAM_MAXLEN: int = 100_000  # XADD 时的近似长度上限（兜底，需远大于正常积压量）
+    EMOJI_STREAM_RETENTION_SECONDS: int = 24 * 60 * 60  # 已确认消息的保留时间（秒），之后被裁剪
+    EMOJI_DEAD_LETTER_MAXLEN: int = 10_000  # 死信队列的近似长度上限
+
+    # 表情任务消息恢复配置（XAUTOCLAIM 接管失联消费者的待确认消息，见 worker/reclaimer.py）
+    EMOJI_RECLAIM_INTERVAL_SECONDS: float = 5  # 每个 worker 进程执行一次恢复的间隔（秒）
+    EMOJI_RECLAIM_MIN_IDLE_SECONDS: int = 60  # 消息空闲超过该时间才会被接管（秒）
+    EMOJI_RECLAIM_BATCH_SIZE: int = 100  # 每次最多接管的消息数
+    EMOJI_RECLAIM_MAX_DELIVERIES: int = 5  # 投递次数超过该值的消息移入死信队列，任务标记为失败
+
+    # 任务状态推送配置（SSE，见 GET /emoji/task/{task_id}/events）
+    EMOJI_EVENTS_KEEPALIVE_SECONDS: int = 15  # 无事件时发送心跳注释的间隔（秒）
+    EMOJI_EVENTS_MAX_SECONDS: int = 10 * 60  # 单个连接最长保持时间（秒），到期后客户端重连
+    EMOJI_TASK_CACHE_TTL_SECONDS: int = 60 * 60  # 任务状态快照在 Redis 中的过期时间（秒）
+
+    # 发件箱 relay 配置（把 outbox_messages 批量发布到 Redis Streams）
+    OUTBOX_RELAY_IN_WORKER: bool = True  # 是否在 emoji worker 进程内运行 relay 线程
+    OUTBOX_RELAY_BATCH_SIZE: int = 100  # 每批最多发布的消息数
+    OUTBOX_RELAY_INTERVAL_SECONDS: float = 0.2  # 发件箱为空时的轮询间隔（秒）
+
+    # VIP 周积分奖励任务配置
+    WEEKLY_REWARD_CHUNK_SIZE: int = 5000  # 每个分块（一个事务）处理的用户数
+    WEEKLY_REWARD_SHARDS: int = 16  # 按 user_id 哈希分片的数量（同一周内不要修改）
+    WEEKLY_REWARD_PROCESSES: int = 4  # 单机并行处理分片的进程数
+    WEEKLY_REWARD_SHARD_LEASE_SECONDS: int = 300  # 分片租约时间（秒），每完成一个分块续期
+
     # RevenueCat 配置（iOS/Android 订阅管理）
     REVENUECAT_WEBHOOK_SECRET: str | None = None  # Webhook 验证密钥
 
@@ -195,6 +291,9 @@ class Settings(BaseSettings):
         """
         self._check_default_secret("SECRET_KEY", self.SECRET_KEY)
         self._check_default_secret("POSTGRES_PASSWORD", self.POSTGRES_PASSWORD)
+        # 回调接口可以修改任意任务的轮询节奏，没有密钥时不允许开启
+        if self.EMOJI_CALLBACK_ENABLED and not self.EMOJI_CALLBACK_SECRET:
+            raise ValueError("EMOJI_CALLBACK_ENABLED requires EMOJI_CALLBACK_SECRET to be set.")
 
         return self
 
@@ -2,19 +2,154 @@
 数据库连接模块
 
 管理数据库引擎和会话的创建。
-使用 SQLModel 的 create_engine 创建数据库连接池。
+使用 SQLModel 的 create_engine 创建数据库连接池，
+并为 async 路由提供基于 psycopg 异步驱动的 async_engine（两者各自独立的连接池，
+大小分别由 DB_POOL_SIZE / DB_MAX_OVERFLOW 和 DB_ASYNC_POOL_SIZE / DB_ASYNC_MAX_OVERFLOW 控制，
+单进程的连接总数是两者之和）。
+
+连接池参数（大小、溢出、回收、预检测、超时、服务端 statement_timeout）
+全部通过 Settings 的 DB_* 配置项调整。连接池带有监控统计
+（获取连接等待时间、使用中连接数、溢出/超时次数），见 get_pool_stats。
 
 重要提示：
 - 数据库表结构通过 Alembic 迁移管理，不要在这里创建表
 - 确保在使用前导入所有模型（app.models），否则关系可能无法正确初始化
 """
+import logging  # 日志记录
+import time  # 计时
+from threading import Lock  # 线程锁
+from typing import Any  # 任意类型
+
+from sqlalchemy.engine import Engine  # 引擎类型
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError  # 连接池等待超时
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine  # 异步引擎
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool  # 连接池实现
 from sqlmodel import Session, create_engine  # SQLModel 的数据库工具
 
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    带监控统计的连接池
+
+    在 QueuePool 获取连接的位置计时，累计：
+    - checkouts: 获取连接总次数
+    - overflow_checkouts: 获取到溢出连接（超出 pool_size）的次数
+    - timeouts: 等待超时（连接池耗尽）的次数
+    - wait_seconds_total / wait_seconds_max: 获取连接的等待时间
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            logger.warning("db pool exhausted: %s", self.status())
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            if self.overflow() > 0:
+                self.overflow_checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        if waited >= settings.DB_POOL_SLOW_CHECKOUT_SECONDS:
+            logger.warning("slow db pool checkout: %.3fs %s", waited, self.status())
+        return conn
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """带监控统计的异步连接池（用于 async_engine）"""
+
+
+def _engine_kwargs(
+    poolclass: type[QueuePool] = InstrumentedQueuePool,
+    *,
+    pool_size: int | None = None,
+    max_overflow: int | None = None,
+) -> dict[str, Any]:
+    """
+    根据配置构建 create_engine 参数
+
+    pool_size / max_overflow 默认使用同步 engine 的 DB_POOL_SIZE / DB_MAX_OVERFLOW，
+    async_engine 传入 DB_ASYNC_* 单独设置（两个连接池的上限是分别计算的）。
+
+    statement_timeout 通过 libpq 的 options 参数在每个连接上设置，
+    单条 SQL 超时后由服务端取消，不会无限占用连接。
+    """
+    connect_args: dict[str, Any] = {"connect_timeout": settings.DB_CONNECT_TIMEOUT_SECONDS}
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE if pool_size is None else pool_size,
+        "max_overflow": settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
 # 创建数据库引擎（连接池）
 # create_engine 会创建一个连接池，自动管理数据库连接
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **_engine_kwargs())
+
+# 异步引擎：postgresql+psycopg 同时支持同步和异步，不需要额外的驱动
+# 只创建连接池，不会在导入时连接数据库
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    **_engine_kwargs(
+        InstrumentedAsyncQueuePool,
+        pool_size=settings.DB_ASYNC_POOL_SIZE,
+        max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    ),
+)
+
+
+def get_pool_stats(target: Engine | AsyncEngine | None = None) -> dict[str, Any]:
+    """
+    获取连接池监控指标
+
+    Args:
+        target: 数据库引擎（默认使用全局 engine，也可以传入 async_engine）
+
+    Returns:
+        dict: 连接池当前状态和累计统计，非 InstrumentedQueuePool 时只返回 pool 类型
+    """
+    pool = (target or engine).pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {"pool": type(pool).__name__}
+    with pool._stats_lock:
+        checkouts = pool.checkouts
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),  # 使用中的连接数
+            "checked_in": pool.checkedin(),  # 空闲连接数
+            "overflow": max(0, pool.overflow()),  # 当前溢出连接数
+            "checkouts": checkouts,
+            "overflow_checkouts": pool.overflow_checkouts,
+            "timeouts": pool.timeouts,
+            "wait_seconds_total": round(pool.wait_seconds_total, 6),
+            "wait_seconds_max": round(pool.wait_seconds_max, 6),
+            "wait_seconds_avg": round(pool.wait_seconds_total / checkouts, 6) if checkouts else 0.0,
+        }
 
 
 # 重要提示：
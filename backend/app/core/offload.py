@@ -0,0 +1,58 @@
+"""
+阻塞调用卸载模块
+
+async 路由中不能直接调用同步阻塞的 SDK（如 oss2），否则会卡住整个事件循环，
+导致同一进程内的其他请求全部排队等待。
+
+run_blocking 把阻塞调用放到线程中执行，并使用独立的容量限制器（CapacityLimiter）：
+- 不占用 Starlette 默认线程池（同步路由使用的 40 个线程）
+- 限制同时进行的阻塞 I/O 数量（如并发上传到 OSS 的数量）
+"""
+from __future__ import annotations
+
+import functools  # 绑定调用参数
+from collections.abc import Callable  # 可调用类型
+from typing import Any, TypeVar  # 类型注解
+
+import anyio.to_thread  # 在线程中运行同步函数
+from anyio import CapacityLimiter  # 线程并发数限制器
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# 全局限制器（懒加载，读取配置后创建）
+_limiter: CapacityLimiter | None = None
+
+
+def _get_limiter() -> CapacityLimiter:
+    """
+    获取阻塞调用的全局容量限制器
+
+    Returns:
+        CapacityLimiter: 最多允许 OFFLOAD_MAX_THREADS 个阻塞调用同时执行
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = CapacityLimiter(settings.OFFLOAD_MAX_THREADS)
+    return _limiter
+
+
+async def run_blocking(func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """
+    在有界线程池中执行阻塞函数
+
+    Args:
+        func: 同步阻塞函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        函数的返回值
+
+    使用示例：
+        image_url = await run_blocking(upload_file, file=f, key=key)
+    """
+    return await anyio.to_thread.run_sync(
+        functools.partial(func, *args, **kwargs), limiter=_get_limiter()
+    )
@@ -15,6 +15,7 @@ from __future__ import annotations
 from functools import lru_cache  # 缓存装饰器，用于实现单例模式
 
 import redis  # Redis 客户端库
+import redis.asyncio as aioredis  # Redis 异步客户端（用于 asyncio worker）
 
 from app.core.config import settings
 
@@ -42,3 +43,22 @@ def get_redis() -> redis.Redis:
         decode_responses=True,  # 自动解码响应为字符串（而不是字节）
     )
 
+
+@lru_cache(maxsize=1)
+def get_async_redis() -> aioredis.Redis:
+    """
+    获取 Redis 异步客户端实例（单例模式）
+
+    供 asyncio 模式的 worker 使用，配置与 get_redis 相同。
+    注意：异步客户端绑定在首次使用它的事件循环上，只应在单个事件循环内使用。
+
+    Returns:
+        Redis 异步客户端实例
+    """
+    return aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True,
+    )
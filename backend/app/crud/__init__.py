@@ -1,6 +1,16 @@
 """CRUD 操作模块"""
 from .emoji import create_task as create_emoji_task
-from .points import change_points, get_user_points
+from .emoji import create_task_async as create_emoji_task_async
+from .emoji import get_user_task_async as get_user_emoji_task_async
+from .points import (
+    change_points,
+    change_points_async,
+    get_points_balance,
+    get_points_balance_async,
+    get_user_points,
+    get_user_points_async,
+)
+from .stats import bump_user_stats, bump_user_stats_async, get_user_count
 from .user import (
     create as create_user,
 )
@@ -10,16 +20,29 @@ from .user import (
 from .user import (
     get_or_create_by_device_id as get_or_create_user_by_device_id,
 )
+from .user import (
+    get_or_create_by_device_id_async as get_or_create_user_by_device_id_async,
+)
 from .user import (
     update_vip as update_user_vip,
 )
 
 __all__ = [
     "create_emoji_task",
+    "create_emoji_task_async",
+    "get_user_emoji_task_async",
     "change_points",
+    "change_points_async",
+    "get_points_balance",
+    "get_points_balance_async",
     "get_user_points",
+    "get_user_points_async",
+    "bump_user_stats",
+    "bump_user_stats_async",
+    "get_user_count",
     "create_user",
     "get_user_by_device_id",
     "get_or_create_user_by_device_id",
+    "get_or_create_user_by_device_id_async",
     "update_user_vip",
 ]
@@ -1,9 +1,14 @@
 """表情任务 CRUD 操作"""
+from typing import Any
+
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.enums import EmojiTaskStatus
 from app.models import EmojiTask
 
+from .stats import bump_user_stats, bump_user_stats_async
+
 
 def create_task(
     *,
@@ -14,8 +19,42 @@ def create_task(
     detect_result: dict | None,
     points_cost: int,
     style_name: str | None = None,
+    commit: bool = True,
+) -> EmojiTask:
+    """
+    创建表情生成任务
+
+    commit=False 时只加入会话不提交（id、created_at 都在客户端生成，无需刷新），
+    由调用方和积分扣减、发件箱消息一起提交。
+    """
+    task = EmojiTask(
+        user_id=user_id,
+        driven_id=driven_id,
+        style_name=style_name,
+        source_image_url=image_url,
+        detect_result=detect_result,
+        status=EmojiTaskStatus.pending,
+        points_cost=points_cost,
+    )
+    session.add(task)
+    bump_user_stats(session=session, user_id=user_id, emoji_tasks=1)
+    if commit:
+        session.commit()
+        session.refresh(task)
+    return task
+
+
+async def create_task_async(
+    *,
+    session: AsyncSession,
+    user_id: int,
+    image_url: str,
+    driven_id: str,
+    detect_result: dict[str, Any] | None,
+    points_cost: int,
+    style_name: str | None = None,
 ) -> EmojiTask:
-    """创建表情生成任务"""
+    """创建表情生成任务（async 版本）"""
     task = EmojiTask(
         user_id=user_id,
         driven_id=driven_id,
@@ -26,6 +65,15 @@ def create_task(
         points_cost=points_cost,
     )
     session.add(task)
-    session.commit()
-    session.refresh(task)
+    await bump_user_stats_async(session=session, user_id=user_id, emoji_tasks=1)
+    await session.commit()
+    await session.refresh(task)
+    return task
+
+
+async def get_user_task_async(*, session: AsyncSession, user_id: int, task_id: int) -> EmojiTask | None:
+    """查询属于指定用户的表情任务，不存在或不属于该用户时返回 None（async 版本）"""
+    task = await session.get(EmojiTask, task_id)
+    if not task or task.user_id != user_id:
+        return None
     return task
@@ -1,9 +1,22 @@
 """积分 CRUD 操作"""
-from sqlmodel import Session, select
+from typing import Any
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, insert, literal, update
+from sqlalchemy import select as sa_select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.sql.base import Executable
+from sqlmodel import Session, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api.errors import AppError
+from app.core.snowflake import generate_id
 from app.enums import PointTransactionType
-from app.models import PointTransaction, UserPoints, utc_now
+from app.models import PointTransaction, UserPoints, UserStats, utc_now
+from app.services import points_cache
+
+from .stats import bump_user_stats, bump_user_stats_async, seed_counts
 
 
 def get_user_points(*, session: Session, user_id: int, for_update: bool = False) -> UserPoints:
@@ -20,6 +33,164 @@ def get_user_points(*, session: Session, user_id: int, for_update: bool = False)
     return points
 
 
+def get_points_balance(*, session: Session, user_id: int) -> int:
+    """
+    读取用户积分余额（只读，优先使用 Redis 余额缓存）
+
+    缓存未命中时查询数据库并按版本号回填缓存。
+    与 get_user_points 不同，账户不存在时返回 0 而不创建，读路径不写数据库
+    （账户会在第一次 change_points 时创建）。
+    """
+    cached = points_cache.get_cached_balance(user_id)
+    if cached is not None:
+        return cached
+    row = session.exec(
+        select(UserPoints.balance, UserPoints.version).where(UserPoints.user_id == user_id)
+    ).first()
+    if row is None:
+        return 0
+    balance, version = row
+    points_cache.store_balance(user_id, balance, version)
+    return balance
+
+
+def _debit_statements(
+    *,
+    dialect: str,
+    user_id: int,
+    delta: int,
+    tx_type: PointTransactionType,
+    task_type: str | None,
+    order_no: str | None,
+    reward_week: str | None,
+) -> tuple[Executable, PointTransaction | None]:
+    """
+    构建积分变更语句
+
+    条件更新 UPDATE ... SET balance = balance + :d WHERE balance + :d >= 0 RETURNING，
+    余额不足或账户不存在时不更新任何行。
+
+    PostgreSQL：更新、流水插入和流水计数合并为一条 CTE 语句：
+        WITH upd AS (UPDATE user_points ... RETURNING ...),
+             ins AS (INSERT INTO point_transactions ... SELECT ... FROM upd),
+             stats AS (INSERT INTO user_stats ... SELECT count(*) ... FROM upd ON CONFLICT DO UPDATE)
+        SELECT * FROM upd
+
+    其他数据库（测试用 SQLite 不支持 CTE 中的 DML）：返回条件更新语句和待插入的流水，
+    调用方在同一事务内根据更新结果插入流水并增加计数。
+
+    Returns:
+        (待执行的语句, 需要调用方插入的流水；PostgreSQL 时为 None)
+    """
+    now = utc_now()
+    upd = (
+        update(UserPoints)
+        .where(col(UserPoints.user_id) == user_id, col(UserPoints.balance) + delta >= 0)
+        .values(balance=UserPoints.balance + delta, version=UserPoints.version + 1, updated_at=now)
+        .returning(
+            col(UserPoints.id),
+            col(UserPoints.user_id),
+            col(UserPoints.balance),
+            col(UserPoints.version),
+            col(UserPoints.updated_at),
+        )
+    )
+    tx = PointTransaction(
+        user_id=user_id,
+        type=tx_type,
+        amount=delta,
+        balance_after=0,  # 由更新结果填充
+        task_type=task_type,
+        order_no=order_no,
+        reward_week=reward_week,
+        created_at=now,
+    )
+    if dialect != "postgresql":
+        return upd, tx
+
+    upd_cte = upd.cte("upd")
+    ins = insert(PointTransaction).from_select(
+        [
+            "id",
+            "user_id",
+            "type",
+            "amount",
+            "balance_after",
+            "task_type",
+            "order_no",
+            "reward_week",
+            "created_at",
+        ],
+        sa_select(
+            literal(tx.id, BigInteger),
+            upd_cte.c.user_id,
+            literal(tx_type.value, String),
+            literal(delta, Integer),
+            upd_cte.c.balance,
+            literal(task_type, String),
+            literal(order_no, String),
+            literal(reward_week, String),
+            literal(now, DateTime(timezone=True)),
+        ),
+    )
+    # 计数器：已有行只做主键更新（stats）；行不存在时才按实际行数创建（stats_seed），
+    # 同一语句中插入的流水对 count(*) 不可见，因此 + 1。
+    # 两个 CTE 看到同一快照，同一用户只会走其中一个，count(*) 也只在行不存在时执行
+    stats = (
+        update(UserStats)
+        .where(col(UserStats.user_id) == upd_cte.c.user_id)
+        .values(point_transactions=UserStats.point_transactions + 1, updated_at=now)
+    )
+    seeds = seed_counts(upd_cte.c.user_id)
+    seeds["point_transactions"] = seeds["point_transactions"] + 1
+    existing = sa_select(col(UserStats.user_id)).where(col(UserStats.user_id) == upd_cte.c.user_id)
+    stats_seed = (
+        pg_insert(UserStats)
+        .from_select(
+            ["user_id", *seeds, "updated_at"],
+            sa_select(upd_cte.c.user_id, *seeds.values(), literal(now, DateTime(timezone=True)))
+            .where(~existing.exists()),
+        )
+        .on_conflict_do_update(
+            index_elements=[col(UserStats.user_id)],
+            set_={"point_transactions": col(UserStats.point_transactions) + 1, "updated_at": now},
+        )
+    )
+    return (
+        sa_select(upd_cte)
+        .add_cte(ins.cte("ins"))
+        .add_cte(stats.cte("stats"))
+        .add_cte(stats_seed.cte("stats_seed")),
+        None,
+    )
+
+
+def _create_account_statement(*, dialect: str, user_id: int) -> Executable:
+    """
+    构建创建积分账户的语句：INSERT ... ON CONFLICT (user_id) DO NOTHING
+
+    只执行不提交，供 change_points 在账户不存在时使用，保持 commit=False 的事务语义
+    （调用方未提交的写入不会被提前提交）；并发创建同一账户时不会报唯一约束错误。
+    """
+    ins = pg_insert(UserPoints) if dialect == "postgresql" else sqlite_insert(UserPoints)
+    return ins.values(
+        id=generate_id(), user_id=user_id, balance=0, version=0, updated_at=utc_now()
+    ).on_conflict_do_nothing(index_elements=[col(UserPoints.user_id)])
+
+
+def _points_from_row(row: Any) -> UserPoints:
+    """把 RETURNING 结果转换为 UserPoints（游离态，不再额外查询数据库）"""
+    points = UserPoints(
+        id=row.id,
+        user_id=row.user_id,
+        balance=row.balance,
+        version=row.version,
+        updated_at=row.updated_at,
+    )
+    make_transient_to_detached(points)
+    return points
+
+
 def change_points(
     *,
     session: Session,
@@ -29,28 +200,147 @@ def change_points(
     task_type: str | None = None,
     order_no: str | None = None,
     reward_week: str | None = None,
+    commit: bool = True,
 ) -> UserPoints:
-    """变更用户积分并记录交易历史"""
-    points = get_user_points(session=session, user_id=user_id, for_update=True)
-    new_balance = points.balance + delta
-    if new_balance < 0:
-        raise AppError(code=402001, message="Insufficient points", status_code=400)
+    """
+    变更用户积分并记录交易历史
 
-    points.balance = new_balance
-    points.updated_at = utc_now()
+    PostgreSQL 上余额的条件更新和流水插入是一条语句（见 _debit_statements），
+    不再需要 SELECT ... FOR UPDATE + ORM 往返，行锁持有时间缩短到单条语句。
 
-    tx = PointTransaction(
+    commit=False 时不提交，由调用方把积分变更和其他写入放在同一个事务中提交。
+    新余额在事务提交后写入 Redis 余额缓存（见 points_cache.store_after_commit）。
+
+    Raises:
+        AppError: 余额不足时抛出 402001
+    """
+    dialect = session.get_bind().dialect.name
+    stmt, tx = _debit_statements(
+        dialect=dialect,
         user_id=user_id,
-        type=tx_type,
-        amount=delta,
-        balance_after=new_balance,
+        delta=delta,
+        tx_type=tx_type,
         task_type=task_type,
         order_no=order_no,
         reward_week=reward_week,
     )
+    row = session.exec(stmt, execution_options={"synchronize_session": False}).first()  # type: ignore[call-overload]
+    if row is None:
+        exists = session.exec(select(UserPoints.id).where(UserPoints.user_id == user_id)).first()
+        if exists is not None:
+            raise AppError(code=402001, message="Insufficient points", status_code=400)
+        # 积分账户不存在（历史数据）：在当前事务中创建账户（不提交）再重试一次
+        session.exec(_create_account_statement(dialect=dialect, user_id=user_id))  # type: ignore[call-overload]
+        return change_points(
+            session=session,
+            user_id=user_id,
+            delta=delta,
+            tx_type=tx_type,
+            task_type=task_type,
+            order_no=order_no,
+            reward_week=reward_week,
+            commit=commit,
+        )
+    if tx is not None:
+        tx.balance_after = row.balance
+        session.add(tx)
+        bump_user_stats(session=session, user_id=user_id, point_transactions=1)
+    points = _points_from_row(row)
+    points_cache.store_after_commit(session, points)
+    if commit:
+        session.commit()
+    return points
+
+
+async def get_user_points_async(
+    *, session: AsyncSession, user_id: int, for_update: bool = False
+) -> UserPoints:
+    """获取用户积分账户，不存在则创建（async 版本）"""
+    stmt = select(UserPoints).where(UserPoints.user_id == user_id)
+    if for_update:
+        stmt = stmt.with_for_update()
+    points = (await session.exec(stmt)).first()
+    if not points:
+        points = UserPoints(user_id=user_id, balance=0)
+        session.add(points)
+        await session.commit()
+        await session.refresh(points)
+    return points
 
-    session.add(points)
-    session.add(tx)
-    session.commit()
-    session.refresh(points)
+
+async def get_points_balance_async(*, session: AsyncSession, user_id: int) -> int:
+    """读取用户积分余额（async 版本，行为同 get_points_balance）"""
+    cached = await points_cache.get_cached_balance_async(user_id)
+    if cached is not None:
+        return cached
+    row = (
+        await session.exec(
+            select(UserPoints.balance, UserPoints.version).where(UserPoints.user_id == user_id)
+        )
+    ).first()
+    if row is None:
+        return 0
+    balance, version = row
+    await points_cache.store_balance_async(user_id, balance, version)
+    return balance
+
+
+async def change_points_async(
+    *,
+    session: AsyncSession,
+    user_id: int,
+    delta: int,
+    tx_type: PointTransactionType,
+    task_type: str | None = None,
+    order_no: str | None = None,
+    reward_week: str | None = None,
+    commit: bool = True,
+) -> UserPoints:
+    """
+    变更用户积分并记录交易历史（async 版本，语句和 commit 参数同 change_points）
+
+    Raises:
+        AppError: 余额不足时抛出 402001
+    """
+    dialect = session.bind.dialect.name
+    stmt, tx = _debit_statements(
+        dialect=dialect,
+        user_id=user_id,
+        delta=delta,
+        tx_type=tx_type,
+        task_type=task_type,
+        order_no=order_no,
+        reward_week=reward_week,
+    )
+    result = await session.exec(stmt, execution_options={"synchronize_session": False})  # type: ignore[call-overload]
+    row = result.first()
+    if row is None:
+        exists = (
+            await session.exec(select(UserPoints.id).where(UserPoints.user_id == user_id))
+        ).first()
+        if exists is not None:
+            raise AppError(code=402001, message="Insufficient points", status_code=400)
+        # 积分账户不存在（历史数据）：在当前事务中创建账户（不提交）再重试一次
+        await session.exec(_create_account_statement(dialect=dialect, user_id=user_id))  # type: ignore[call-overload]
+        return await change_points_async(
+            session=session,
+            user_id=user_id,
+            delta=delta,
+            tx_type=tx_type,
+            task_type=task_type,
+            order_no=order_no,
+            reward_week=reward_week,
+            commit=commit,
+        )
+    if tx is not None:
+        tx.balance_after = row.balance
+        session.add(tx)
+        await bump_user_stats_async(session=session, user_id=user_id, point_transactions=1)
+    points = _points_from_row(row)
+    if commit:
+        await session.commit()
+        # 提交后用异步客户端写入缓存，不在事件循环中执行阻塞的 Redis 调用
+        await points_cache.store_balance_async(points.user_id, points.balance, points.version)
+    else:
+        points_cache.store_after_commit_async(session, points)
     return points
@@ -0,0 +1,140 @@
+"""用户计数器 CRUD 操作"""
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import DateTime, literal, true, update
+from sqlalchemy import select as sa_select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import EmojiTask, Order, PointTransaction, UserStats, utc_now
+
+# 被计数的表模型 -> user_stats 中对应的列
+COUNTED_COLUMNS: dict[type, str] = {
+    EmojiTask: "emoji_tasks",
+    PointTransaction: "point_transactions",
+    Order: "orders",
+}
+
+
+def _deltas(**counts: int) -> dict[str, int]:
+    """去掉为 0 的增量"""
+    return {k: v for k, v in counts.items() if v}
+
+
+def seed_counts(user_id: Any) -> dict[str, Any]:
+    """
+    计数器行不存在时的初始值：各表的实际行数（与迁移中的回填查询一致）
+
+    Args:
+        user_id: 用户 ID（常量或 SQL 表达式，如 CTE 的列）
+
+    Returns:
+        dict: user_stats 列名 -> count(*) 标量子查询
+    """
+    seeds: dict[str, Any] = {}
+    for model, column in COUNTED_COLUMNS.items():
+        m: Any = model
+        seeds[column] = (
+            sa_select(func.count()).select_from(m).where(m.user_id == user_id).scalar_subquery()
+        )
+    return seeds
+
+
+def _bump_statement(user_id: int, deltas: dict[str, int], now: datetime) -> Any:
+    """
+    构建计数器增减语句：UPDATE user_stats SET col = col + :delta WHERE user_id = :uid
+
+    常规路径只有一次主键更新，不做任何 count(*)。
+    """
+    return (
+        update(UserStats)
+        .where(col(UserStats.user_id) == user_id)
+        .values(**{k: getattr(UserStats, k) + v for k, v in deltas.items()}, updated_at=now)
+    )
+
+
+def _seed_statement(dialect: str, user_id: int, deltas: dict[str, int], now: datetime) -> Any:
+    """
+    构建创建计数器行的语句（_bump_statement 没有更新到行时使用）
+
+    INSERT INTO user_stats ... SELECT count(*) ... ON CONFLICT (user_id) DO UPDATE SET col = col + :delta。
+    行不存在时（例如迁移回填之后才出现的用户）以实际行数创建，而不是以增量创建，
+    否则计数会一直偏小（删除时甚至是 -1），get_user_count 也不会再回退到 count(*) 纠正。
+    调用方必须先 flush 被计数的写入，count(*) 才包含这次变更；
+    并发事务抢先创建了行时（它的 count(*) 看不到本事务的写入），改为加上增量。
+    """
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    seeds = seed_counts(user_id)
+    # SQLite 的 INSERT ... SELECT ... ON CONFLICT 需要 WHERE 子句避免语法歧义
+    stmt = insert(UserStats).from_select(
+        ["user_id", *seeds, "updated_at"],
+        sa_select(
+            literal(user_id), *seeds.values(), literal(now, DateTime(timezone=True))
+        ).where(true()),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[col(UserStats.user_id)],
+        set_={**{k: getattr(UserStats, k) + v for k, v in deltas.items()}, "updated_at": now},
+    )
+
+
+def bump_user_stats(
+    *,
+    session: Session,
+    user_id: int,
+    emoji_tasks: int = 0,
+    point_transactions: int = 0,
+    orders: int = 0,
+) -> None:
+    """
+    增减用户计数器（不提交）
+
+    必须和被计数的数据写入放在同一个事务中，由调用方提交。
+    计数器行不存在时先 flush 会话中待写入的数据，再按包含这次变更的实际行数创建。
+    """
+    deltas = _deltas(emoji_tasks=emoji_tasks, point_transactions=point_transactions, orders=orders)
+    if not deltas:
+        return
+    now = utc_now()
+    if session.exec(_bump_statement(user_id, deltas, now)).rowcount:
+        return
+    session.flush()
+    session.exec(_seed_statement(session.get_bind().dialect.name, user_id, deltas, now))
+
+
+async def bump_user_stats_async(
+    *,
+    session: AsyncSession,
+    user_id: int,
+    emoji_tasks: int = 0,
+    point_transactions: int = 0,
+    orders: int = 0,
+) -> None:
+    """增减用户计数器（async 版本，不提交）"""
+    deltas = _deltas(emoji_tasks=emoji_tasks, point_transactions=point_transactions, orders=orders)
+    if not deltas:
+        return
+    now = utc_now()
+    if (await session.exec(_bump_statement(user_id, deltas, now))).rowcount:
+        return
+    await session.flush()
+    await session.exec(_seed_statement(session.bind.dialect.name, user_id, deltas, now))
+
+
+def get_user_count(*, session: Session, user_id: int, model: type) -> int:
+    """
+    读取用户某类数据的总数（主键查询，O(1)）
+
+    没有计数器行的用户（迁移回填之后没有任何计数数据）回退到 count(*)，
+    这类用户的数据量为 0 或极少，回退的代价可以忽略。
+    """
+    column = COUNTED_COLUMNS[model]
+    value = session.exec(
+        select(getattr(UserStats, column)).where(UserStats.user_id == user_id)
+    ).first()
+    if value is not None:
+        return int(value)
+    m: Any = model
+    return session.exec(select(func.count()).select_from(m).where(m.user_id == user_id)).one()
@@ -2,9 +2,11 @@
 from datetime import datetime
 
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api.errors import AppError
 from app.models import User, UserPoints, utc_now
+from app.services.user_cache import invalidate_user
 
 
 def get_by_device_id(*, session: Session, device_id: str) -> User | None:
@@ -32,6 +34,31 @@ def get_or_create_by_device_id(*, session: Session, device_id: str) -> User:
     return create(session=session, device_id=device_id)
 
 
+async def get_by_device_id_async(*, session: AsyncSession, device_id: str) -> User | None:
+    """根据设备 ID 查询用户（async 版本）"""
+    statement = select(User).where(User.device_id == device_id)
+    return (await session.exec(statement)).first()
+
+
+async def create_async(*, session: AsyncSession, device_id: str) -> User:
+    """创建新用户，同时初始化积分账户（async 版本）"""
+    user = User(device_id=device_id)
+    session.add(user)
+    await session.flush()
+    session.add(UserPoints(user_id=user.id, balance=0))
+    await session.commit()
+    await session.refresh(user)
+    return user
+
+
+async def get_or_create_by_device_id_async(*, session: AsyncSession, device_id: str) -> User:
+    """根据设备 ID 获取或创建用户（async 版本）"""
+    user = await get_by_device_id_async(session=session, device_id=device_id)
+    if user:
+        return user
+    return await create_async(session=session, device_id=device_id)
+
+
 def update_vip(
     *,
     session: Session,
@@ -50,3 +77,4 @@ def update_vip(
     user.updated_at = utc_now()
     session.add(user)
     session.commit()
+    invalidate_user(user_id)
@@ -10,6 +10,13 @@ DashScope 是阿里云的大模型服务，提供 AI 能力。
 表情生成使用 image2video 模型，将静态图片转换为动态表情视频。
 
 支持模拟模式（mock），用于本地开发时不需要真实 API 调用。
+
+传输层：
+- 客户端持有长连接的 httpx.Client / httpx.AsyncClient（连接池 + keep-alive），
+  避免每次调用都重新进行 TCP + TLS 握手
+- 安装了 h2 时启用 HTTP/2
+- 对 429 / 5xx / 网络错误按带随机抖动的指数退避重试（tenacity）
+- 生命周期：FastAPI 启动/关闭和 worker 启动时调用 open() / aclose()
 """
 from __future__ import annotations
 
@@ -17,6 +24,13 @@ from dataclasses import dataclass  # 数据类
 from typing import Any  # 任意类型
 
 import httpx  # HTTP 客户端
+from tenacity import (  # 重试库
+    AsyncRetrying,  # 异步重试器
+    Retrying,  # 同步重试器
+    retry_if_exception,  # 重试条件：按异常判断
+    stop_after_attempt,  # 停止条件：最大尝试次数
+    wait_random_exponential,  # 等待策略：带随机抖动的指数退避
+)
 
 from app.api.errors import AppError  # 自定义异常
 from app.core.config import settings  # 配置
@@ -26,6 +40,32 @@ _FACE_DETECT_PATH = "/api/v1/services/aigc/image2video/face-detect"  # 人脸检
 _VIDEO_SYNTHESIS_PATH = "/api/v1/services/aigc/image2video/video-synthesis"  # 视频合成接口
 _TASK_PATH = "/api/v1/tasks/{task_id}"  # 任务查询接口
 
+# 可重试的 HTTP 状态码：限流和服务端错误
+_RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def _is_retryable(exc: BaseException, *, idempotent: bool) -> bool:
+    """
+    判断请求异常是否可以重试
+
+    - 429 总是可以重试（请求被限流，服务端没有处理）
+    - 连接建立失败总是可以重试（请求没有发出）
+    - 5xx 和其他网络错误只在幂等请求上重试，避免重复创建远程任务
+
+    Args:
+        exc: 请求抛出的异常
+        idempotent: 请求是否幂等
+
+    Returns:
+        bool: 是否应该重试
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code == 429 or (idempotent and code in _RETRY_STATUS_CODES)
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return idempotent and isinstance(exc, httpx.TransportError)
+
 
 @dataclass(frozen=True)
 class EmojiDetectResult:
@@ -91,6 +131,147 @@ class AliyunEmojiClient:
         self._mock = settings.ALIYUN_EMOJI_MOCK  # 是否使用模拟模式
         self._base_url = settings.DASHSCOPE_BASE_URL.rstrip("/")  # API 基础 URL
         self._api_key = settings.DASHSCOPE_API_KEY  # API 密钥
+        self._client: httpx.Client | None = None  # 共享的同步 HTTP 客户端（懒加载）
+        self._async_client: httpx.AsyncClient | None = None  # 共享的异步 HTTP 客户端（懒加载）
+
+    @staticmethod
+    def _client_kwargs() -> dict[str, Any]:
+        """
+        构建 HTTP 客户端参数（连接池上限、keep-alive、超时、HTTP/2）
+
+        Returns:
+            dict[str, Any]: httpx.Client / httpx.AsyncClient 的构造参数
+        """
+        kwargs: dict[str, Any] = {
+            "timeout": settings.DASHSCOPE_TIMEOUT_SECONDS,
+            "limits": httpx.Limits(
+                max_connections=settings.DASHSCOPE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DASHSCOPE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.DASHSCOPE_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        }
+        if settings.DASHSCOPE_HTTP2:
+            kwargs["http2"] = True  # 依赖 h2，由 httpx[http2] 安装
+        return kwargs
+
+    def _get_client(self) -> httpx.Client:
+        """
+        获取共享的同步 HTTP 客户端
+
+        首次调用时创建，之后所有同步请求复用同一个连接池。
+        httpx.Client 是线程安全的，可以在 FastAPI 线程池中共享。
+
+        Returns:
+            httpx.Client: 同步 HTTP 客户端
+        """
+        if self._client is None:
+            self._client = httpx.Client(**self._client_kwargs())
+        return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """
+        获取共享的异步 HTTP 客户端
+
+        首次调用时创建，之后所有异步请求复用同一个客户端（连接池）。
+
+        Returns:
+            httpx.AsyncClient: 异步 HTTP 客户端
+        """
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_kwargs())
+        return self._async_client
+
+    def open(self) -> None:
+        """
+        预先创建 HTTP 客户端（FastAPI 启动 / worker 启动时调用）
+
+        模拟模式下不创建任何客户端。
+        """
+        if self._mock:
+            return
+        self._get_client()
+        self._get_async_client()
+
+    def close(self) -> None:
+        """关闭共享的同步 HTTP 客户端（同步 worker 退出时调用）"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """关闭所有共享的 HTTP 客户端（FastAPI 关闭 / 异步 worker 退出时调用）"""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str],
+        json: dict[str, Any] | None = None,
+        idempotent: bool = True,
+    ) -> Any:
+        """
+        发送同步请求（带重试），返回解析后的 JSON
+
+        Raises:
+            httpx.HTTPError: 重试耗尽或遇到不可重试的错误时
+        """
+        client = self._get_client()
+        retrying = Retrying(
+            stop=stop_after_attempt(settings.DASHSCOPE_MAX_RETRIES + 1),
+            wait=wait_random_exponential(
+                multiplier=settings.DASHSCOPE_RETRY_BACKOFF_SECONDS,
+                max=settings.DASHSCOPE_RETRY_MAX_BACKOFF_SECONDS,
+            ),
+            retry=retry_if_exception(lambda e: _is_retryable(e, idempotent=idempotent)),
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                if method == "GET":
+                    r = client.get(url, headers=headers)
+                else:
+                    r = client.post(url, json=json, headers=headers)
+                r.raise_for_status()
+        return r.json()
+
+    async def _send_async(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str],
+        json: dict[str, Any] | None = None,
+        idempotent: bool = True,
+    ) -> Any:
+        """
+        发送异步请求（带重试），返回解析后的 JSON
+
+        Raises:
+            httpx.HTTPError: 重试耗尽或遇到不可重试的错误时
+        """
+        client = self._get_async_client()
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(settings.DASHSCOPE_MAX_RETRIES + 1),
+            wait=wait_random_exponential(
+                multiplier=settings.DASHSCOPE_RETRY_BACKOFF_SECONDS,
+                max=settings.DASHSCOPE_RETRY_MAX_BACKOFF_SECONDS,
+            ),
+            retry=retry_if_exception(lambda e: _is_retryable(e, idempotent=idempotent)),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                if method == "GET":
+                    r = await client.get(url, headers=headers)
+                else:
+                    r = await client.post(url, json=json, headers=headers)
+                r.raise_for_status()
+        return r.json()
 
     def _headers(self, *, async_enable: bool = False) -> dict[str, str]:
         """
@@ -149,13 +330,44 @@ class AliyunEmojiClient:
         }
 
         try:
-            with httpx.Client(timeout=20) as client:
-                r = client.post(url, json=payload, headers=self._headers())
-                r.raise_for_status()
-                data = r.json()
+            data = self._send("POST", url, json=payload, headers=self._headers())
+        except httpx.HTTPError as e:
+            raise AppError(code=502101, message=f"DashScope detect error: {e}", status_code=502)
+
+        return self._parse_detect(data)
+
+    async def detect_async(self, *, image_url: str, ratio: str = "1:1") -> EmojiDetectResult:
+        """
+        人脸检测（异步版本）
+
+        与 detect 行为一致，使用共享的 httpx.AsyncClient，供 async 路由使用，
+        检测期间不会阻塞事件循环。
+        """
+        if self._mock:
+            return EmojiDetectResult(
+                passed=True,
+                face_bbox=[0, 0, 100, 100],
+                ext_bbox=[0, 0, 120, 120],
+                raw={"mock": True},
+            )
+
+        url = f"{self._base_url}{_FACE_DETECT_PATH}"
+        payload = {
+            "model": "emoji-detect-v1",
+            "input": {"image_url": image_url},
+            "parameters": {"ratio": ratio},
+        }
+
+        try:
+            data = await self._send_async("POST", url, json=payload, headers=self._headers())
         except httpx.HTTPError as e:
             raise AppError(code=502101, message=f"DashScope detect error: {e}", status_code=502)
 
+        return self._parse_detect(data)
+
+    @staticmethod
+    def _parse_detect(data: Any) -> EmojiDetectResult:
+        """解析人脸检测响应"""
         output = data.get("output") if isinstance(data, dict) else None
         if isinstance(output, dict) and "bbox_face" in output and "ext_bbox_face" in output:
             return EmojiDetectResult(
@@ -206,7 +418,56 @@ class AliyunEmojiClient:
             return EmojiCreateResult(task_id="mock_task", task_status="SUCCEEDED", raw={"mock": True})
 
         url = f"{self._base_url}{_VIDEO_SYNTHESIS_PATH}"
-        payload = {
+        payload = self._create_task_payload(
+            image_url=image_url, driven_id=driven_id, face_bbox=face_bbox, ext_bbox=ext_bbox
+        )
+
+        try:
+            # 创建任务不是幂等操作：只在请求确定未被处理时重试（429 / 连接失败）
+            data = self._send(
+                "POST", url, json=payload, headers=self._headers(async_enable=True), idempotent=False
+            )
+        except httpx.HTTPError as e:
+            raise AppError(code=502201, message=f"DashScope create task error: {e}", status_code=502)
+
+        return self._parse_create_task(data)
+
+    async def create_task_async(
+        self,
+        *,
+        image_url: str,
+        driven_id: str,
+        face_bbox: list[int],
+        ext_bbox: list[int],
+    ) -> EmojiCreateResult:
+        """
+        创建表情生成任务（异步版本）
+
+        与 create_task 行为一致，使用共享的 httpx.AsyncClient，供 asyncio worker 使用。
+        """
+        if self._mock:
+            return EmojiCreateResult(task_id="mock_task", task_status="SUCCEEDED", raw={"mock": True})
+
+        url = f"{self._base_url}{_VIDEO_SYNTHESIS_PATH}"
+        payload = self._create_task_payload(
+            image_url=image_url, driven_id=driven_id, face_bbox=face_bbox, ext_bbox=ext_bbox
+        )
+
+        try:
+            data = await self._send_async(
+                "POST", url, json=payload, headers=self._headers(async_enable=True), idempotent=False
+            )
+        except httpx.HTTPError as e:
+            raise AppError(code=502201, message=f"DashScope create task error: {e}", status_code=502)
+
+        return self._parse_create_task(data)
+
+    @staticmethod
+    def _create_task_payload(
+        *, image_url: str, driven_id: str, face_bbox: list[int], ext_bbox: list[int]
+    ) -> dict[str, Any]:
+        """构建视频合成任务请求体"""
+        return {
             "model": "emoji-v1",
             "input": {
                 "image_url": image_url,
@@ -216,14 +477,9 @@ class AliyunEmojiClient:
             },
         }
 
-        try:
-            with httpx.Client(timeout=30) as client:
-                r = client.post(url, json=payload, headers=self._headers(async_enable=True))
-                r.raise_for_status()
-                data = r.json()
-        except httpx.HTTPError as e:
-            raise AppError(code=502201, message=f"DashScope create task error: {e}", status_code=502)
-
+    @staticmethod
+    def _parse_create_task(data: Any) -> EmojiCreateResult:
+        """解析视频合成任务创建响应"""
         output = data.get("output") if isinstance(data, dict) else None
         if not isinstance(output, dict) or not output.get("task_id"):
             raise AppError(code=502202, message="DashScope create task invalid response", status_code=502)
@@ -260,13 +516,37 @@ class AliyunEmojiClient:
 
         url = f"{self._base_url}{_TASK_PATH.format(task_id=task_id)}"
         try:
-            with httpx.Client(timeout=20) as client:
-                r = client.get(url, headers=self._headers())
-                r.raise_for_status()
-                data = r.json()
+            data = self._send("GET", url, headers=self._headers())
+        except httpx.HTTPError as e:
+            raise AppError(code=502301, message=f"DashScope get task error: {e}", status_code=502)
+
+        return self._parse_task(data)
+
+    async def get_task_async(self, *, task_id: str) -> EmojiTaskResult:
+        """
+        查询任务状态（异步版本）
+
+        与 get_task 行为一致，使用共享的 httpx.AsyncClient，
+        asyncio worker 可以在一个进程内并发轮询大量任务。
+        """
+        if self._mock:
+            return EmojiTaskResult(
+                task_status="SUCCEEDED",
+                video_url="https://example.com/mock-result.mp4",
+                raw={"mock": True},
+            )
+
+        url = f"{self._base_url}{_TASK_PATH.format(task_id=task_id)}"
+        try:
+            data = await self._send_async("GET", url, headers=self._headers())
         except httpx.HTTPError as e:
             raise AppError(code=502301, message=f"DashScope get task error: {e}", status_code=502)
 
+        return self._parse_task(data)
+
+    @staticmethod
+    def _parse_task(data: Any) -> EmojiTaskResult:
+        """解析任务查询响应"""
         output = data.get("output") if isinstance(data, dict) else None
         if not isinstance(output, dict):
             raise AppError(code=502302, message="DashScope get task invalid response", status_code=502)
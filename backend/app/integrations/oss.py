@@ -2,17 +2,27 @@
 阿里云 OSS（对象存储）集成模块
 
 提供阿里云 OSS 的相关功能，包括：
-- 上传文件到 OSS
+- 上传文件到 OSS（流式分片上传，内存占用与文件大小无关）
+- 生成 PostObject 表单直传参数（客户端直传 OSS，Policy 限制大小和类型）
 - 构建对象 URL
-- 从 URL 下载并上传到 OSS
+- 从 URL 流式转存到 OSS（不落本地临时文件）
 """
 from __future__ import annotations
 
-import tempfile
-from typing import BinaryIO
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO
 
 import httpx
 import oss2
+from oss2.models import PartInfo  # type: ignore[import-untyped]  # oss2 没有类型标注
 
 from app.api.errors import AppError
 from app.core.config import settings
@@ -37,8 +47,8 @@ def _endpoint_for_sdk(endpoint: str) -> str:
     return f"https://{endpoint}"
 
 
-def _get_bucket() -> oss2.Bucket:
-    """获取 OSS Bucket 实例"""
+def _oss_config() -> tuple[str, str, str, str]:
+    """读取 OSS 配置：(端点, 存储桶, Access Key ID, Access Key Secret)，未配置时抛出 500001"""
     if not (
         settings.OSS_ENDPOINT
         and settings.OSS_BUCKET
@@ -46,8 +56,19 @@ def _get_bucket() -> oss2.Bucket:
         and settings.OSS_ACCESS_KEY_SECRET
     ):
         raise AppError(code=500001, message="OSS not configured", status_code=500)
-    auth = oss2.Auth(settings.OSS_ACCESS_KEY_ID, settings.OSS_ACCESS_KEY_SECRET)
-    return oss2.Bucket(auth, _endpoint_for_sdk(settings.OSS_ENDPOINT), settings.OSS_BUCKET)
+    return (
+        settings.OSS_ENDPOINT,
+        settings.OSS_BUCKET,
+        settings.OSS_ACCESS_KEY_ID,
+        settings.OSS_ACCESS_KEY_SECRET,
+    )
+
+
+def _get_bucket() -> oss2.Bucket:
+    """获取 OSS Bucket 实例"""
+    endpoint, bucket, access_key_id, access_key_secret = _oss_config()
+    auth = oss2.Auth(access_key_id, access_key_secret)
+    return oss2.Bucket(auth, _endpoint_for_sdk(endpoint), bucket)
 
 
 def build_object_url(*, key: str) -> str:
@@ -60,42 +81,194 @@ def build_object_url(*, key: str) -> str:
     return f"{host}/{key}"
 
 
-def upload_file(*, file: BinaryIO, key: str, content_type: str | None = None) -> str:
+def _object_headers(content_type: str | None = None) -> dict[str, str]:
+    """构建上传对象时的公共请求头（ACL、Content-Type）"""
+    headers = {}
+    if settings.OSS_OBJECT_ACL:
+        headers["x-oss-object-acl"] = settings.OSS_OBJECT_ACL
+    if content_type:
+        headers["Content-Type"] = content_type
+    return headers
+
+
+def _iter_parts(file: BinaryIO, part_size: int, max_size: int | None) -> Iterator[bytes]:
+    """
+    按分片大小读取文件，边读边校验总大小
+
+    Raises:
+        AppError: 累计大小超过 max_size 时立即抛出 400003
+    """
+    total = 0
+    while True:
+        chunk = file.read(part_size)
+        if not chunk:
+            return
+        total += len(chunk)
+        if max_size is not None and total > max_size:
+            raise AppError(code=400003, message="File too large", status_code=400)
+        yield chunk
+
+
+def _upload_parts(*, key: str, parts: Iterator[bytes], headers: dict[str, str]) -> str:
     """
-    上传文件到 OSS
+    把分片流上传到 OSS
+
+    - 只有一个分片：单次 PUT
+    - 多个分片：分片上传，最多 OSS_MULTIPART_CONCURRENCY 个分片并行上传；
+      生产者在并行窗口占满时等待最早的分片完成，内存中最多持有 并发数 + 1 个分片
+
+    任何异常（包括分片迭代器抛出的大小超限）都会中止分片上传并重新抛出。
+
+    Args:
+        key: OSS 对象键名
+        parts: 分片数据迭代器（除最后一个外，每个分片不小于 OSS 最小分片 100KB）
+        headers: 对象请求头
+
+    Returns:
+        上传后的对象公开访问 URL
+    """
+    bucket = _get_bucket()
+    first = next(parts, b"")
+    second = next(parts, None)
+    if second is None:
+        # 小文件：单次上传
+        bucket.put_object(key, first, headers=headers or None)
+        return build_object_url(key=key)
+
+    upload_id = bucket.init_multipart_upload(key, headers=headers or None).upload_id
+    concurrency = max(1, settings.OSS_MULTIPART_CONCURRENCY)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            pending: deque[tuple[int, Future[Any]]] = deque()
+            infos = []
+            for number, chunk in enumerate(itertools.chain((first, second), parts), start=1):
+                if len(pending) >= concurrency:
+                    # 并行窗口已满：等待最早的分片完成，限制内存占用
+                    done_number, future = pending.popleft()
+                    infos.append(PartInfo(done_number, future.result().etag))
+                pending.append((number, pool.submit(bucket.upload_part, key, upload_id, number, chunk)))
+            for number, future in pending:
+                infos.append(PartInfo(number, future.result().etag))
+        bucket.complete_multipart_upload(key, upload_id, infos)
+    except Exception:
+        # 超限或上传失败：中止分片上传，释放 OSS 上已上传的分片
+        bucket.abort_multipart_upload(key, upload_id)
+        raise
+    return build_object_url(key=key)
+
+
+def upload_file(
+    *,
+    file: BinaryIO,
+    key: str,
+    content_type: str | None = None,
+    max_size: int | None = None,
+) -> str:
+    """
+    流式上传文件到 OSS
+
+    按 OSS_MULTIPART_PART_SIZE 分片读取文件：
+    - 不超过一个分片的小文件：单次 PUT
+    - 更大的文件：分片上传（multipart upload），内存占用有上限（见 _upload_parts）
+
+    读取过程中累计校验大小，超过 max_size 时中止分片上传并拒绝请求，
+    不会把超限文件写入 OSS。
 
     Args:
         file: 文件对象（二进制流）
         key: OSS 对象键名（存储路径）
         content_type: 文件 MIME 类型
+        max_size: 允许的最大字节数（None 表示不限制）
 
     Returns:
         上传后的对象公开访问 URL
+
+    Raises:
+        AppError: 文件超过 max_size 时抛出 400003
+    """
+    parts = _iter_parts(file, settings.OSS_MULTIPART_PART_SIZE, max_size)
+    return _upload_parts(key=key, parts=parts, headers=_object_headers(content_type))
+
+
+def presign_upload(*, key: str, content_type: str, max_size: int) -> tuple[str, dict[str, str]]:
+    """
+    生成 PostObject 表单直传参数（客户端直传 OSS）
+
+    预签名 PUT URL 无法限制上传大小，因此使用 PostObject：签名的 Policy 限定了
+    对象键、Content-Type、ACL 和文件大小（content-length-range），
+    不满足条件的上传由 OSS 直接拒绝，超限文件不会写入存储桶。
+    客户端以 multipart/form-data POST 到上传 URL，先原样携带返回的表单字段，
+    最后是文件字段 file。Policy 在 OSS_UPLOAD_EXPIRE_SECONDS 秒后失效。
+    签名在本地计算，不产生网络请求。
+
+    Args:
+        key: OSS 对象键名（存储路径）
+        content_type: 文件 MIME 类型
+        max_size: 允许的最大字节数
+
+    Returns:
+        (上传 URL, 客户端上传时必须携带的表单字段)
+    """
+    endpoint, bucket, access_key_id, access_key_secret = _oss_config()
+    fields = {"key": key, **_object_headers(content_type)}
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=settings.OSS_UPLOAD_EXPIRE_SECONDS)
+    policy = {
+        "expiration": expiration.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "conditions": [
+            {"bucket": bucket},
+            ["content-length-range", 1, max_size],
+            *(["eq", f"${name}", value] for name, value in fields.items()),
+        ],
+    }
+    encoded = base64.b64encode(json.dumps(policy).encode()).decode()
+    signature = hmac.new(access_key_secret.encode(), encoded.encode(), hashlib.sha1).digest()
+    fields.update(
+        OSSAccessKeyId=access_key_id,
+        policy=encoded,
+        Signature=base64.b64encode(signature).decode(),
+    )
+    return _build_host(bucket, endpoint), fields
+
+
+def get_object_size(*, key: str) -> int | None:
+    """
+    查询 OSS 对象大小
+
+    Args:
+        key: OSS 对象键名
+
+    Returns:
+        对象字节数，对象不存在时返回 None
     """
     bucket = _get_bucket()
-    headers = {}
-    if settings.OSS_OBJECT_ACL:
-        headers["x-oss-object-acl"] = settings.OSS_OBJECT_ACL
-    if content_type:
-        headers["Content-Type"] = content_type
+    try:
+        meta = bucket.head_object(key)
+    except oss2.exceptions.NotFound:
+        return None
+    return int(meta.content_length)
 
-    bucket.put_object(key, file, headers=headers or None)
-    return build_object_url(key=key)
+
+def delete_object(*, key: str) -> None:
+    """删除 OSS 对象（对象不存在时 OSS 也返回成功）"""
+    _get_bucket().delete_object(key)
 
 
 def upload_from_url(*, url: str, key: str) -> str:
-    """从远程 URL 下载文件并上传到 OSS"""
-    bucket = _get_bucket()
-    headers = {}
-    if settings.OSS_OBJECT_ACL:
-        headers["x-oss-object-acl"] = settings.OSS_OBJECT_ACL
+    """
+    从远程 URL 流式转存到 OSS
 
-    with tempfile.NamedTemporaryFile(suffix=".bin") as tmp:
-        with httpx.stream("GET", url, timeout=60) as resp:
-            resp.raise_for_status()
-            for chunk in resp.iter_bytes():
-                tmp.write(chunk)
-        tmp.flush()
-        bucket.put_object_from_file(key, tmp.name, headers=headers or None)
+    下载流按 OSS_MULTIPART_PART_SIZE 切分后直接进入分片上传，不落本地临时文件，
+    内存占用与文件大小无关（见 _upload_parts）。
 
-    return build_object_url(key=key)
+    Args:
+        url: 远程文件 URL（如 DashScope 生成的视频地址）
+        key: OSS 对象键名
+
+    Returns:
+        上传后的对象公开访问 URL
+    """
+    with httpx.stream("GET", url, timeout=60) as resp:
+        resp.raise_for_status()
+        # iter_bytes(chunk_size) 按固定大小重新切分网络数据，除最后一块外都是完整分片
+        parts = resp.iter_bytes(chunk_size=settings.OSS_MULTIPART_PART_SIZE)
+        return _upload_parts(key=key, parts=iter(parts), headers=_object_headers())
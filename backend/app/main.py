@@ -25,6 +25,7 @@ from fastapi.routing import APIRoute  # 路由类型
 from app.api.errors import AppError
 from app.api.main import api_router
 from app.core.config import settings
+from app.integrations.aliyun_emoji import aliyun_emoji_client
 from app.services.config_service import refresh_config
 
 logger = logging.getLogger(__name__)
@@ -92,6 +93,17 @@ async def stop_config_refresher() -> None:
         pass
 
 
+@app.on_event("startup")
+async def open_http_clients() -> None:
+    # 预先创建 DashScope 长连接客户端（连接池）
+    aliyun_emoji_client.open()
+
+
+@app.on_event("shutdown")
+async def close_http_clients() -> None:
+    await aliyun_emoji_client.aclose()
+
+
 @app.exception_handler(AppError)
 async def app_error_handler(_: Request, exc: AppError) -> JSONResponse:
     """
@@ -9,6 +9,8 @@
 - subscription.py: 订阅模型
 - order.py: 订单模型
 - emoji.py: 表情生成任务模型
+- outbox.py: 事务性发件箱模型
+- stats.py: 用户计数器模型
 - revenuecat.py: RevenueCat 事件模型
 """
 from sqlmodel import SQLModel
@@ -16,8 +18,10 @@ from sqlmodel import SQLModel
 from .base import utc_now
 from .emoji import EmojiTask
 from .order import Order
+from .outbox import OutboxMessage
 from .points import PointTransaction, UserPoints
 from .revenuecat import RevenueCatEvent
+from .stats import UserStats
 from .subscription import Subscription
 from .user import User
 
@@ -30,5 +34,7 @@ __all__ = [
     "Subscription",
     "Order",
     "EmojiTask",
+    "OutboxMessage",
+    "UserStats",
     "RevenueCatEvent",
 ]
@@ -5,7 +5,17 @@
 """
 from datetime import datetime
 
-from sqlalchemy import JSON, BigInteger, Column, DateTime, ForeignKey, String, Text
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+    Text,
+    desc,
+)
 from sqlmodel import Field, SQLModel
 
 from app.core.snowflake import generate_id
@@ -37,13 +47,17 @@ class EmojiTask(SQLModel, table=True):
     - completed_at: 完成时间
     """
     __tablename__ = "emoji_tasks"
+    # 列表接口按 (user_id, id DESC) 做游标分页，见 app.api.pagination
+    # 该索引也覆盖按 user_id 的查询，user_id 不再单独建索引
+    __table_args__ = (Index("ix_emoji_tasks_user_id_id", "user_id", desc("id")),)
+
     id: int = Field(
         default_factory=generate_id,
         sa_column=Column(BigInteger, primary_key=True, autoincrement=False),
     )
     user_id: int = Field(
         sa_column=Column(
-            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False
+            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
         )
     )
 
@@ -6,7 +6,16 @@
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Numeric, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Numeric,
+    String,
+    desc,
+)
 from sqlmodel import Field, SQLModel
 
 from app.core.snowflake import generate_id
@@ -39,13 +48,17 @@ class Order(SQLModel, table=True):
     - updated_at: 更新时间
     """
     __tablename__ = "orders"
+    # 列表接口按 (user_id, id DESC) 做游标分页，见 app.api.pagination
+    # 该索引也覆盖按 user_id 的查询，user_id 不再单独建索引
+    __table_args__ = (Index("ix_orders_user_id_id", "user_id", desc("id")),)
+
     id: int = Field(
         default_factory=generate_id,
         sa_column=Column(BigInteger, primary_key=True, autoincrement=False),
     )
     user_id: int = Field(
         sa_column=Column(
-            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False
+            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
         )
     )
 
@@ -0,0 +1,42 @@
+"""
+发件箱（Outbox）模型模块
+
+定义事务性发件箱表，用于把"写数据库"和"发消息到 Redis Streams"解耦。
+"""
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import JSON, BigInteger, Column, DateTime, String
+from sqlmodel import Field, SQLModel
+
+from app.core.snowflake import generate_id
+
+from .base import utc_now
+
+
+class OutboxMessage(SQLModel, table=True):
+    """
+    发件箱消息模型
+
+    业务数据和待发布的消息在同一个事务中写入，事务提交即代表消息"已入队"；
+    后台 relay（worker/outbox_relay.py）按 id 顺序批量读取，XADD 到对应的
+    Redis Stream 后删除。Redis 暂时不可用时消息留在表中，恢复后自动补发。
+
+    字段说明：
+    - id: 主键（Snowflake，按时间递增，relay 按 id 顺序发布）
+    - stream: 目标 Redis Stream 名称（如 "emoji_tasks"）
+    - payload: 消息字段（JSON，值均为字符串，直接作为 XADD 的字段）
+    - created_at: 创建时间
+    """
+    __tablename__ = "outbox_messages"
+
+    id: int = Field(
+        default_factory=generate_id,
+        sa_column=Column(BigInteger, primary_key=True, autoincrement=False),
+    )
+    stream: str = Field(sa_column=Column(String(64), nullable=False))
+    payload: dict[str, Any] = Field(sa_column=Column(JSON, nullable=False))
+    created_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
@@ -5,7 +5,7 @@
 """
 from datetime import datetime
 
-from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, String
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, String, desc
 from sqlmodel import Field, SQLModel
 
 from app.core.snowflake import generate_id
@@ -25,6 +25,7 @@ class UserPoints(SQLModel, table=True):
     - id: 主键
     - user_id: 用户 ID（外键，关联到 users 表）
     - balance: 当前积分余额
+    - version: 余额版本号（每次变更加 1，用于余额缓存防止旧值覆盖新值）
     - updated_at: 最后更新时间
     """
     __tablename__ = "user_points"
@@ -42,6 +43,7 @@ class UserPoints(SQLModel, table=True):
         )
     )
     balance: int = Field(default=0)
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
     updated_at: datetime = Field(
         default_factory=utc_now,
         sa_column=Column(DateTime(timezone=True), nullable=False),
@@ -75,6 +77,9 @@ class PointTransaction(SQLModel, table=True):
             unique=True,
             postgresql_where=Column("reward_week").isnot(None),
         ),
+        # 积分流水按 (user_id, id DESC) 做游标分页，见 app.api.pagination
+        # 该索引也覆盖按 user_id 的查询，user_id 不再单独建索引
+        Index("ix_point_transactions_user_id_id", "user_id", desc("id")),
     )
 
     id: int = Field(
@@ -83,7 +88,7 @@ class PointTransaction(SQLModel, table=True):
     )
     user_id: int = Field(
         sa_column=Column(
-            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False
+            BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
         )
     )
     type: PointTransactionType = Field(sa_column=Column(String(16), nullable=False))
@@ -0,0 +1,45 @@
+"""
+用户统计模型模块
+
+定义按用户维护的计数器表，列表接口的总数直接从这里读取。
+"""
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey
+from sqlmodel import Field, SQLModel
+
+from .base import utc_now
+
+
+class UserStats(SQLModel, table=True):
+    """
+    用户计数器模型
+
+    每个用户一行，记录表情任务、积分流水、订单的条数。
+    计数器和对应的数据在同一个事务中增减（见 app.crud.stats.bump_user_stats），
+    因此与实际行数一致，列表接口读取总数是 O(1) 的主键查询，不再 count(*)。
+
+    字段说明：
+    - user_id: 用户 ID（主键，外键，用户删除时级联删除）
+    - emoji_tasks: 表情任务数
+    - point_transactions: 积分流水数
+    - orders: 订单数
+    - updated_at: 最后更新时间
+    """
+    __tablename__ = "user_stats"
+
+    user_id: int = Field(
+        sa_column=Column(
+            BigInteger,
+            ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+            autoincrement=False,
+        )
+    )
+    emoji_tasks: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    point_transactions: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    orders: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    updated_at: datetime = Field(
+        default_factory=utc_now,
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+    )
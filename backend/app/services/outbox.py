@@ -0,0 +1,157 @@
+"""
+事务性发件箱服务模块
+
+写入方在业务事务中调用 enqueue，消息和业务数据一起提交；
+relay_batch 由后台 relay 循环调用，把消息批量发布到 Redis Streams。
+
+表情任务消息格式（emoji_task_fields / decode_emoji_task）：
+- v1（旧格式）：task_id、user_id、image_url、driven_id、完整 detect_result 的 JSON，
+  worker 实际只使用 task_id。
+- v2：v="2"、task_id，可选 data（worker 处理任务所需字段的紧凑 JSON，
+  不含 DashScope 原始检测结果，供 EMOJI_WORKER_FAST_PATH 跳过读库）。保留 task_id 字段名，滚动发布期间旧 worker 仍能处理。
+解码同时支持两种格式，队列中残留的旧消息不受影响。
+
+投递语义是"至少一次"：XADD 成功但删除发件箱行之前进程退出时，
+下次会重复发布同一条消息，消费方需要保证幂等（emoji worker 会跳过已结束的任务）。
+"""
+from __future__ import annotations
+
+import json  # JSON 序列化
+from dataclasses import dataclass  # 数据类
+from typing import Any  # 任意类型
+
+from redis import Redis
+from sqlmodel import Session, col, delete, select
+
+from app.models import EmojiTask, OutboxMessage
+
+# 表情生成任务队列（Redis Stream 名称）
+EMOJI_TASK_STREAM = "emoji_tasks"
+
+# 多次投递仍未处理成功的表情任务消息（死信队列，见 worker/reclaimer.py）
+EMOJI_TASK_DEAD_LETTER_STREAM = "emoji_tasks:dead"
+
+
+def enqueue(session: Session, *, stream: str, fields: dict[str, str]) -> OutboxMessage:
+    """
+    在当前事务中写入一条待发布消息（不提交）
+
+    Args:
+        session: 数据库会话（由调用方提交）
+        stream: 目标 Redis Stream 名称
+        fields: 消息字段（值必须是字符串）
+
+    Returns:
+        OutboxMessage: 发件箱消息
+    """
+    message = OutboxMessage(stream=stream, payload=fields)
+    session.add(message)
+    return message
+
+
+# 当前的表情任务消息格式版本
+EMOJI_TASK_MESSAGE_VERSION = "2"
+
+
+@dataclass(frozen=True)
+class EmojiTaskMessage:
+    """解码后的表情任务消息"""
+
+    task_id: int
+    # 消息携带的任务数据（见 emoji_task_fields），未携带时为 None
+    data: dict[str, Any] | None = None
+
+
+def emoji_task_fields(task: EmojiTask, *, with_data: bool = False) -> dict[str, str]:
+    """
+    构建表情任务的队列消息字段（v2 格式）
+
+    Args:
+        task: 表情任务
+        with_data: 是否携带 worker 处理任务所需的字段
+            （user_id、image_url、driven_id、face_bbox、ext_bbox、points_cost、created_at）
+
+    Returns:
+        dict: 消息字段
+    """
+    fields = {"v": EMOJI_TASK_MESSAGE_VERSION, "task_id": str(task.id)}
+    if with_data:
+        detect = task.detect_result or {}
+        data = {
+            "user_id": task.user_id,
+            "image_url": task.source_image_url,
+            "driven_id": task.driven_id,
+            "face_bbox": detect.get("face_bbox"),
+            "ext_bbox": detect.get("ext_bbox"),
+            "points_cost": task.points_cost,
+            "created_at": task.created_at.isoformat(),
+        }
+        fields["data"] = json.dumps(data, separators=(",", ":"))  # 紧凑 JSON
+    return fields
+
+
+def decode_emoji_task(fields: dict[str, str]) -> EmojiTaskMessage:
+    """
+    解码表情任务消息（兼容 v1 和 v2 格式）
+
+    Args:
+        fields: Redis Stream 消息字段
+
+    Returns:
+        EmojiTaskMessage: 任务 ID 和可选的任务数据
+
+    Raises:
+        ValueError: 未知的消息版本或字段格式不正确
+    """
+    version = fields.get("v", "1")  # v1 消息没有版本字段
+    if version == "1":
+        return EmojiTaskMessage(task_id=int(fields["task_id"]))
+    if version == EMOJI_TASK_MESSAGE_VERSION:
+        raw = fields.get("data")
+        return EmojiTaskMessage(task_id=int(fields["task_id"]), data=json.loads(raw) if raw else None)
+    raise ValueError(f"unknown emoji task message version: {version}")
+
+
+def relay_batch(
+    *, session: Session, rds: Redis, batch_size: int, maxlen: int | None = None
+) -> int:
+    """
+    发布一批发件箱消息
+
+    按 id 顺序锁定最多 batch_size 行（FOR UPDATE SKIP LOCKED，多个 relay 可以并行），
+    通过一个 pipeline 批量 XADD，然后删除已发布的行并提交。
+    XADD 失败时事务回滚，消息留在表中等待下次重试。
+
+    Args:
+        session: 数据库会话
+        rds: Redis 客户端
+        batch_size: 每批最多发布的消息数
+        maxlen: Stream 的近似长度上限（XADD MAXLEN ~，None 表示不限制）
+
+    Returns:
+        int: 本批发布的消息数
+    """
+    stmt = (
+        select(OutboxMessage)
+        .order_by(col(OutboxMessage.id))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = session.exec(stmt).all()
+    if not rows:
+        session.rollback()
+        return 0
+
+    pipe: Any = rds.pipeline(transaction=False)
+    for row in rows:
+        pipe.xadd(row.stream, row.payload, maxlen=maxlen, approximate=True)
+    try:
+        pipe.execute()
+    except Exception:
+        session.rollback()
+        raise
+
+    ids = [row.id for row in rows]
+    session.exec(delete(OutboxMessage).where(col(OutboxMessage.id).in_(ids)))  # type: ignore[call-overload]
+    session.commit()
+    return len(rows)
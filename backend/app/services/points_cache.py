@@ -0,0 +1,250 @@
+"""
+积分余额缓存服务模块
+
+为 GET /points/balance、GET /user/profile、POST /auth/login 提供 Redis 写穿透（write-through）
+余额缓存，读取余额时不再查询数据库：
+- 写：change_points 在事务提交后把新余额写入 Redis（见 store_after_commit）
+- 读：先读 Redis，未命中时查询数据库并回填
+
+版本号：user_points.version 在每次余额变更时由同一条 UPDATE 语句加 1，
+写入 Redis 时通过 Lua 脚本比较版本，只有更新的版本才能覆盖旧值。
+这样"读数据库后回填"与"变更后写入"并发时，旧值不会覆盖新值。
+
+写入失败时尽力删除对应的缓存键并记录警告，避免旧余额在 TTL 内一直被读取。
+
+异步会话（AsyncSession）提交后的写入使用异步客户端，在事件循环中以后台任务执行，
+不在事件循环中执行阻塞的 Redis 调用（见 store_after_commit_async）。
+
+Redis 不可用时自动降级为直接读数据库，不影响请求。
+"""
+from __future__ import annotations
+
+import asyncio  # 后台任务
+import logging  # 日志记录
+from collections.abc import Iterable  # 可迭代类型
+from typing import Any, cast  # 任意类型、类型断言
+
+from sqlalchemy import event  # ORM 事件
+from sqlalchemy.orm import Session as OrmSession  # 所有同步/异步会话的基类
+from sqlmodel.ext.asyncio.session import AsyncSession  # 异步数据库会话
+
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+from app.models import UserPoints
+
+logger = logging.getLogger(__name__)
+
+# Redis 键前缀：points_balance:{user_id}，哈希字段 b=余额，v=版本号
+_REDIS_KEY_PREFIX = "points_balance:"
+
+# session.info 中等待提交后写入缓存的余额：user_id -> (余额, 版本号)
+_PENDING_KEY = "points_cache_pending"
+# 同上，异步会话登记的余额（提交后用异步客户端写入）
+_ASYNC_PENDING_KEY = "points_cache_pending_async"
+
+# 正在执行的异步写入任务（保留引用，避免任务被垃圾回收）
+_tasks: set[asyncio.Task[None]] = set()
+
+# 比较版本后写入：缓存中的版本 >= 新版本时不写入
+_SET_IF_NEWER = """
+local cur = redis.call('HGET', KEYS[1], 'v')
+if cur and tonumber(cur) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'b', ARGV[1], 'v', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def _redis_key(user_id: int) -> str:
+    """构建 Redis 缓存键"""
+    return f"{_REDIS_KEY_PREFIX}{user_id}"
+
+
+def _async_redis() -> Any:
+    """异步客户端（redis.asyncio 的类型标注把返回值标成同步/异步的联合类型，这里按 Any 使用）"""
+    return get_async_redis()
+
+
+def _script_args(user_id: int, balance: int, version: int) -> list[str]:
+    """EVAL 的键和参数：键、余额、版本号、TTL"""
+    return [_redis_key(user_id), str(balance), str(version), str(settings.POINTS_CACHE_TTL_SECONDS)]
+
+
+def _parse(raw: list[str | None]) -> int | None:
+    """解析 HMGET 结果，缺少字段时视为未命中"""
+    balance, version = raw
+    if balance is None or version is None:
+        return None
+    return int(balance)
+
+
+def get_cached_balance(user_id: int) -> int | None:
+    """
+    从 Redis 读取积分余额
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        int | None: 余额，未命中或 Redis 不可用时返回 None
+    """
+    if not settings.POINTS_CACHE_ENABLED:
+        return None
+    try:
+        raw = cast("list[str | None]", get_redis().hmget(_redis_key(user_id), ["b", "v"]))
+        return _parse(raw)
+    except Exception:
+        logger.debug("points cache redis get failed", exc_info=True)
+        return None
+
+
+async def get_cached_balance_async(user_id: int) -> int | None:
+    """
+    从 Redis 读取积分余额（async 版本，Redis 使用异步客户端）
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        int | None: 余额，未命中或 Redis 不可用时返回 None
+    """
+    if not settings.POINTS_CACHE_ENABLED:
+        return None
+    try:
+        return _parse(await _async_redis().hmget(_redis_key(user_id), ["b", "v"]))
+    except Exception:
+        logger.debug("points cache redis get failed", exc_info=True)
+        return None
+
+
+def store_balance(user_id: int, balance: int, version: int) -> None:
+    """
+    写入积分余额（版本号更新时才覆盖）
+
+    必须在余额所在的事务提交之后调用。
+
+    Args:
+        user_id: 用户 ID
+        balance: 余额
+        version: user_points.version
+    """
+    store_balances([(user_id, balance, version)])
+
+
+def store_balances(rows: Iterable[tuple[int, int, int]]) -> None:
+    """
+    批量写入积分余额（一次 pipeline 往返，用于周奖励等批量变更）
+
+    Args:
+        rows: (用户 ID, 余额, 版本号) 列表
+    """
+    if not settings.POINTS_CACHE_ENABLED:
+        return
+    rows = list(rows)
+    r = get_redis()
+    try:
+        pipe = r.pipeline(transaction=False)
+        for user_id, balance, version in rows:
+            pipe.eval(_SET_IF_NEWER, 1, *_script_args(user_id, balance, version))
+        pipe.execute()
+    except Exception:
+        logger.warning("points cache redis set failed, dropping cached balances", exc_info=True)
+        # 尽力删除，避免旧余额在 TTL 内继续被读取
+        try:
+            r.delete(*(_redis_key(user_id) for user_id, _, _ in rows))
+        except Exception:
+            logger.debug("points cache redis delete failed", exc_info=True)
+
+
+async def store_balance_async(user_id: int, balance: int, version: int) -> None:
+    """
+    写入积分余额（async 版本，Redis 使用异步客户端）
+
+    Args:
+        user_id: 用户 ID
+        balance: 余额
+        version: user_points.version
+    """
+    await store_balances_async([(user_id, balance, version)])
+
+
+async def store_balances_async(rows: Iterable[tuple[int, int, int]]) -> None:
+    """
+    批量写入积分余额（async 版本，失败时同 store_balances 删除缓存键）
+
+    Args:
+        rows: (用户 ID, 余额, 版本号) 列表
+    """
+    if not settings.POINTS_CACHE_ENABLED:
+        return
+    rows = list(rows)
+    r = _async_redis()
+    try:
+        pipe = r.pipeline(transaction=False)
+        for user_id, balance, version in rows:
+            pipe.eval(_SET_IF_NEWER, 1, *_script_args(user_id, balance, version))
+        await pipe.execute()
+    except Exception:
+        logger.warning("points cache redis set failed, dropping cached balances", exc_info=True)
+        try:
+            await r.delete(*(_redis_key(user_id) for user_id, _, _ in rows))
+        except Exception:
+            logger.debug("points cache redis delete failed", exc_info=True)
+
+
+def store_after_commit(session: OrmSession, points: UserPoints) -> None:
+    """
+    登记变更后的余额，在会话提交后写入缓存
+
+    change_points(commit=False) 时由调用方提交事务，余额在那时才可见；
+    回滚时登记的余额直接丢弃。
+
+    Args:
+        session: 执行积分变更的会话
+        points: change_points 返回的积分账户（包含新余额和版本号）
+    """
+    session.info.setdefault(_PENDING_KEY, {})[points.user_id] = (points.balance, points.version)
+
+
+def store_after_commit_async(session: AsyncSession, points: UserPoints) -> None:
+    """
+    登记变更后的余额，在异步会话提交后用异步客户端写入缓存
+
+    提交时在事件循环中创建后台任务执行写入，不阻塞事件循环；回滚时丢弃。
+
+    Args:
+        session: 执行积分变更的异步会话
+        points: change_points_async 返回的积分账户
+    """
+    info = session.sync_session.info
+    info.setdefault(_ASYNC_PENDING_KEY, {})[points.user_id] = (points.balance, points.version)
+
+
+async def wait_pending_writes() -> None:
+    """等待已提交的异步写入完成（主要用于测试和进程退出前）"""
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _flush_pending(session: OrmSession) -> None:
+    """提交后写入登记的余额"""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        store_balances((user_id, b, v) for user_id, (b, v) in pending.items())
+    pending_async = session.info.pop(_ASYNC_PENDING_KEY, None)
+    if pending_async:
+        # 异步会话的提交在事件循环线程中执行，这里不能做阻塞调用，交给后台任务
+        rows = [(user_id, b, v) for user_id, (b, v) in pending_async.items()]
+        task = asyncio.get_running_loop().create_task(store_balances_async(rows))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _drop_pending(session: OrmSession) -> None:
+    """回滚后丢弃登记的余额"""
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_ASYNC_PENDING_KEY, None)
@@ -0,0 +1,208 @@
+"""
+任务状态事件服务模块
+
+表情任务状态变化时由 worker 发布事件，API 通过 SSE（Server-Sent Events）
+推送给客户端，一个长连接代替客户端对 GET /emoji/task/{task_id} 的高频轮询。
+
+同时 worker 把最新的任务状态快照写入 Redis（键 emoji_task:{task_id}，带 TTL），
+仍在轮询的客户端由 GET /emoji/task/{task_id} 直接从快照返回，不查询数据库；
+快照中带 user_id，用于校验任务归属。未命中时回退数据库并用 SET NX 回填，
+不会覆盖 worker 同时写入的更新状态。
+
+通道：Redis Pub/Sub，每个用户一个频道 emoji_task_events:{user_id}，
+消息是任务状态快照的 JSON（字段与 EmojiTaskData 相同，另含 user_id）。
+
+Pub/Sub 不保存历史消息，所以 SSE 接口先订阅、再读取一次数据库中的当前状态
+作为第一条事件，订阅之后的变化都不会丢失。
+发布是尽力而为的：Redis 不可用时只记录日志，客户端仍可退回轮询。
+"""
+from __future__ import annotations
+
+import json  # JSON 序列化
+import logging  # 日志记录
+from typing import Any  # 任意类型
+
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+from app.enums import EmojiTaskStatus
+from app.models import EmojiTask
+
+logger = logging.getLogger(__name__)
+
+# Redis 频道前缀：emoji_task_events:{user_id}
+_CHANNEL_PREFIX = "emoji_task_events:"
+
+# Redis 快照键前缀：emoji_task:{task_id}
+_SNAPSHOT_KEY_PREFIX = "emoji_task:"
+
+# DashScope 完成回调的转发频道，消息内容是 DashScope 任务 ID（aliyun_task_id）
+POLL_HINT_CHANNEL = "emoji_poll_hints"
+
+# 终态：推送到终态后 SSE 连接结束
+FINAL_STATUSES = (EmojiTaskStatus.completed, EmojiTaskStatus.failed)
+
+
+def task_channel(user_id: int) -> str:
+    """构建用户的任务事件频道名"""
+    return f"{_CHANNEL_PREFIX}{user_id}"
+
+
+def snapshot_key(task_id: int) -> str:
+    """构建任务状态快照的 Redis 键"""
+    return f"{_SNAPSHOT_KEY_PREFIX}{task_id}"
+
+
+def task_snapshot(task: EmojiTask) -> dict[str, Any]:
+    """
+    生成任务状态快照（可直接 JSON 序列化）
+
+    Args:
+        task: 表情任务
+
+    Returns:
+        dict: id、user_id、status、points_cost、result_url、error_message、created_at、completed_at
+    """
+    return {
+        "id": task.id,
+        "user_id": task.user_id,
+        "status": EmojiTaskStatus(task.status).value,
+        "points_cost": task.points_cost,
+        "result_url": task.result_url,
+        "error_message": task.error_message,
+        "created_at": task.created_at.isoformat(),
+        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+    }
+
+
+def publish_task_event(task: EmojiTask) -> None:
+    """
+    写入任务状态快照并发布状态事件（worker 在状态变更提交后调用）
+
+    快照写入和发布在一个 pipeline 中完成，只有一次 Redis 往返。
+
+    Args:
+        task: 已提交的表情任务
+    """
+    publish_task_snapshot(task_snapshot(task))
+
+
+def publish_task_snapshot(snapshot: dict[str, Any]) -> None:
+    """
+    写入并发布一个已生成的任务快照
+
+    批量写入状态时使用：快照在排队时生成，和写入数据库的行一致，
+    不受 worker 之后继续修改任务对象的影响。
+
+    Args:
+        snapshot: task_snapshot 的返回值
+    """
+    raw = json.dumps(snapshot)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.set(snapshot_key(snapshot["id"]), raw, ex=settings.EMOJI_TASK_CACHE_TTL_SECONDS)
+        pipe.publish(task_channel(snapshot["user_id"]), raw)
+        pipe.execute()
+    except Exception:
+        logger.debug("task event publish failed", exc_info=True)
+
+
+async def get_cached_task_async(task_id: int) -> dict[str, Any] | None:
+    """
+    读取任务状态快照
+
+    Args:
+        task_id: 任务 ID
+
+    Returns:
+        dict | None: task_snapshot 的内容，未命中或 Redis 不可用时返回 None
+    """
+    try:
+        raw = await get_async_redis().get(snapshot_key(task_id))
+    except Exception:
+        logger.debug("task snapshot get failed", exc_info=True)
+        return None
+    return json.loads(raw) if raw else None
+
+
+async def cache_task_async(task: EmojiTask) -> None:
+    """
+    用数据库中读到的任务回填快照（仅在键不存在时写入）
+
+    Args:
+        task: 从数据库加载的表情任务
+    """
+    try:
+        await get_async_redis().set(
+            snapshot_key(task.id),
+            json.dumps(task_snapshot(task)),
+            ex=settings.EMOJI_TASK_CACHE_TTL_SECONDS,
+            nx=True,
+        )
+    except Exception:
+        logger.debug("task snapshot set failed", exc_info=True)
+
+
+def publish_poll_hint(aliyun_task_id: str) -> None:
+    """
+    通知 worker 立即查询某个 DashScope 任务（收到完成回调时调用）
+
+    Args:
+        aliyun_task_id: DashScope 任务 ID
+
+    Raises:
+        redis.RedisError: Redis 不可用时抛出，由回调接口返回错误让对方重试
+    """
+    get_redis().publish(POLL_HINT_CHANNEL, aliyun_task_id)
+
+
+def forget_task(task_id: int) -> None:
+    """删除任务状态快照（任务删除后调用）"""
+    try:
+        get_redis().delete(snapshot_key(task_id))
+    except Exception:
+        logger.debug("task snapshot delete failed", exc_info=True)
+
+
+async def subscribe(user_id: int) -> Any | None:
+    """
+    订阅用户的任务事件频道
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        PubSub | None: 已订阅的 PubSub 对象，Redis 不可用时返回 None
+    """
+    pubsub = None
+    try:
+        pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(task_channel(user_id))
+    except Exception:
+        logger.debug("task event subscribe failed", exc_info=True)
+        if pubsub is not None:
+            await close(pubsub)
+        return None
+    return pubsub
+
+
+async def close(pubsub: Any) -> None:
+    """取消订阅并释放连接（忽略错误）"""
+    try:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+    except Exception:
+        logger.debug("task event unsubscribe failed", exc_info=True)
+
+
+def format_sse(data: dict[str, Any], *, event: str = "task") -> str:
+    """
+    按 SSE 格式编码一条事件
+
+    Args:
+        data: 事件数据
+        event: 事件名
+
+    Returns:
+        str: "event: ...\\ndata: ...\\n\\n"
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,320 @@
+"""
+用户缓存服务模块
+
+为认证依赖 get_current_user 提供两级用户缓存，避免每个请求都查询一次数据库：
+- 一级：进程内 LRU（有容量上限和 TTL），命中时没有任何网络开销
+- 二级：Redis（有 TTL），在多个进程/实例之间共享
+
+缓存内容是用户行的 JSON 快照，读取时重建为"游离态"（detached）的 User 对象，
+路由中 session.add(user) 后会按 UPDATE 处理，而不是 INSERT。
+
+写入方（更新 VIP、订阅 webhook、更新资料等）在提交后必须调用 invalidate_user。
+
+回填竞争：读取方未命中后查询数据库，如果写入方在此期间提交并清除缓存，
+读取方随后会把旧数据写回缓存。为此每个用户有一个失效代数
+（Redis 键 user_cache_gen:{user_id} 和进程内计数），invalidate_user 会将其加一。
+读取方在查询数据库之前调用 cache_generation 记录代数，回填时（cache_user）
+只有代数未变化才写入，否则放弃这次回填。
+进程内代数取自一个全局递增计数，只为最近失效过的 USER_CACHE_MAX_SIZE 个用户保留；
+淘汰的代数记为下限，没有记录的用户都使用这个下限，因此淘汰只会让回填多放弃几次，不会误写旧数据。
+注意：invalidate_user 只能清除本进程的一级缓存和 Redis，其他进程的一级缓存
+需要等待 USER_CACHE_LOCAL_TTL_SECONDS 过期，因此一级 TTL 应保持较短。
+
+async 路由使用 get_cached_user_async / cache_user_async（基于 redis.asyncio），
+避免在事件循环中执行阻塞的 Redis 调用。
+
+Redis 不可用时自动降级为只使用进程内缓存，不影响请求。
+"""
+from __future__ import annotations
+
+import json  # JSON 序列化
+import logging  # 日志记录
+import time  # 时间处理（TTL）
+from collections import OrderedDict  # 有序字典，用于实现 LRU
+from threading import Lock  # 线程锁
+from typing import Any, cast  # 任意类型、类型断言
+
+from sqlalchemy.orm import make_transient_to_detached  # 将对象标记为游离态
+
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+# Redis 键前缀：user_cache:{user_id}
+_REDIS_KEY_PREFIX = "user_cache:"
+# Redis 失效代数键前缀：user_cache_gen:{user_id}
+_GEN_KEY_PREFIX = "user_cache_gen:"
+
+# 代数未变化时才写入缓存（KEYS[1]=缓存键，KEYS[2]=代数键，ARGV=代数、快照、TTL）
+_SET_IF_CURRENT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# 失效代数：(进程内代数, Redis 代数)，Redis 代数读取失败时为 None（不回填 Redis）
+Generation = tuple[int, str | None]
+
+# 全局变量（使用锁保护）
+_lock = Lock()  # 线程锁，路由处理函数运行在线程池中
+_local: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()  # user_id -> (过期时间, 快照)
+_local_gen: OrderedDict[int, int] = OrderedDict()  # user_id -> 进程内失效代数（最近失效过的用户）
+_gen_counter = 0  # 进程内失效代数的全局计数
+_gen_floor = 0  # 被淘汰的最大代数，没有记录的用户都使用这个代数
+
+
+def _redis_key(user_id: int) -> str:
+    """构建 Redis 缓存键"""
+    return f"{_REDIS_KEY_PREFIX}{user_id}"
+
+
+def _async_redis() -> Any:
+    """异步客户端（redis.asyncio 的类型标注把返回值标成同步/异步的联合类型，这里按 Any 使用）"""
+    return get_async_redis()
+
+
+def _gen_key(user_id: int) -> str:
+    """构建 Redis 失效代数键"""
+    return f"{_GEN_KEY_PREFIX}{user_id}"
+
+
+def _local_get(user_id: int) -> dict[str, Any] | None:
+    """从进程内 LRU 读取快照（过期则删除）"""
+    now = time.monotonic()
+    with _lock:
+        item = _local.get(user_id)
+        if item is None:
+            return None
+        expires_at, data = item
+        if expires_at <= now:
+            del _local[user_id]
+            return None
+        _local.move_to_end(user_id)  # 标记为最近使用
+        return data
+
+
+def _local_set(user_id: int, data: dict[str, Any], local_gen: int | None = None) -> None:
+    """写入进程内 LRU，超出容量时淘汰最久未使用的条目（local_gen 已过期时不写入）"""
+    expires_at = time.monotonic() + settings.USER_CACHE_LOCAL_TTL_SECONDS
+    with _lock:
+        if local_gen is not None and _local_gen.get(user_id, _gen_floor) != local_gen:
+            return
+        _local[user_id] = (expires_at, data)
+        _local.move_to_end(user_id)
+        while len(_local) > settings.USER_CACHE_MAX_SIZE:
+            _local.popitem(last=False)
+
+
+def _to_user(data: dict[str, Any]) -> User:
+    """
+    将快照重建为游离态 User 对象
+
+    每次都创建新对象，避免不同请求/会话共享同一个 ORM 实例。
+    """
+    user = User.model_validate(data)
+    make_transient_to_detached(user)
+    return user
+
+
+def get_cached_user(user_id: int) -> User | None:
+    """
+    从缓存读取用户
+
+    依次查询进程内 LRU 和 Redis，Redis 命中时回填进程内缓存。
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        User | None: 游离态的用户对象，未命中时返回 None
+    """
+    if not settings.USER_CACHE_ENABLED:
+        return None
+
+    data = _local_get(user_id)
+    if data is not None:
+        return _to_user(data)
+
+    try:
+        raw = cast("str | None", get_redis().get(_redis_key(user_id)))
+    except Exception:
+        logger.debug("user cache redis get failed", exc_info=True)
+        return None
+    if not raw:
+        return None
+
+    data = json.loads(raw)
+    _local_set(user_id, data)
+    return _to_user(data)
+
+
+def _local_generation(user_id: int) -> int:
+    with _lock:
+        return _local_gen.get(user_id, _gen_floor)
+
+
+def cache_generation(user_id: int) -> Generation:
+    """
+    读取用户的失效代数（缓存未命中、查询数据库之前调用，结果传给 cache_user）
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        Generation: (进程内代数, Redis 代数)
+    """
+    local_gen = _local_generation(user_id)
+    try:
+        remote = get_redis().get(_gen_key(user_id))
+    except Exception:
+        logger.debug("user cache generation get failed", exc_info=True)
+        return local_gen, None
+    return local_gen, str(remote or "0")
+
+
+async def cache_generation_async(user_id: int) -> Generation:
+    """读取用户的失效代数（async 版本）"""
+    local_gen = _local_generation(user_id)
+    try:
+        remote = await _async_redis().get(_gen_key(user_id))
+    except Exception:
+        logger.debug("user cache generation get failed", exc_info=True)
+        return local_gen, None
+    return local_gen, str(remote or "0")
+
+
+async def get_cached_user_async(user_id: int) -> User | None:
+    """
+    从缓存读取用户（async 版本，Redis 使用异步客户端）
+
+    Args:
+        user_id: 用户 ID
+
+    Returns:
+        User | None: 游离态的用户对象，未命中时返回 None
+    """
+    if not settings.USER_CACHE_ENABLED:
+        return None
+
+    data = _local_get(user_id)
+    if data is not None:
+        return _to_user(data)
+
+    try:
+        raw = await _async_redis().get(_redis_key(user_id))
+    except Exception:
+        logger.debug("user cache redis get failed", exc_info=True)
+        return None
+    if not raw:
+        return None
+
+    data = json.loads(raw)
+    _local_set(user_id, data)
+    return _to_user(data)
+
+
+def _snapshot(user: User) -> dict[str, Any]:
+    """生成用户快照（vip_type 从数据库读出时是普通字符串，关闭序列化类型警告）"""
+    return user.model_dump(mode="json", warnings=False)
+
+
+def cache_user(user: User, generation: Generation) -> None:
+    """
+    回填用户缓存（进程内 + Redis），失效代数已变化时放弃
+
+    Args:
+        user: 从数据库加载的用户对象
+        generation: 查询数据库之前 cache_generation 返回的代数
+    """
+    if not settings.USER_CACHE_ENABLED:
+        return
+
+    local_gen, remote_gen = generation
+    data = _snapshot(user)
+    _local_set(user.id, data, local_gen)
+    if remote_gen is None:
+        return
+    try:
+        get_redis().eval(
+            _SET_IF_CURRENT,
+            2,
+            _redis_key(user.id),
+            _gen_key(user.id),
+            remote_gen,
+            json.dumps(data),
+            str(settings.USER_CACHE_REDIS_TTL_SECONDS),
+        )
+    except Exception:
+        logger.debug("user cache redis set failed", exc_info=True)
+
+
+async def cache_user_async(user: User, generation: Generation) -> None:
+    """
+    回填用户缓存（async 版本，Redis 使用异步客户端）
+
+    Args:
+        user: 从数据库加载的用户对象
+        generation: 查询数据库之前 cache_generation_async 返回的代数
+    """
+    if not settings.USER_CACHE_ENABLED:
+        return
+
+    local_gen, remote_gen = generation
+    data = _snapshot(user)
+    _local_set(user.id, data, local_gen)
+    if remote_gen is None:
+        return
+    try:
+        await _async_redis().eval(
+            _SET_IF_CURRENT,
+            2,
+            _redis_key(user.id),
+            _gen_key(user.id),
+            remote_gen,
+            json.dumps(data),
+            str(settings.USER_CACHE_REDIS_TTL_SECONDS),
+        )
+    except Exception:
+        logger.debug("user cache redis set failed", exc_info=True)
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    使用户缓存失效
+
+    必须在用户数据的写事务提交之后调用。
+
+    Args:
+        user_id: 用户 ID
+    """
+    global _gen_counter, _gen_floor
+    with _lock:
+        _local.pop(user_id, None)
+        _gen_counter += 1
+        _local_gen[user_id] = _gen_counter
+        _local_gen.move_to_end(user_id)
+        while len(_local_gen) > settings.USER_CACHE_MAX_SIZE:
+            # 代数按失效顺序递增，最早的条目就是最小的代数
+            _, _gen_floor = _local_gen.popitem(last=False)
+    try:
+        # 代数键的过期时间不短于缓存 TTL，过期后重新从 0 开始也不会误判
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.incr(_gen_key(user_id))
+        pipe.expire(_gen_key(user_id), settings.USER_CACHE_REDIS_TTL_SECONDS * 2)
+        pipe.delete(_redis_key(user_id))
+        pipe.execute()
+    except Exception:
+        logger.debug("user cache redis delete failed", exc_info=True)
+
+
+def clear_local_cache() -> None:
+    """清空本进程的一级缓存（主要用于测试）"""
+    global _gen_counter, _gen_floor
+    with _lock:
+        _local.clear()
+        _local_gen.clear()
+        _gen_counter = _gen_floor = 0
@@ -1,40 +1,59 @@
 from __future__ import annotations
 
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy.pool import StaticPool
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, SQLModel, create_engine, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import get_db
+from app.api.deps import get_async_db, get_db
 from app.main import app
 from app.models import (
     EmojiTask,
     Order,
+    OutboxMessage,
     PointTransaction,
     Subscription,
     User,
     UserPoints,
+    UserStats,
 )
 
 
+def _enable_wal(dbapi_conn, _record):  # type: ignore[no-untyped-def]
+    # Sync and async engines share one SQLite file; WAL lets readers and a writer coexist.
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+
+
+@pytest.fixture(scope="session")
+def db_path(tmp_path_factory):  # type: ignore[no-untyped-def]
+    return tmp_path_factory.mktemp("db") / "test.db"
+
+
 @pytest.fixture(scope="session")
-def engine():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+def engine(db_path):  # type: ignore[no-untyped-def]
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _enable_wal)
     SQLModel.metadata.create_all(engine)
     return engine
 
 
+@pytest.fixture(scope="session")
+def async_engine(engine, db_path):  # type: ignore[no-untyped-def]  # noqa: ARG001
+    # Depends on `engine` so the schema exists before the async engine is used.
+    return create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+
+
 @pytest.fixture(scope="function")
 def db(engine) -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
         # Clean tables after each test (children first).
+        session.exec(delete(OutboxMessage))
+        session.exec(delete(UserStats))
         session.exec(delete(PointTransaction))
         session.exec(delete(EmojiTask))
         session.exec(delete(Order))
@@ -45,12 +64,17 @@ def db(engine) -> Generator[Session, None, None]:
 
 
 @pytest.fixture(scope="function")
-def client(engine) -> Generator[TestClient, None, None]:
+def client(engine, async_engine) -> Generator[TestClient, None, None]:
     def _override_get_db() -> Generator[Session, None, None]:
         with Session(engine) as session:
             yield session
 
+    async def _override_get_async_db() -> AsyncGenerator[AsyncSession, None]:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_async_db] = _override_get_async_db
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
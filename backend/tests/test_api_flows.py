@@ -1,21 +1,31 @@
 from __future__ import annotations
 
 from io import BytesIO
+import json
 import time
 
+import pytest
+
 from app import crud
 from app.core.config import settings
 from app.enums import PointTransactionType
+from app.services import outbox
 
 
 class _FakeRedis:
     def __init__(self) -> None:
         self.messages: list[tuple[str, dict[str, str]]] = []
 
-    def xadd(self, name: str, fields: dict[str, str]) -> str:  # type: ignore[override]
+    def xadd(self, name: str, fields: dict[str, str], **_options: object) -> str:  # type: ignore[override]
         self.messages.append((name, fields))
         return "1-0"
 
+    def pipeline(self, transaction: bool = True) -> _FakeRedis:  # noqa: ARG002
+        return self
+
+    def execute(self) -> list[str]:
+        return []
+
 
 def _login(client, device_id: str = "device_test_1") -> tuple[str, int]:
     r = client.post("/api/v1/auth/login", json={"device_id": device_id})
@@ -39,9 +49,8 @@ def test_auth_login_and_profile(client):
     assert body["data"]["points_balance"] == 0
 
 
-def test_points_balance_and_transactions(client, db, monkeypatch):
+def test_points_balance_and_transactions(client, db):
     fake = _FakeRedis()
-    monkeypatch.setattr("app.api.routes.emoji.get_redis", lambda: fake)
 
     token, user_id = _login(client, device_id="device_points_1")
     headers = {"Authorization": f"Bearer {token}"}
@@ -73,7 +82,13 @@ def test_points_balance_and_transactions(client, db, monkeypatch):
     body = r.json()
     assert body["code"] == 0
     assert body["data"]["points_cost"] == 200
+    assert body["data"]["status"] == "pending"
+
+    # 任务通过发件箱入队，由 relay 发布到 Redis Streams
+    assert outbox.relay_batch(session=db, rds=fake, batch_size=100) == 1
     assert fake.messages and fake.messages[0][0] == "emoji_tasks"
+    assert fake.messages[0][1]["task_id"] == str(body["data"]["id"])
+    assert outbox.relay_batch(session=db, rds=fake, batch_size=100) == 0
 
     r = client.get("/api/v1/points/balance", headers=headers)
     assert r.status_code == 200
@@ -87,10 +102,7 @@ def test_points_balance_and_transactions(client, db, monkeypatch):
     assert tx["data"][0]["type"] == "consume"
 
 
-def test_emoji_task_status_and_history(client, db, monkeypatch):
-    fake = _FakeRedis()
-    monkeypatch.setattr("app.api.routes.emoji.get_redis", lambda: fake)
-
+def test_emoji_task_status_and_history(client, db):
     token, user_id = _login(client, device_id="device_history_1")
     headers = {"Authorization": f"Bearer {token}"}
 
@@ -125,10 +137,62 @@ def test_emoji_task_status_and_history(client, db, monkeypatch):
     assert r.status_code == 404
 
 
-def test_emoji_create_insufficient_points(client, monkeypatch):
-    fake = _FakeRedis()
-    monkeypatch.setattr("app.api.routes.emoji.get_redis", lambda: fake)
+class _FakeKV:
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    async def set(self, key: str, value: str, ex: int | None = None, nx: bool = False) -> bool:  # noqa: ARG002
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+
+def test_emoji_task_status_served_from_snapshot(client, db, monkeypatch):
+    from app.services import task_events
+
+    kv = _FakeKV()
+    monkeypatch.setattr(task_events, "get_async_redis", lambda: kv)
+    monkeypatch.setattr(task_events, "get_redis", lambda: kv)
+    token, user_id = _login(client, device_id="device_snapshot_1")
+    headers = {"Authorization": f"Bearer {token}"}
+    task = crud.create_emoji_task(
+        session=db,
+        user_id=user_id,
+        image_url="https://example.com/a.jpg",
+        driven_id="emoji_001",
+        detect_result=None,
+        points_cost=200,
+    )
+    key = task_events.snapshot_key(task.id)
+
+    # Miss: read from the DB and backfill the snapshot.
+    r = client.get(f"/api/v1/emoji/task/{task.id}", headers=headers)
+    assert r.json()["data"]["status"] == "pending"
+    assert json.loads(kv.data[key])["user_id"] == user_id
+
+    # Hit: the worker's snapshot is served without touching the DB row.
+    kv.data[key] = json.dumps({**json.loads(kv.data[key]), "status": "completed", "result_url": "https://example.com/r.mp4"})
+    data = client.get(f"/api/v1/emoji/task/{task.id}", headers=headers).json()["data"]
+    assert (data["status"], data["result_url"]) == ("completed", "https://example.com/r.mp4")
 
+    # Ownership is checked against the cached user_id.
+    other_token, _ = _login(client, device_id="device_snapshot_2")
+    r = client.get(f"/api/v1/emoji/task/{task.id}", headers={"Authorization": f"Bearer {other_token}"})
+    assert r.status_code == 404
+
+    assert client.delete(f"/api/v1/emoji/task/{task.id}", headers=headers).status_code == 200
+    assert key not in kv.data
+    assert client.get(f"/api/v1/emoji/task/{task.id}", headers=headers).status_code == 404
+
+
+def test_emoji_create_insufficient_points(client, db):
     token, _ = _login(client, device_id="device_low_points")
     headers = {"Authorization": f"Bearer {token}"}
 
@@ -140,6 +204,8 @@ def test_emoji_create_insufficient_points(client, monkeypatch):
     assert r.status_code == 400
     body = r.json()
     assert body["code"] == 402001
+    # 扣费失败时不会留下任务或发件箱消息
+    assert outbox.relay_batch(session=db, rds=_FakeRedis(), batch_size=100) == 0
 
 
 def test_config_endpoint(client):
@@ -168,6 +234,90 @@ def test_emoji_upload_and_detect(client, monkeypatch):
     assert detect["face_bbox"] is not None
 
 
+def test_emoji_detect_rejects_large_file(client, monkeypatch):
+    token, _ = _login(client, device_id="device_upload_big")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    uploads = []
+    monkeypatch.setattr("app.api.routes.emoji.MAX_FILE_SIZE", 8)
+    monkeypatch.setattr("app.api.routes.emoji.upload_file", lambda **k: uploads.append(k))
+    files = {"file": ("big.jpg", BytesIO(b"0123456789"), "image/jpeg")}
+    r = client.post("/api/v1/emoji/detect", headers=headers, files=files)
+    assert r.status_code == 400
+    assert r.json()["code"] == 400003
+    assert uploads == []
+
+
+def test_emoji_presigned_upload_flow(client, monkeypatch):
+    token, user_id = _login(client, device_id="device_presign_1")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    monkeypatch.setattr(settings, "OSS_PUBLIC_BASE_URL", "https://cdn.example.com")
+    signed = []
+
+    def fake_presign(**k):  # type: ignore[no-untyped-def]
+        signed.append(k)
+        return "https://oss.example.com", {"key": k["key"], "Content-Type": k["content_type"]}
+
+    monkeypatch.setattr("app.api.routes.emoji.presign_upload", fake_presign)
+    r = client.post(
+        "/api/v1/emoji/upload/presign",
+        headers=headers,
+        json={"filename": "face.png", "content_type": "image/png"},
+    )
+    assert r.status_code == 200
+    data = r.json()["data"]
+    key = data["key"]
+    assert key.startswith(f"{settings.OSS_DIR_PREFIX}/{user_id}/") and key.endswith(".png")
+    assert data["method"] == "POST"
+    assert data["fields"] == {"key": key, "Content-Type": "image/png"}
+    assert data["expires_in"] == settings.OSS_UPLOAD_EXPIRE_SECONDS
+    assert signed[-1]["max_size"] == 10 * 1024 * 1024
+
+    # 未提供 MIME 类型时按扩展名确定
+    r = client.post("/api/v1/emoji/upload/presign", headers=headers, json={"filename": "face.jpg"})
+    assert r.json()["data"]["fields"]["Content-Type"] == "image/jpeg"
+
+    r = client.post(
+        "/api/v1/emoji/upload/presign", headers=headers, json={"filename": "face.gif"}
+    )
+    assert r.json()["code"] == 400002
+    r = client.post(
+        "/api/v1/emoji/upload/presign",
+        headers=headers,
+        json={"filename": "face.png", "content_type": "text/html"},
+    )
+    assert r.json()["code"] == 400002
+
+    sizes = {key: 1024}
+    deleted = []
+    monkeypatch.setattr("app.api.routes.emoji.get_object_size", lambda **k: sizes.get(k["key"]))
+    monkeypatch.setattr("app.api.routes.emoji.delete_object", lambda **k: deleted.append(k["key"]))
+
+    r = client.post("/api/v1/emoji/upload/complete", headers=headers, json={"key": key})
+    assert r.status_code == 200
+    detect = r.json()["data"]
+    assert detect["image_url"] == f"https://cdn.example.com/{key}"
+    assert detect["passed"] is True
+
+    # 其他用户目录下的 key 被拒绝
+    other = f"{settings.OSS_DIR_PREFIX}/{user_id + 1}/x.png"
+    r = client.post("/api/v1/emoji/upload/complete", headers=headers, json={"key": other})
+    assert r.json()["code"] == 400004
+
+    # 对象不存在
+    missing = f"{settings.OSS_DIR_PREFIX}/{user_id}/missing.png"
+    r = client.post("/api/v1/emoji/upload/complete", headers=headers, json={"key": missing})
+    assert r.status_code == 404
+    assert r.json()["code"] == 404102
+
+    # 超过大小限制的对象会被删除
+    sizes[key] = 11 * 1024 * 1024
+    r = client.post("/api/v1/emoji/upload/complete", headers=headers, json={"key": key})
+    assert r.json()["code"] == 400003
+    assert deleted == [key]
+
+
 def test_subscription_webhook_updates_vip(client):
     token, user_id = _login(client, device_id="device_sub_1")
     headers = {"Authorization": f"Bearer {token}"}
@@ -336,6 +486,205 @@ def test_order_create_get_list(client):
     assert r.json()["data"]["count"] >= 1
 
 
+def test_list_cursor_pagination(client):
+    token, _ = _login(client, device_id="device_cursor_1")
+    headers = {"Authorization": f"Bearer {token}"}
+    created = []
+    for i in range(5):
+        r = client.post(
+            "/api/v1/order/create",
+            headers=headers,
+            json={"product_type": "points_pack", "product_id": f"p_{i}", "quantity": 1, "amount": "1", "currency": "USD"},
+        )
+        created.append(r.json()["data"]["order_no"])
+
+    # Walk every page with the opaque cursor: newest first, count from the counters.
+    seen, cursor = [], None
+    while True:
+        url = "/api/v1/order/list?page_size=2" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url, headers=headers).json()["data"]
+        seen += [o["order_no"] for o in data["data"]]
+        assert data["count"] == 5
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == created[::-1]
+
+    # page/page_size still work and also hand out a cursor.
+    data = client.get("/api/v1/order/list?page=2&page_size=2", headers=headers).json()["data"]
+    assert [o["order_no"] for o in data["data"]] == created[::-1][2:4]
+    assert data["count"] == 5 and data["next_cursor"]
+    data = client.get(f"/api/v1/order/list?cursor={data['next_cursor']}&with_count=false", headers=headers).json()["data"]
+    assert [o["order_no"] for o in data["data"]] == created[:1] and data["count"] is None
+
+    r = client.get("/api/v1/emoji/history?cursor=not-a-cursor", headers=headers)
+    assert r.status_code == 400 and r.json()["code"] == 400010
+
+
+def test_list_counts_come_from_user_stats(client, db):
+    from sqlalchemy import event
+    from sqlmodel import select
+
+    from app.models import EmojiTask, Order, PointTransaction, UserStats
+
+    token, user_id = _login(client, device_id="device_stats_1")
+    headers = {"Authorization": f"Bearer {token}"}
+    crud.change_points(
+        session=db, user_id=user_id, delta=1000, tx_type=PointTransactionType.purchase
+    )
+    task_ids = []
+    for _ in range(2):
+        r = client.post(
+            "/api/v1/emoji/create",
+            headers=headers,
+            json={"image_url": "https://example.com/a.jpg", "driven_id": "emoji_001"},
+        )
+        task_ids.append(r.json()["data"]["id"])
+    client.post(
+        "/api/v1/order/create",
+        headers=headers,
+        json={"product_type": "points_pack", "product_id": "p", "quantity": 1, "amount": "1", "currency": "USD"},
+    )
+    assert client.delete(f"/api/v1/emoji/task/{task_ids[0]}", headers=headers).status_code == 200
+
+    db.expire_all()
+    stats = db.get(UserStats, user_id)
+    assert (stats.emoji_tasks, stats.point_transactions, stats.orders) == (1, 3, 1)
+
+    # An existing counter row is bumped without counting rows.
+    statements: list[str] = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        crud.bump_user_stats(session=db, user_id=user_id, orders=1)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    db.rollback()
+    assert statements and not any("count(" in s.lower() for s in statements)
+    for model in (EmojiTask, PointTransaction, Order):
+        actual = len(db.exec(select(model).where(model.user_id == user_id)).all())
+        assert crud.get_user_count(session=db, user_id=user_id, model=model) == actual
+
+    assert client.get("/api/v1/emoji/history", headers=headers).json()["data"]["count"] == 1
+    assert client.get("/api/v1/points/transactions", headers=headers).json()["data"]["count"] == 3
+
+    # Users without a counter row fall back to counting.
+    db.delete(stats)
+    db.commit()
+    assert crud.get_user_count(session=db, user_id=user_id, model=PointTransaction) == 3
+
+    # A missing counter row is seeded from the real counts, not from the delta
+    # (a delete must not leave emoji_tasks at -1).
+    assert client.delete(f"/api/v1/emoji/task/{task_ids[1]}", headers=headers).status_code == 200
+    db.expire_all()
+    stats = db.get(UserStats, user_id)
+    assert (stats.emoji_tasks, stats.point_transactions, stats.orders) == (0, 3, 1)
+    db.delete(stats)
+    db.commit()
+    crud.change_points(session=db, user_id=user_id, delta=1, tx_type=PointTransactionType.purchase)
+    db.expire_all()
+    stats = db.get(UserStats, user_id)
+    assert (stats.emoji_tasks, stats.point_transactions, stats.orders) == (0, 4, 1)
+
+
+class _FakePubSub:
+    def __init__(self, messages: list[dict]) -> None:
+        self.messages = [{"type": "message", "data": json.dumps(m)} for m in messages]
+        self.channels: list[str] = []
+        self.closed = False
+
+    async def subscribe(self, channel: str) -> None:
+        self.channels.append(channel)
+
+    async def get_message(self, timeout: float = 0.0):  # noqa: ARG002
+        return self.messages.pop(0) if self.messages else None
+
+    async def unsubscribe(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+    def pubsub(self, **_kwargs) -> _FakePubSub:
+        return self
+
+
+def test_emoji_task_events_stream(client, db, monkeypatch):
+    from app.enums import EmojiTaskStatus
+    from app.services import task_events
+
+    token, user_id = _login(client, device_id="device_sse_1")
+    headers = {"Authorization": f"Bearer {token}"}
+    task = crud.create_emoji_task(
+        session=db,
+        user_id=user_id,
+        image_url="https://example.com/a.jpg",
+        driven_id="emoji_001",
+        detect_result=None,
+        points_cost=200,
+    )
+    snap = task_events.task_snapshot(task)
+    other = {**snap, "id": task.id + 1, "status": "completed"}
+    pubsub = _FakePubSub(
+        [
+            {**snap, "status": "processing"},
+            {**snap, "status": "processing"},  # duplicate: skipped
+            other,  # another task of the same user: skipped
+            {**snap, "status": "completed", "result_url": "https://example.com/r.mp4"},
+        ]
+    )
+    pubsub.messages.insert(1, None)  # idle tick -> keepalive comment
+    monkeypatch.setattr(task_events, "get_async_redis", lambda: pubsub)
+
+    with client.stream("GET", f"/api/v1/emoji/task/{task.id}/events", headers=headers) as r:
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/event-stream")
+        body = "".join(r.iter_text())
+
+    events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    assert [e["status"] for e in events] == ["pending", "processing", "completed"]
+    assert events[-1]["result_url"] == "https://example.com/r.mp4"
+    assert ": keepalive" in body
+    assert pubsub.channels == [task_events.task_channel(user_id)] and pubsub.closed
+
+    # Finished tasks get their final state and the stream ends; unknown tasks 404.
+    task.status = EmojiTaskStatus.failed
+    db.add(task)
+    db.commit()
+    monkeypatch.undo()  # real client, no Redis here: snapshot only
+    r = client.get(f"/api/v1/emoji/task/{task.id}/events", headers=headers)
+    assert r.text.count("event: task") == 1 and '"status": "failed"' in r.text
+    r = client.get("/api/v1/emoji/task/1/events", headers=headers)
+    assert r.status_code == 404
+
+
+def test_dashscope_callback_forwards_poll_hint(client, monkeypatch):
+    from app.services import task_events
+
+    url = "/api/v1/emoji/callback/dashscope"
+    body = {"request_id": "r1", "output": {"task_id": "remote_9", "task_status": "SUCCEEDED"}}
+    assert client.post(url, json=body).status_code == 404  # disabled by default
+
+    published: list[tuple[str, str]] = []
+    fake = type("R", (), {"publish": lambda _self, ch, msg: published.append((ch, msg))})()
+    monkeypatch.setattr(task_events, "get_redis", lambda: fake)
+    monkeypatch.setattr(settings, "EMOJI_CALLBACK_ENABLED", True)
+    monkeypatch.setattr(settings, "EMOJI_CALLBACK_SECRET", "s3cret")
+
+    assert client.post(url, json=body).status_code == 401
+    r = client.post(url, json=body, headers={"Authorization": "Bearer s3cret"})
+    assert r.status_code == 200
+    assert published == [(task_events.POLL_HINT_CHANNEL, "remote_9")]
+    r = client.post(url, json={"output": {}}, headers={"Authorization": "s3cret"})
+    assert r.status_code == 400
+
+    # Without a secret every request is rejected, and the setting can't be enabled alone.
+    monkeypatch.setattr(settings, "EMOJI_CALLBACK_SECRET", None)
+    assert client.post(url, json=body, headers={"Authorization": "Bearer "}).status_code == 401
+    with pytest.raises(ValueError, match="EMOJI_CALLBACK_SECRET"):
+        type(settings)(EMOJI_CALLBACK_ENABLED=True, EMOJI_CALLBACK_SECRET=None)
+
+
 def test_auth_required(client):
     r = client.get("/api/v1/user/profile")
     assert r.status_code in (401, 403)
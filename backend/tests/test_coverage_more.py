@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import hashlib
+import hmac
 import json
 import time
 
@@ -23,10 +26,13 @@ from app.integrations.aliyun_emoji import AliyunEmojiClient
 from app.integrations.oss import (
     _build_host,
     build_object_url,
+    get_object_size,
+    presign_upload,
+    upload_file,
     upload_from_url,
 )
 from app.models import UserPoints
-from app.services import config_service
+from app.services import config_service, user_cache
 
 
 def test_login_twice_same_user(client):
@@ -318,8 +324,8 @@ def test_oss_upload_from_url(monkeypatch, tmp_path):
         def __init__(self):  # type: ignore[no-untyped-def]
             self.calls = []
 
-        def put_object_from_file(self, key, filename, headers=None):  # type: ignore[no-untyped-def]
-            self.calls.append((key, filename, headers))
+        def put_object(self, key, data, headers=None):  # type: ignore[no-untyped-def]
+            self.calls.append((key, data, headers))
 
     fake_bucket = FakeBucket()
     monkeypatch.setattr(oss_mod, "_get_bucket", lambda: fake_bucket)
@@ -328,7 +334,7 @@ def test_oss_upload_from_url(monkeypatch, tmp_path):
         def raise_for_status(self):  # type: ignore[no-untyped-def]
             return None
 
-        def iter_bytes(self):  # type: ignore[no-untyped-def]
+        def iter_bytes(self, chunk_size=None):  # type: ignore[no-untyped-def]
             yield b"abc"
 
     class _StreamCtx:
@@ -361,3 +367,649 @@ def test_crud_update_user_vip(db):
     crud.update_user_vip(session=db, user_id=user.id, is_vip=True, vip_type=str(VipType.weekly), vip_expire_time=None)
     db.refresh(user)
     assert user.is_vip is True
+
+
+def test_user_cache_hit_and_profile_update_invalidates(client):
+    r = client.post("/api/v1/auth/login", json={"device_id": "device_cache_1"})
+    token = r.json()["data"]["access_token"]
+    user_id = r.json()["data"]["user"]["id"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    r = client.get("/api/v1/user/profile", headers=headers)
+    assert r.status_code == 200
+    cached = user_cache.get_cached_user(user_id)
+    assert cached is not None and cached.id == user_id
+
+    # Served from cache: the detached user must still be updatable.
+    r = client.put("/api/v1/user/profile", headers=headers, json={"nickname": " chef "})
+    assert r.status_code == 200
+    assert r.json()["data"]["nickname"] == "chef"
+
+    r = client.get("/api/v1/user/profile", headers=headers)
+    assert r.json()["data"]["nickname"] == "chef"
+
+
+def test_user_cache_lru_eviction_and_ttl(monkeypatch):
+    from app.models import User
+
+    user_cache.clear_local_cache()
+    monkeypatch.setattr(settings, "USER_CACHE_MAX_SIZE", 2)
+
+    def redis_down():  # type: ignore[no-untyped-def]
+        raise RuntimeError("redis down")
+
+    monkeypatch.setattr(user_cache, "get_redis", redis_down)
+
+    users = [User(device_id=f"lru_{i}") for i in range(3)]
+    for u in users:
+        user_cache.cache_user(u, (0, None))
+    assert user_cache.get_cached_user(users[0].id) is None  # evicted
+    assert user_cache.get_cached_user(users[2].id) is not None
+
+    monkeypatch.setattr(settings, "USER_CACHE_LOCAL_TTL_SECONDS", -1)
+    user_cache.cache_user(users[1], (0, None))
+    assert user_cache.get_cached_user(users[1].id) is None  # expired
+
+    monkeypatch.setattr(settings, "USER_CACHE_ENABLED", False)
+    assert user_cache.get_cached_user(users[2].id) is None
+
+
+def test_user_cache_backfill_skipped_after_concurrent_invalidation(monkeypatch):
+    from app.models import User
+
+    class GenRedis:
+        def __init__(self):  # type: ignore[no-untyped-def]
+            self.kv: dict[str, str] = {}
+
+        def get(self, key):  # type: ignore[no-untyped-def]
+            return self.kv.get(key)
+
+        def eval(self, _script, _numkeys, key, gen_key, gen, value, _ttl):  # type: ignore[no-untyped-def]
+            if self.kv.get(gen_key, "0") != gen:
+                return 0
+            self.kv[key] = value
+            return 1
+
+        def pipeline(self, transaction=True):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self
+
+        def incr(self, key):  # type: ignore[no-untyped-def]
+            self.kv[key] = str(int(self.kv.get(key, "0")) + 1)
+
+        def expire(self, key, ttl):  # type: ignore[no-untyped-def]
+            pass
+
+        def delete(self, key):  # type: ignore[no-untyped-def]
+            self.kv.pop(key, None)
+
+        def execute(self):  # type: ignore[no-untyped-def]
+            return []
+
+    rds = GenRedis()
+    monkeypatch.setattr(user_cache, "get_redis", lambda: rds)
+    user_cache.clear_local_cache()
+    user = User(device_id="gen_race")
+
+    # Reader misses and reads the row; a writer commits and invalidates meanwhile.
+    generation = user_cache.cache_generation(user.id)
+    user_cache.invalidate_user(user.id)
+    user_cache.cache_user(user, generation)  # stale backfill is dropped
+    assert user_cache.get_cached_user(user.id) is None
+
+    user_cache.cache_user(user, user_cache.cache_generation(user.id))
+    assert user_cache.get_cached_user(user.id) is not None
+    user_cache.clear_local_cache()
+    assert user_cache.get_cached_user(user.id) is not None  # from Redis
+
+
+def test_user_cache_local_generations_are_bounded(monkeypatch):
+    from app.models import User
+
+    def redis_down():  # type: ignore[no-untyped-def]
+        raise RuntimeError("redis down")
+
+    monkeypatch.setattr(user_cache, "get_redis", redis_down)
+    monkeypatch.setattr(settings, "USER_CACHE_MAX_SIZE", 2)
+    user_cache.clear_local_cache()
+    user = User(device_id="gen_bounded")
+
+    # The reader's generation survives the writer's entry being evicted.
+    generation = user_cache.cache_generation(user.id)
+    user_cache.invalidate_user(user.id)
+    for other in range(3):
+        user_cache.invalidate_user(-1 - other)
+    assert len(user_cache._local_gen) == 2
+    user_cache.cache_user(user, generation)
+    assert user_cache.get_cached_user(user.id) is None
+
+    user_cache.cache_user(user, user_cache.cache_generation(user.id))
+    assert user_cache.get_cached_user(user.id) is not None
+    user_cache.clear_local_cache()
+
+
+def test_aliyun_emoji_client_async_paths(monkeypatch):
+    client = AliyunEmojiClient()
+    client._mock = False  # type: ignore[attr-defined]
+    client._api_key = "k"  # type: ignore[attr-defined]
+
+    queue: list[dict] = [
+        {"output": {"code": "NoFace", "message": "no face"}},
+        {"output": {"task_id": "t2", "task_status": "PENDING"}},
+        {"output": {"task_status": "RUNNING"}, "request_id": "r2"},
+    ]
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=queue.pop(0))
+
+    real_async_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient", lambda **kw: real_async_client(transport=httpx.MockTransport(handler), **kw)
+    )
+
+    async def run() -> None:
+        det = await client.detect_async(image_url="https://example.com/a.jpg")
+        assert det.passed is False
+        assert det.error_code == "NoFace"
+        created = await client.create_task_async(
+            image_url="https://example.com/a.jpg",
+            driven_id="emoji_001",
+            face_bbox=[1, 2, 3, 4],
+            ext_bbox=[1, 2, 3, 5],
+        )
+        assert created.task_id == "t2"
+        task = await client.get_task_async(task_id="t2")
+        assert task.task_status == "RUNNING"
+        assert task.request_id == "r2"
+        await client.aclose()
+
+    asyncio.run(run())
+    assert not queue
+
+
+def test_aliyun_emoji_client_pooled_retries(monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(settings, "DASHSCOPE_RETRY_MAX_BACKOFF_SECONDS", 0)
+
+    client = AliyunEmojiClient()
+    client._mock = False  # type: ignore[attr-defined]
+    client._api_key = "k"  # type: ignore[attr-defined]
+
+    responses = [
+        httpx.Response(503),
+        httpx.Response(429),
+        httpx.Response(200, json={"output": {"task_status": "SUCCEEDED", "video_url": "https://e.com/v.mp4"}}),
+        # create_task is not idempotent: a 500 must not be retried.
+        httpx.Response(500),
+    ]
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return responses.pop(0)
+
+    real_client = httpx.Client
+    monkeypatch.setattr(httpx, "Client", lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw))
+
+    client.open()
+    pooled = client._client  # type: ignore[attr-defined]
+    task = client.get_task(task_id="t1")
+    assert task.video_url == "https://e.com/v.mp4"
+    assert client._client is pooled  # type: ignore[attr-defined]
+    assert len(seen) == 3
+
+    with pytest.raises(AppError) as exc:
+        client.create_task(image_url="https://e.com/a.jpg", driven_id="d", face_bbox=[1], ext_bbox=[2])
+    assert exc.value.code == 502201
+    assert len(seen) == 4
+
+    asyncio.run(client.aclose())
+    assert client._client is None  # type: ignore[attr-defined]
+
+
+class _FakeMultipartBucket:
+    def __init__(self):  # type: ignore[no-untyped-def]
+        self.objects = {}
+        self.parts = []
+        self.completed = None
+        self.aborted = False
+
+    def put_object(self, key, data, headers=None):  # type: ignore[no-untyped-def]
+        self.objects[key] = data
+
+    def init_multipart_upload(self, key, headers=None):  # type: ignore[no-untyped-def]
+        class _Init:
+            upload_id = "up1"
+
+        return _Init()
+
+    def upload_part(self, key, upload_id, part_number, data):  # type: ignore[no-untyped-def]
+        self.parts.append((part_number, data))
+
+        class _Part:
+            etag = f"etag{part_number}"
+
+        return _Part()
+
+    def complete_multipart_upload(self, key, upload_id, parts):  # type: ignore[no-untyped-def]
+        self.completed = [(p.part_number, p.etag) for p in parts]
+
+    def abort_multipart_upload(self, key, upload_id):  # type: ignore[no-untyped-def]
+        self.aborted = True
+
+
+def test_oss_upload_file_streams_multipart(monkeypatch):
+    import io
+
+    monkeypatch.setattr(settings, "OSS_PUBLIC_BASE_URL", "https://cdn.example.com")
+    monkeypatch.setattr(settings, "OSS_MULTIPART_PART_SIZE", 4)
+    bucket = _FakeMultipartBucket()
+    monkeypatch.setattr(oss_mod, "_get_bucket", lambda: bucket)
+
+    # 单个分片以内：直接 PUT
+    url = upload_file(file=io.BytesIO(b"abc"), key="u/small.jpg", content_type="image/jpeg")
+    assert url == "https://cdn.example.com/u/small.jpg"
+    assert bucket.objects["u/small.jpg"] == b"abc"
+
+    # 多个分片：分片上传
+    upload_file(file=io.BytesIO(b"0123456789"), key="u/big.jpg", max_size=10)
+    assert bucket.parts == [(1, b"0123"), (2, b"4567"), (3, b"89")]
+    assert bucket.completed == [(1, "etag1"), (2, "etag2"), (3, "etag3")]
+    assert bucket.aborted is False
+
+    # 超过大小限制：中止分片上传
+    bucket = _FakeMultipartBucket()
+    monkeypatch.setattr(oss_mod, "_get_bucket", lambda: bucket)
+    with pytest.raises(AppError) as exc:
+        upload_file(file=io.BytesIO(b"0123456789"), key="u/huge.jpg", max_size=9)
+    assert exc.value.code == 400003
+    assert bucket.aborted is True
+    assert bucket.completed is None
+
+
+def test_oss_presign_upload_and_object_size(monkeypatch):
+    import oss2
+
+    monkeypatch.setattr(settings, "OSS_ENDPOINT", "oss-cn-hangzhou.aliyuncs.com")
+    monkeypatch.setattr(settings, "OSS_BUCKET", "ai-pic")
+    monkeypatch.setattr(settings, "OSS_ACCESS_KEY_ID", "ak")
+    monkeypatch.setattr(settings, "OSS_ACCESS_KEY_SECRET", "sk")
+    monkeypatch.setattr(settings, "OSS_OBJECT_ACL", "public-read")
+
+    url, fields = presign_upload(key="uploads/1/a.png", content_type="image/png", max_size=100)
+    assert url == "https://ai-pic.oss-cn-hangzhou.aliyuncs.com"
+    assert fields["key"] == "uploads/1/a.png" and fields["OSSAccessKeyId"] == "ak"
+    assert fields["x-oss-object-acl"] == "public-read" and fields["Content-Type"] == "image/png"
+    policy = json.loads(base64.b64decode(fields["policy"]))
+    assert ["content-length-range", 1, 100] in policy["conditions"]
+    assert ["eq", "$key", "uploads/1/a.png"] in policy["conditions"]
+    assert ["eq", "$Content-Type", "image/png"] in policy["conditions"]
+    assert ["eq", "$x-oss-object-acl", "public-read"] in policy["conditions"]
+    digest = hmac.new(b"sk", fields["policy"].encode(), hashlib.sha1).digest()
+    assert fields["Signature"] == base64.b64encode(digest).decode()
+
+    class FakeBucket:
+        def head_object(self, key):  # type: ignore[no-untyped-def]
+            if key == "missing":
+                raise oss2.exceptions.NotFound(404, {}, b"", {})
+
+            class _Meta:
+                content_length = 42
+
+            return _Meta()
+
+    monkeypatch.setattr(oss_mod, "_get_bucket", lambda: FakeBucket())
+    assert get_object_size(key="uploads/1/a.png") == 42
+    assert get_object_size(key="missing") is None
+
+
+def test_oss_upload_from_url_relays_parts_in_parallel(monkeypatch):
+    monkeypatch.setattr(settings, "OSS_PUBLIC_BASE_URL", "https://cdn.example.com")
+    monkeypatch.setattr(settings, "OSS_MULTIPART_PART_SIZE", 4)
+    monkeypatch.setattr(settings, "OSS_MULTIPART_CONCURRENCY", 2)
+    bucket = _FakeMultipartBucket()
+    monkeypatch.setattr(oss_mod, "_get_bucket", lambda: bucket)
+
+    body = b"0123456789abcdefghij"
+    with httpx.Client(transport=httpx.MockTransport(lambda req: httpx.Response(200, content=body))) as c:
+        monkeypatch.setattr(httpx, "stream", c.stream)
+        url = upload_from_url(url="https://example.com/v.mp4", key="results/1/2.mp4")
+
+    assert url == "https://cdn.example.com/results/1/2.mp4"
+    assert sorted(bucket.parts) == [(1, b"0123"), (2, b"4567"), (3, b"89ab"), (4, b"cdef"), (5, b"ghij")]
+    assert bucket.completed == [(i, f"etag{i}") for i in range(1, 6)]
+
+    # 分片上传失败：中止分片上传
+    def broken_upload(*_a, **_k):  # type: ignore[no-untyped-def]
+        raise RuntimeError("boom")
+
+    bucket = _FakeMultipartBucket()
+    monkeypatch.setattr(bucket, "upload_part", broken_upload)
+    monkeypatch.setattr(oss_mod, "_get_bucket", lambda: bucket)
+    with httpx.Client(transport=httpx.MockTransport(lambda req: httpx.Response(200, content=body))) as c:
+        monkeypatch.setattr(httpx, "stream", c.stream)
+        with pytest.raises(RuntimeError):
+            upload_from_url(url="https://example.com/v.mp4", key="results/1/3.mp4")
+    assert bucket.aborted is True
+
+
+def test_db_pool_instrumentation(client, tmp_path, monkeypatch):
+    import sqlalchemy.exc
+    from sqlalchemy import create_engine, text
+
+    assert core_db.engine.pool.size() == settings.DB_POOL_SIZE
+    kwargs = core_db._engine_kwargs()
+    assert kwargs["pool_pre_ping"] is settings.DB_POOL_PRE_PING
+    assert "statement_timeout" in kwargs["connect_args"]["options"]
+
+    eng = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=core_db.InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    monkeypatch.setattr(settings, "DB_POOL_SLOW_CHECKOUT_SECONDS", 0)
+    c1 = eng.connect()
+    c2 = eng.connect()  # 溢出连接
+    c1.execute(text("select 1"))
+    with pytest.raises(sqlalchemy.exc.TimeoutError):
+        eng.connect()  # 连接池耗尽
+    stats = core_db.get_pool_stats(eng)
+    assert stats["checked_out"] == 2
+    assert stats["overflow"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["overflow_checkouts"] == 1
+    assert stats["timeouts"] == 1
+    c1.close()
+    c2.close()
+    eng.dispose()
+
+    assert core_db.async_engine.pool.size() == settings.DB_ASYNC_POOL_SIZE
+
+    # 未配置运维令牌时拒绝访问，令牌错误也拒绝
+    assert client.get("/api/v1/utils/db-pool/").status_code == 401
+    monkeypatch.setattr(settings, "OPS_API_TOKEN", "ops-token")
+    r = client.get("/api/v1/utils/db-pool/", headers={"Authorization": "Bearer wrong"})
+    assert r.status_code == 401
+    r = client.get("/api/v1/utils/db-pool/", headers={"Authorization": "Bearer ops-token"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["engine"]["pool"] == "InstrumentedQueuePool"
+    assert body["async_engine"]["pool"] == "InstrumentedAsyncQueuePool"
+
+
+@pytest.mark.usefixtures("db")
+def test_async_crud_paths(async_engine):
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from app.enums import PointTransactionType
+
+    async def run():  # type: ignore[no-untyped-def]
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            user = await crud.get_or_create_user_by_device_id_async(
+                session=session, device_id="device_async_crud"
+            )
+            again = await crud.get_or_create_user_by_device_id_async(
+                session=session, device_id="device_async_crud"
+            )
+            assert again.id == user.id
+            user_id = user.id
+
+            points = await crud.change_points_async(
+                session=session, user_id=user_id, delta=300, tx_type=PointTransactionType.purchase
+            )
+            assert points.balance == 300
+            with pytest.raises(AppError):
+                await crud.change_points_async(
+                    session=session,
+                    user_id=user_id,
+                    delta=-500,
+                    tx_type=PointTransactionType.consume,
+                )
+            await session.rollback()
+
+            # 积分账户不存在时自动创建
+            orphan = await crud.get_user_points_async(session=session, user_id=user_id + 1)
+            assert orphan.balance == 0
+
+            task = await crud.create_emoji_task_async(
+                session=session,
+                user_id=user_id,
+                image_url="https://example.com/a.jpg",
+                driven_id="emoji_001",
+                detect_result=None,
+                points_cost=200,
+            )
+            found = await crud.get_user_emoji_task_async(
+                session=session, user_id=user_id, task_id=task.id
+            )
+            assert found is not None
+            other = await crud.get_user_emoji_task_async(
+                session=session, user_id=user_id + 1, task_id=task.id
+            )
+            assert other is None
+
+    asyncio.run(run())
+
+
+def test_async_current_user_rejects_unknown_user(client):
+    from datetime import timedelta
+
+    from app.core import security
+
+    token = security.create_access_token(999_999_999, expires_delta=timedelta(minutes=5))
+    r = client.get("/api/v1/points/balance", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 401
+
+
+def test_change_points_single_statement(db):
+    from sqlalchemy.dialects import postgresql
+
+    from app.crud.points import _debit_statements
+    from app.enums import PointTransactionType
+    from app.models import PointTransaction
+
+    # PostgreSQL：条件更新 + 流水插入是一条 CTE 语句
+    stmt, tx = _debit_statements(
+        dialect="postgresql",
+        user_id=1,
+        delta=-200,
+        tx_type=PointTransactionType.consume,
+        task_type="emoji",
+        order_no=None,
+        reward_week=None,
+    )
+    assert tx is None
+    sql = str(stmt.compile(dialect=postgresql.psycopg.dialect()))
+    assert sql.startswith("WITH upd AS")
+    assert "INSERT INTO point_transactions" in sql
+    assert "INSERT INTO user_stats" in sql and "ON CONFLICT (user_id) DO UPDATE" in sql
+    # 已有计数器行只做主键更新，count(*) 只在行不存在时执行
+    assert "UPDATE user_stats SET point_transactions" in sql and "WHERE NOT (EXISTS" in sql
+    assert "user_points.balance +" in sql and ">=" in sql
+
+    # 积分账户不存在时自动创建后再变更
+    user = crud.create_user(session=db, device_id="device_points_missing_row")
+    db.exec(delete(UserPoints).where(UserPoints.user_id == user.id))
+    db.commit()
+    points = crud.change_points(
+        session=db, user_id=user.id, delta=100, tx_type=PointTransactionType.purchase
+    )
+    assert points.balance == 100
+
+    with pytest.raises(AppError) as exc:
+        crud.change_points(
+            session=db, user_id=user.id, delta=-101, tx_type=PointTransactionType.consume
+        )
+    assert exc.value.code == 402001
+    db.rollback()
+
+    txs = db.exec(select(PointTransaction).where(PointTransaction.user_id == user.id)).all()
+    assert [(t.amount, t.balance_after) for t in txs] == [(100, 100)]
+    assert crud.get_user_points(session=db, user_id=user.id).balance == 100
+
+
+def test_change_points_commit_false_creates_account_without_committing(db):
+    from app.enums import PointTransactionType
+    from app.models import User
+
+    user = crud.create_user(session=db, device_id="device_points_no_account")
+    user_id = user.id
+    db.exec(delete(UserPoints).where(UserPoints.user_id == user_id))
+    db.commit()
+
+    # 调用方未提交的写入 + 账户不存在时的积分变更，回滚后都不应落库
+    db.add(User(device_id="device_points_pending_write"))
+    points = crud.change_points(
+        session=db,
+        user_id=user_id,
+        delta=100,
+        tx_type=PointTransactionType.purchase,
+        commit=False,
+    )
+    assert points.balance == 100
+    db.rollback()
+
+    assert db.exec(select(UserPoints).where(UserPoints.user_id == user_id)).first() is None
+    assert db.exec(select(User).where(User.device_id == "device_points_pending_write")).first() is None
+
+
+class _FakeBalanceRedis:
+    """Emulates the hash + compare-version script used by points_cache."""
+
+    def __init__(self) -> None:
+        self.hashes: dict[str, dict[str, str]] = {}
+
+    def hmget(self, key, fields):
+        h = self.hashes.get(key, {})
+        return [h.get(f) for f in fields]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def eval(self, _script, _numkeys, key, balance, version, _ttl):
+        cur = self.hashes.get(key, {}).get("v")
+        if cur is not None and int(cur) >= int(version):
+            return 0
+        self.hashes[key] = {"b": str(balance), "v": str(version)}
+        return 1
+
+    def pipeline(self, transaction=True):  # noqa: ARG002
+        return self
+
+    def execute(self):
+        return []
+
+
+def test_points_balance_cache_write_through(db, monkeypatch):
+    from app.enums import PointTransactionType
+    from app.services import points_cache
+
+    fake = _FakeBalanceRedis()
+    monkeypatch.setattr(points_cache, "get_redis", lambda: fake)
+
+    user = crud.create_user(session=db, device_id="device_points_cache")
+    key = points_cache._redis_key(user.id)
+
+    # Miss: read from DB (no account row is created) and backfill version 0.
+    assert crud.get_points_balance(session=db, user_id=user.id) == 0
+    assert fake.hashes[key] == {"b": "0", "v": "0"}
+
+    # commit=False: the cache only changes once the caller commits.
+    crud.change_points(
+        session=db, user_id=user.id, delta=300, tx_type=PointTransactionType.purchase, commit=False
+    )
+    assert fake.hashes[key]["b"] == "0"
+    db.commit()
+    assert fake.hashes[key] == {"b": "300", "v": "1"}
+
+    # Rolled back changes never reach the cache.
+    crud.change_points(
+        session=db, user_id=user.id, delta=-100, tx_type=PointTransactionType.consume, commit=False
+    )
+    db.rollback()
+    assert fake.hashes[key]["b"] == "300"
+
+    # A stale backfill (older version) can't overwrite the newer balance.
+    points_cache.store_balance(user.id, 0, 0)
+    assert fake.hashes[key]["b"] == "300"
+
+    # Reads are served from the cache without touching the DB.
+    fake.hashes[key]["b"] = "777"
+    assert crud.get_points_balance(session=db, user_id=user.id) == 777
+    monkeypatch.setattr(settings, "POINTS_CACHE_ENABLED", False)
+    assert crud.get_points_balance(session=db, user_id=user.id) == 300
+
+
+def test_points_cache_failed_write_drops_key(monkeypatch, caplog):
+    from app.services import points_cache
+
+    fake = _FakeBalanceRedis()
+    fake.hashes[points_cache._redis_key(1)] = {"b": "100", "v": "1"}
+
+    def broken_execute():  # type: ignore[no-untyped-def]
+        raise ConnectionError("redis timeout")
+
+    monkeypatch.setattr(fake, "execute", broken_execute)
+    monkeypatch.setattr(points_cache, "get_redis", lambda: fake)
+    with caplog.at_level("WARNING", logger=points_cache.__name__):
+        points_cache.store_balance(1, 50, 2)
+    # The stale balance is dropped instead of being served until the TTL expires.
+    assert points_cache._redis_key(1) not in fake.hashes
+    assert "points cache redis set failed" in caplog.text
+
+
+class _FakeAsyncBalanceRedis(_FakeBalanceRedis):
+    def __init__(self) -> None:
+        super().__init__()
+        self.queued: list[tuple] = []
+
+    async def hmget(self, key, fields):  # type: ignore[override]
+        return super().hmget(key, fields)
+
+    def pipeline(self, transaction=True):  # noqa: ARG002
+        return self
+
+    def eval(self, *args):  # type: ignore[override]
+        self.queued.append(args)
+
+    async def execute(self):  # type: ignore[override]
+        queued, self.queued = self.queued, []
+        return [_FakeBalanceRedis.eval(self, *args) for args in queued]
+
+
+@pytest.mark.usefixtures("db")
+def test_points_cache_async_commit_false_uses_async_client(async_engine, monkeypatch):
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from app.enums import PointTransactionType
+    from app.services import points_cache
+
+    fake = _FakeAsyncBalanceRedis()
+    monkeypatch.setattr(points_cache, "get_async_redis", lambda: fake)
+
+    def no_sync_redis():  # type: ignore[no-untyped-def]
+        raise AssertionError("blocking redis client used on the event loop")
+
+    monkeypatch.setattr(points_cache, "get_redis", no_sync_redis)
+
+    async def run():  # type: ignore[no-untyped-def]
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            user = await crud.get_or_create_user_by_device_id_async(
+                session=session, device_id="device_points_cache_async"
+            )
+            await crud.change_points_async(
+                session=session,
+                user_id=user.id,
+                delta=300,
+                tx_type=PointTransactionType.purchase,
+                commit=False,
+            )
+            key = points_cache._redis_key(user.id)
+            assert key not in fake.hashes
+            await session.commit()
+            await points_cache.wait_pending_writes()
+            assert fake.hashes[key] == {"b": "300", "v": "1"}
+
+    asyncio.run(run())
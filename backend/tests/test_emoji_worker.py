@@ -0,0 +1,642 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from sqlmodel import select
+
+from app import crud
+from app.core.config import settings
+from app.enums import EmojiTaskStatus
+from app.integrations.aliyun_emoji import EmojiCreateResult, EmojiTaskResult
+from app.models import EmojiTask
+from app.services import task_events
+from worker import emoji_worker
+
+
+@pytest.fixture()
+def worker_db(engine, db, monkeypatch):
+    monkeypatch.setattr(emoji_worker, "engine", engine)
+    return db
+
+
+def _new_task(db, device_id: str) -> EmojiTask:
+    user = crud.create_user(session=db, device_id=device_id)
+    return crud.create_emoji_task(
+        session=db,
+        user_id=user.id,
+        image_url="https://example.com/a.jpg",
+        driven_id="emoji_001",
+        detect_result={"face_bbox": [0, 0, 1, 1], "ext_bbox": [0, 0, 2, 2]},
+        points_cost=200,
+    )
+
+
+class _PublishRecorder:
+    def __init__(self) -> None:
+        self.published: list[tuple[str, dict]] = []
+        self.snapshots: dict[str, dict] = {}
+
+    def pipeline(self, transaction: bool = True) -> _PublishRecorder:  # noqa: ARG002
+        return self
+
+    def set(self, key: str, value: str, ex: int | None = None) -> None:  # noqa: ARG002
+        self.snapshots[key] = json.loads(value)
+
+    def publish(self, channel: str, message: str) -> None:
+        self.published.append((channel, json.loads(message)))
+
+    def execute(self) -> list:
+        return []
+
+
+def test_handle_task_mock_mode_completes(worker_db, monkeypatch):
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", True)
+    rds = _PublishRecorder()
+    monkeypatch.setattr(task_events, "get_redis", lambda: rds)
+    task = _new_task(worker_db, "device_worker_sync")
+
+    emoji_worker.handle_task(task.id)
+
+    worker_db.refresh(task)
+    assert task.status == EmojiTaskStatus.completed
+    assert task.result_url == emoji_worker.MOCK_RESULT_URL
+
+    # Every transition is published to the owner's channel after commit.
+    channel = task_events.task_channel(task.user_id)
+    assert [(c, m["status"]) for c, m in rds.published] == [
+        (channel, "processing"),
+        (channel, "completed"),
+    ]
+    assert rds.published[-1][1]["result_url"] == emoji_worker.MOCK_RESULT_URL
+    # ...and the latest state is cached for GET /emoji/task/{id}.
+    assert rds.snapshots[task_events.snapshot_key(task.id)] == rds.published[-1][1]
+
+
+def test_handle_task_async_polls_until_success(worker_db, monkeypatch):
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", False)
+    monkeypatch.setattr(settings, "EMOJI_POLL_INITIAL_SECONDS", 0)
+    task = _new_task(worker_db, "device_worker_async")
+
+    polls = [
+        EmojiTaskResult(task_status="RUNNING"),
+        EmojiTaskResult(task_status="SUCCEEDED", video_url="https://example.com/v.mp4"),
+    ]
+
+    async def fake_create(**_):  # type: ignore[no-untyped-def]
+        return EmojiCreateResult(task_id="remote_1", task_status="PENDING")
+
+    async def fake_get(**_):  # type: ignore[no-untyped-def]
+        return polls.pop(0)
+
+    async def no_sleep(_):  # type: ignore[no-untyped-def]
+        return None
+
+    client = emoji_worker.aliyun_emoji_client
+    monkeypatch.setattr(client, "create_task_async", fake_create)
+    monkeypatch.setattr(client, "get_task_async", fake_get)
+    monkeypatch.setattr(emoji_worker.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(emoji_worker, "upload_from_url", lambda **k: f"https://cdn.example.com/{k['key']}")
+
+    asyncio.run(emoji_worker.handle_task_async(task.id))
+
+    worker_db.refresh(task)
+    assert task.status == EmojiTaskStatus.completed
+    assert task.aliyun_task_id == "remote_1"
+    assert task.result_url.endswith(f"/{task.id}.mp4")
+    assert not polls
+
+
+def test_handle_task_async_remote_failure(worker_db, monkeypatch):
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", False)
+    monkeypatch.setattr(settings, "EMOJI_POLL_INITIAL_SECONDS", 0)
+    task = _new_task(worker_db, "device_worker_fail")
+    task.aliyun_task_id = "remote_2"
+    worker_db.add(task)
+    worker_db.commit()
+
+    async def fake_get(**_):  # type: ignore[no-untyped-def]
+        return EmojiTaskResult(task_status="FAILED", error_message="bad face")
+
+    monkeypatch.setattr(emoji_worker.aliyun_emoji_client, "get_task_async", fake_get)
+
+    asyncio.run(emoji_worker.handle_task_async(task.id))
+
+    worker_db.refresh(task)
+    assert task.status == EmojiTaskStatus.failed
+    assert task.error_message == "bad face"
+
+
+def test_late_poll_result_does_not_overwrite_timeout(worker_db, monkeypatch):
+    rds = _PublishRecorder()
+    monkeypatch.setattr(task_events, "get_redis", lambda: rds)
+    monkeypatch.setattr(emoji_worker, "upload_from_url", lambda **k: f"https://cdn.example.com/{k['key']}")
+    task = _new_task(worker_db, "device_worker_late_poll")
+    timed_out = emoji_worker.start_task(task.id)
+    in_flight = emoji_worker.start_task(task.id)  # the poll holds its own copy
+    assert timed_out is not None and in_flight is not None
+
+    emoji_worker.finish_task(timed_out, EmojiTaskStatus.failed, error_message="DashScope task timeout")
+    published = len(rds.published)
+    # The poll that was already running finishes afterwards: its write is skipped.
+    done = emoji_worker.apply_remote_result(
+        in_flight, EmojiTaskResult(task_status="SUCCEEDED", video_url="https://example.com/v.mp4")
+    )
+    assert done is True
+
+    worker_db.refresh(task)
+    assert task.status == EmojiTaskStatus.failed
+    assert task.result_url is None
+    assert len(rds.published) == published
+
+
+def test_poll_delay_backs_off_to_the_cap(monkeypatch):
+    from worker import poll_scheduler as ps
+    from worker.poll_scheduler import poll_delay
+
+    monkeypatch.setattr(ps.random, "uniform", lambda _a, _b: 1.0)  # no jitter
+    monkeypatch.setattr(settings, "EMOJI_POLL_INITIAL_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "EMOJI_POLL_BACKOFF_FACTOR", 2.0)
+    monkeypatch.setattr(settings, "EMOJI_POLL_INTERVAL_SECONDS", 15)
+    assert [poll_delay(i) for i in range(5)] == [2.0, 4.0, 8.0, 15.0, 15.0]
+
+    monkeypatch.setattr(settings, "EMOJI_CALLBACK_ENABLED", True)
+    monkeypatch.setattr(settings, "EMOJI_CALLBACK_FALLBACK_POLL_SECONDS", 60)
+    assert poll_delay(0) == 60.0
+
+
+def test_poll_scheduler_orders_tasks_and_honours_pokes(monkeypatch):
+    from worker import poll_scheduler as ps
+
+    delays = {"fast": 0.01, "slow": 0.05, "hinted": 30.0}
+    polls: list[str] = []
+
+    async def scenario() -> None:
+        scheduler = ps.PollScheduler()
+        scheduler.start()
+
+        def poller(key: str):  # type: ignore[no-untyped-def]
+            async def poll() -> bool:
+                polls.append(key)
+                return True
+
+            return poll
+
+        futures = []
+        for key in ("slow", "hinted", "fast"):
+            monkeypatch.setattr(ps, "poll_delay", lambda _attempt, k=key: delays[k])
+            futures.append(scheduler.track(key, poller(key)))
+        assert len(scheduler) == 3
+        assert scheduler.poke("hinted") and not scheduler.poke("unknown")
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+        assert len(scheduler) == 0
+
+    asyncio.run(scenario())
+    # The callback pulls "hinted" forward; the rest follow their due times.
+    assert polls == ["hinted", "fast", "slow"]
+
+
+def test_outbox_relay_publishes_and_retries(worker_db, monkeypatch):
+    import threading
+
+    from app.models import OutboxMessage
+    from app.services import outbox
+    from worker import outbox_relay
+
+    monkeypatch.setattr(outbox_relay, "engine", emoji_worker.engine)
+    task = _new_task(worker_db, "device_outbox_relay")
+    outbox.enqueue(worker_db, stream=outbox.EMOJI_TASK_STREAM, fields=outbox.emoji_task_fields(task))
+    worker_db.commit()
+
+    class FlakyRedis:
+        def __init__(self):  # type: ignore[no-untyped-def]
+            self.fail = True
+            self.sent = []
+            self.pending = []
+
+        def pipeline(self, transaction=True):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self
+
+        def xadd(self, name, fields, maxlen=None, approximate=True):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            self.pending.append((name, fields))
+            self.maxlen = maxlen
+
+        def execute(self):  # type: ignore[no-untyped-def]
+            pending, self.pending = self.pending, []
+            if self.fail:
+                raise ConnectionError("redis down")
+            self.sent.extend(pending)
+
+    rds = FlakyRedis()
+    monkeypatch.setattr(outbox_relay, "get_redis", lambda: rds)
+
+    # Redis 不可用：消息保留在发件箱
+    with pytest.raises(ConnectionError):
+        outbox_relay.relay_once()
+    assert len(worker_db.exec(select(OutboxMessage)).all()) == 1
+
+    # 恢复后由 relay 循环发布并删除
+    rds.fail = False
+    stop = threading.Event()
+    relay_once = outbox_relay.relay_once
+
+    def relay_once_then_stop():  # type: ignore[no-untyped-def]
+        stop.set()
+        return relay_once()
+
+    monkeypatch.setattr(outbox_relay, "relay_once", relay_once_then_stop)
+    outbox_relay.run(stop)
+    assert [name for name, _ in rds.sent] == ["emoji_tasks"]
+    assert rds.sent[0][1]["task_id"] == str(task.id)
+    assert rds.maxlen == settings.EMOJI_STREAM_MAXLEN
+    worker_db.expire_all()
+    assert worker_db.exec(select(OutboxMessage)).all() == []
+
+
+def test_supervisor_metrics_and_dead_consumer_cleanup(monkeypatch):
+    from worker import supervisor
+
+    class StreamRedis:
+        def __init__(self):  # type: ignore[no-untyped-def]
+            self.consumers = [
+                {"name": "live", "pending": 2, "idle": 10},
+                {"name": "exited", "pending": 0, "idle": 10},
+                {"name": "stuck", "pending": 1, "idle": 10_000_000},
+                {"name": "stale", "pending": 0, "idle": 10_000_000},
+            ]
+            self.queued = []
+            self.deleted = []
+
+        def xlen(self, name):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return 42
+
+        def memory_usage(self, key):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return 4096
+
+        def xinfo_groups(self, name):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return [{"name": emoji_worker.GROUP, "pending": 3, "lag": 7}]
+
+        def xinfo_consumers(self, name, group):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self.consumers
+
+        def pipeline(self, transaction=True):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self
+
+        def xpending_range(self, name, group, min, max, count, consumername):  # type: ignore[no-untyped-def]  # noqa: ARG002, A002
+            pending = next(c["pending"] for c in self.consumers if c["name"] == consumername)
+            self.queued.append([{"time_since_delivered": 5000}] if pending else [])
+
+        def execute(self):  # type: ignore[no-untyped-def]
+            queued, self.queued = self.queued, []
+            return queued
+
+        def xgroup_delconsumer(self, name, group, consumer):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            self.deleted.append(consumer)
+
+    monkeypatch.setattr(settings, "EMOJI_WORKER_DEAD_CONSUMER_SECONDS", 3600)
+    r = StreamRedis()
+    metrics = supervisor.collect_metrics(r)  # type: ignore[arg-type]
+    assert (metrics["stream_length"], metrics["memory_bytes"]) == (42, 4096)
+    assert (metrics["lag"], metrics["pending"]) == (7, 3)
+    assert metrics["consumers"][0] == {
+        "name": "live", "pending": 2, "idle_ms": 10, "oldest_pending_ms": 5000
+    }
+    assert metrics["consumers"][1]["oldest_pending_ms"] == 0
+
+    exited = {"exited"}
+    removed = supervisor.cleanup_dead_consumers(r, metrics, live={"live"}, exited=exited)  # type: ignore[arg-type]
+    # "stuck" still owns a pending entry: it waits for XAUTOCLAIM before deletion.
+    assert removed == r.deleted == ["exited", "stale"]
+    assert exited == set()
+
+
+def test_consumer_names_are_unique():
+    assert emoji_worker.consumer_name() != emoji_worker.consumer_name()
+
+
+def test_reclaim_advances_cursor_and_dead_letters_poison_entries(worker_db, monkeypatch):
+    from app.services.outbox import EMOJI_TASK_DEAD_LETTER_STREAM
+    from worker import reclaimer
+
+    monkeypatch.setattr(task_events, "get_redis", _PublishRecorder)
+    monkeypatch.setattr(settings, "EMOJI_RECLAIM_MAX_DELIVERIES", 3)
+    monkeypatch.setattr(settings, "EMOJI_RECLAIM_BATCH_SIZE", 2)
+    poison = _new_task(worker_db, "device_reclaim_poison")
+    retry = _new_task(worker_db, "device_reclaim_retry")
+
+    class PendingRedis:
+        def __init__(self):  # type: ignore[no-untyped-def]
+            # id -> (task_id, times delivered); the pending list in id order
+            self.pel = {"1-0": (poison.id, 4), "2-0": (retry.id, 1), "3-0": (retry.id, 1)}
+            self.kv: dict[str, str] = {}
+            self.starts: list[str] = []
+            self.touched: list[str] = []
+            self.queued: list = []
+            self.dead: list[dict] = []
+
+        def get(self, key):  # type: ignore[no-untyped-def]
+            return self.kv.get(key)
+
+        def set(self, key, value):  # type: ignore[no-untyped-def]
+            self.kv[key] = value
+
+        def xclaim(self, name, group, consumer, min_idle_time, message_ids, justid):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            self.touched.extend(message_ids)
+
+        def xautoclaim(self, name, group, consumer, min_idle_time, start_id, count):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            self.starts.append(start_id)
+            ids = [i for i in self.pel if i >= start_id]
+            batch, rest = ids[:count], ids[count:]
+            claimed = [(i, {"task_id": str(self.pel[i][0])}) for i in batch]
+            return [rest[0] if rest else "0-0", claimed, []]
+
+        def pipeline(self, transaction=True):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self
+
+        def xpending_range(self, name, group, min, max, count):  # type: ignore[no-untyped-def]  # noqa: ARG002, A002
+            self.queued.append([{"times_delivered": self.pel[min][1]}])
+
+        def xadd(self, name, fields, maxlen, approximate):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            self.dead.append({"stream": name, **fields})
+
+        def xack(self, name, group, msg_id):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            del self.pel[msg_id]
+
+        def execute(self):  # type: ignore[no-untyped-def]
+            queued, self.queued = self.queued, []
+            return queued
+
+    r = PendingRedis()
+    monkeypatch.setattr(emoji_worker, "_owned", {"9-0"})
+
+    assert emoji_worker.reclaim_once(r) == [("2-0", {"task_id": str(retry.id)})]  # type: ignore[arg-type]
+    assert r.touched == ["9-0"]
+    assert r.dead == [
+        {
+            "stream": EMOJI_TASK_DEAD_LETTER_STREAM,
+            "task_id": str(poison.id),
+            "source_id": "1-0",
+            "deliveries": "4",
+        }
+    ]
+    assert "1-0" not in r.pel
+    worker_db.refresh(poison)
+    assert poison.status == EmojiTaskStatus.failed
+
+    # The next tick resumes where the last one stopped, then wraps around.
+    assert emoji_worker.reclaim_once(r) == [("3-0", {"task_id": str(retry.id)})]  # type: ignore[arg-type]
+    emoji_worker.reclaim_once(r)  # type: ignore[arg-type]
+    assert r.starts == ["0-0", "3-0", "0-0"]
+    assert r.kv[reclaimer.cursor_key(emoji_worker.STREAM, emoji_worker.GROUP)] == "0-0"
+    assert emoji_worker._owned == {"9-0", "2-0", "3-0"}
+
+
+def test_stream_janitor_trims_only_acknowledged_entries_past_the_horizon(monkeypatch):
+    from worker import stream_janitor
+
+    monkeypatch.setattr(settings, "EMOJI_STREAM_RETENTION_SECONDS", 60)
+    now = 1_000.0  # horizon: 940_000-0
+
+    class GroupsRedis:
+        def __init__(self, groups, oldest_pending=None):  # type: ignore[no-untyped-def]
+            self.groups = groups
+            self.oldest_pending = oldest_pending
+
+        def xinfo_groups(self, name):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return self.groups
+
+        def xpending(self, name, group):  # type: ignore[no-untyped-def]  # noqa: ARG002
+            return {"pending": 1, "min": self.oldest_pending}
+
+    def point(groups, oldest_pending=None):  # type: ignore[no-untyped-def]
+        r = GroupsRedis(groups, oldest_pending)
+        return stream_janitor.trim_point(r, "s", now=now)  # type: ignore[arg-type]
+
+    caught_up = {"name": "g", "last-delivered-id": "990000-3", "pending": 0}
+    assert point([]) == "0-0"  # no consumer group: keep everything
+    assert point([caught_up]) == "940000-0"  # acknowledged: horizon wins
+    behind = {"name": "g", "last-delivered-id": "900000-3", "pending": 0}
+    assert point([caught_up, behind]) == "900000-4"  # never past undelivered entries
+    stuck = {"name": "g", "last-delivered-id": "990000-3", "pending": 1}
+    assert point([stuck], oldest_pending="120000-0") == "120000-0"  # nor pending ones
+
+
+def test_emoji_task_message_formats(worker_db):
+    from app.services import outbox
+
+    task = _new_task(worker_db, "device_message_formats")
+
+    slim = outbox.emoji_task_fields(task)
+    assert slim == {"v": "2", "task_id": str(task.id)}
+    assert outbox.decode_emoji_task(slim) == outbox.EmojiTaskMessage(task_id=task.id)
+
+    full = outbox.decode_emoji_task(outbox.emoji_task_fields(task, with_data=True))
+    assert full.task_id == task.id
+    assert full.data == {
+        "user_id": task.user_id,
+        "image_url": "https://example.com/a.jpg",
+        "driven_id": "emoji_001",
+        "face_bbox": [0, 0, 1, 1],
+        "ext_bbox": [0, 0, 2, 2],
+        "points_cost": 200,
+        "created_at": task.created_at.isoformat(),
+    }
+
+    # Entries enqueued before the v2 schema are still readable.
+    legacy = {
+        "task_id": str(task.id),
+        "user_id": str(task.user_id),
+        "image_url": task.source_image_url,
+        "driven_id": task.driven_id,
+        "detect_result": json.dumps(task.detect_result),
+    }
+    assert outbox.decode_emoji_task(legacy) == outbox.EmojiTaskMessage(task_id=task.id)
+    with pytest.raises(ValueError):
+        outbox.decode_emoji_task({"v": "9", "task_id": "1"})
+
+
+def test_fast_path_batches_status_writes_without_reloading(worker_db, monkeypatch):
+    import threading
+
+    from app.services import outbox
+    from worker import status_batcher
+
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", True)
+    monkeypatch.setattr(settings, "EMOJI_WORKER_FAST_PATH", True)
+    monkeypatch.setattr(settings, "EMOJI_STATUS_FLUSH_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(status_batcher, "engine", emoji_worker.engine)
+    rds = _PublishRecorder()
+    monkeypatch.setattr(task_events, "get_redis", lambda: rds)
+
+    fresh = _new_task(worker_db, "device_fast_path_fresh")
+    done = _new_task(worker_db, "device_fast_path_done")
+    done.status = EmojiTaskStatus.completed
+    done.result_url = "https://example.com/first.mp4"
+    worker_db.add(done)
+    worker_db.commit()
+    messages = {
+        t.id: outbox.decode_emoji_task(outbox.emoji_task_fields(t, with_data=True))
+        for t in (fresh, done)
+    }
+
+    batcher = status_batcher.StatusBatcher()
+    stop = threading.Event()
+    monkeypatch.setattr(emoji_worker, "_batcher", batcher)
+    thread = threading.Thread(target=batcher.run, args=(stop,))
+    thread.start()
+    loads = []
+    try:
+        with monkeypatch.context() as m:
+            m.setattr(emoji_worker.Session, "get", lambda *args, **_kw: loads.append(args))
+            for message in messages.values():
+                emoji_worker.handle_task(message.task_id, message.data)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert loads == []  # no task was read from the database
+    worker_db.expire_all()
+    assert worker_db.get(EmojiTask, fresh.id).result_url == emoji_worker.MOCK_RESULT_URL
+    # A duplicate message can't overwrite a task that already finished.
+    assert worker_db.get(EmojiTask, done.id).result_url == "https://example.com/first.mp4"
+    assert {m["id"] for _c, m in rds.published} == {fresh.id}
+    assert rds.published[-1][1]["status"] == "completed"
+
+
+def test_status_batcher_writes_many_tasks_in_one_flush(worker_db, monkeypatch):
+    from worker import status_batcher
+
+    monkeypatch.setattr(status_batcher, "engine", emoji_worker.engine)
+    monkeypatch.setattr(task_events, "get_redis", _PublishRecorder)
+    tasks = [_new_task(worker_db, f"device_batch_{i}") for i in range(3)]
+    for task in tasks:
+        worker_db.refresh(task)
+    worker_db.expunge_all()  # edit detached copies, as the worker does
+    batcher = status_batcher.StatusBatcher()
+    for task in tasks:
+        task.status = EmojiTaskStatus.processing
+        batcher.submit(task)
+    tasks[0].status = EmojiTaskStatus.failed
+    tasks[0].error_message = "boom"
+    future = batcher.submit(tasks[0])  # replaces the queued processing transition
+
+    assert batcher.flush() == 3
+    assert future.done() and future.exception() is None
+    worker_db.expire_all()
+    statuses = [worker_db.get(EmojiTask, t.id).status for t in tasks]
+    assert statuses == [EmojiTaskStatus.failed, EmojiTaskStatus.processing, EmojiTaskStatus.processing]
+
+
+def test_redelivered_message_skips_fast_path_and_resumes(worker_db, monkeypatch):
+    from app.services import outbox
+
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", False)
+    monkeypatch.setattr(settings, "EMOJI_WORKER_FAST_PATH", True)
+    monkeypatch.setattr(settings, "EMOJI_POLL_INITIAL_SECONDS", 0)
+    monkeypatch.setattr(emoji_worker, "upload_from_url", lambda **k: f"https://cdn.example.com/{k['key']}")
+    client = emoji_worker.aliyun_emoji_client
+
+    def no_create(**_):  # type: ignore[no-untyped-def]
+        raise AssertionError("duplicate DashScope job submitted")
+
+    monkeypatch.setattr(client, "create_task", no_create)
+    monkeypatch.setattr(
+        client,
+        "get_task",
+        lambda **_: EmojiTaskResult(task_status="SUCCEEDED", video_url="https://example.com/v.mp4"),
+    )
+
+    # Submitted before the previous consumer died: resume polling its job.
+    started = _new_task(worker_db, "device_redelivered_started")
+    started.status = EmojiTaskStatus.processing
+    started.aliyun_task_id = "remote_7"
+    # Already finished: skipped without any remote call.
+    finished = _new_task(worker_db, "device_redelivered_finished")
+    finished.status = EmojiTaskStatus.failed
+    worker_db.add_all([started, finished])
+    worker_db.commit()
+
+    for task in (started, finished):
+        message = outbox.decode_emoji_task(outbox.emoji_task_fields(task, with_data=True))
+        assert emoji_worker.message_data(message, redelivered=False) == message.data
+        data = emoji_worker.message_data(message, redelivered=True)
+        assert data is None
+        emoji_worker.handle_task(message.task_id, data)
+
+    worker_db.expire_all()
+    started = worker_db.get(EmojiTask, started.id)
+    assert started.status == EmojiTaskStatus.completed
+    assert started.aliyun_task_id == "remote_7"
+    assert worker_db.get(EmojiTask, finished.id).status == EmojiTaskStatus.failed
+
+
+def test_status_batcher_publishes_the_written_state(worker_db, monkeypatch):
+    from worker import status_batcher
+
+    monkeypatch.setattr(status_batcher, "engine", emoji_worker.engine)
+    rds = _PublishRecorder()
+    monkeypatch.setattr(task_events, "get_redis", lambda: rds)
+    task = _new_task(worker_db, "device_batch_snapshot")
+    worker_db.refresh(task)
+    worker_db.expunge_all()
+    batcher = status_batcher.StatusBatcher()
+    task.status = EmojiTaskStatus.processing
+    batcher.submit(task)
+    # The worker moves on before the flush; the event must match the stored row.
+    task.status = EmojiTaskStatus.completed
+    task.result_url = "https://example.com/not-stored-yet.mp4"
+
+    batcher.flush()
+    assert [m["status"] for _c, m in rds.published] == ["processing"]
+    assert rds.published[0][1]["result_url"] is None
+
+
+def test_async_fast_path_awaits_flushes_without_blocking_threads(worker_db, monkeypatch):
+    import threading
+
+    from app.services import outbox
+    from worker import status_batcher
+
+    monkeypatch.setattr(settings, "ALIYUN_EMOJI_MOCK", False)
+    monkeypatch.setattr(settings, "EMOJI_WORKER_FAST_PATH", True)
+    monkeypatch.setattr(settings, "EMOJI_POLL_INITIAL_SECONDS", 0)
+    monkeypatch.setattr(settings, "EMOJI_STATUS_FLUSH_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(status_batcher, "engine", emoji_worker.engine)
+    monkeypatch.setattr(task_events, "get_redis", _PublishRecorder)
+    monkeypatch.setattr(emoji_worker, "upload_from_url", lambda **k: f"https://cdn.example.com/{k['key']}")
+
+    def blocking(*_args, **_kwargs):  # type: ignore[no-untyped-def]
+        raise AssertionError("blocking helper used in async mode")
+
+    monkeypatch.setattr(emoji_worker, "save_aliyun_task_id", blocking)
+    monkeypatch.setattr(emoji_worker, "finish_task", blocking)
+
+    async def fake_create(**_):  # type: ignore[no-untyped-def]
+        return EmojiCreateResult(task_id="remote_fast", task_status="PENDING")
+
+    async def fake_get(**_):  # type: ignore[no-untyped-def]
+        return EmojiTaskResult(task_status="SUCCEEDED", video_url="https://example.com/v.mp4")
+
+    client = emoji_worker.aliyun_emoji_client
+    monkeypatch.setattr(client, "create_task_async", fake_create)
+    monkeypatch.setattr(client, "get_task_async", fake_get)
+
+    task = _new_task(worker_db, "device_async_fast_path")
+    message = outbox.decode_emoji_task(outbox.emoji_task_fields(task, with_data=True))
+    batcher = status_batcher.StatusBatcher()
+    stop = threading.Event()
+    monkeypatch.setattr(emoji_worker, "_batcher", batcher)
+    thread = threading.Thread(target=batcher.run, args=(stop,))
+    thread.start()
+    try:
+        asyncio.run(emoji_worker.handle_task_async(message.task_id, message.data))
+    finally:
+        stop.set()
+        thread.join()
+
+    worker_db.expire_all()
+    stored = worker_db.get(EmojiTask, task.id)
+    assert stored.status == EmojiTaskStatus.completed
+    assert stored.aliyun_task_id == "remote_fast"
+    assert stored.result_url.endswith(f"/{task.id}.mp4")
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import event
+
+from app import crud
+from app.api.pagination import encode_cursor, paginate_by_user
+from app.models import EmojiTask, Order, PointTransaction
+
+
+def _page_queries(engine, db, model, **kwargs) -> list[tuple[str, tuple]]:
+    """Run paginate_by_user and capture the SELECT it issues for the page itself."""
+    captured: list[tuple[str, tuple]] = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _many):  # type: ignore[no-untyped-def]
+        if "count(" not in statement.lower():
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        paginate_by_user(db, model, page=1, page_size=20, with_count=False, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return captured
+
+
+@pytest.mark.parametrize(
+    ("model", "index"),
+    [
+        (EmojiTask, "ix_emoji_tasks_user_id_id"),
+        (PointTransaction, "ix_point_transactions_user_id_id"),
+        (Order, "ix_orders_user_id_id"),
+    ],
+)
+@pytest.mark.parametrize("cursor", [None, encode_cursor(2**62)])
+def test_list_queries_use_user_id_id_index(engine, db, model, index, cursor):
+    user = crud.create_user(session=db, device_id=f"device_plan_{model.__name__}")
+    queries = _page_queries(engine, db, model, user_id=user.id, cursor=cursor)
+    assert len(queries) == 1
+    statement, parameters = queries[0]
+
+    with engine.connect() as conn:
+        plan = " | ".join(
+            row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        )
+    # The page is read straight off the composite index: no full scan, no sort step.
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import pytest
+from sqlmodel import delete, select
+
+from app import crud
+from app.enums import SubscriptionStatus, VipType
+from app.models import PointTransaction, Subscription, UserPoints
+from worker import weekly_points_reward as job
+
+AMOUNTS = job.RewardAmounts(weekly=2000, lifetime=3000)
+
+
+@pytest.fixture()
+def reward_db(engine, db, monkeypatch):
+    monkeypatch.setattr(job, "engine", engine)
+    return db
+
+
+def _subscriber(db, device_id: str, *plans: tuple[VipType, SubscriptionStatus]) -> int:
+    user = crud.create_user(session=db, device_id=device_id)
+    for plan, status in plans:
+        db.add(
+            Subscription(
+                user_id=user.id,
+                rc_subscriber_id=str(user.id),
+                product_id=f"{plan.value}_001",
+                plan_type=plan,
+                status=status,
+            )
+        )
+    db.commit()
+    return user.id
+
+
+def _balance(db, user_id: int) -> int:
+    db.expire_all()
+    return db.exec(select(UserPoints.balance).where(UserPoints.user_id == user_id)).one()
+
+
+def test_weekly_reward_chunks_and_is_idempotent(reward_db):
+    db = reward_db
+    active = SubscriptionStatus.active
+    weekly = _subscriber(db, "device_reward_weekly", (VipType.weekly, active))
+    lifetime = _subscriber(db, "device_reward_lifetime", (VipType.lifetime, active))
+    both = _subscriber(
+        db, "device_reward_both", (VipType.weekly, active), (VipType.lifetime, active)
+    )
+    cancelled = _subscriber(
+        db, "device_reward_cancelled", (VipType.weekly, SubscriptionStatus.cancelled)
+    )
+    legacy = _subscriber(db, "device_reward_legacy", (VipType.weekly, active))
+    db.exec(delete(UserPoints).where(UserPoints.user_id == legacy))
+    db.commit()
+
+    progress = []
+    stats = job.run_reward(
+        "2026-W42",
+        amounts=AMOUNTS,
+        chunk_size=2,
+        on_chunk=lambda s: progress.append((s.chunks, s.awarded)),
+    )
+    assert (stats.chunks, stats.users, stats.awarded, stats.skipped) == (2, 4, 4, 0)
+    assert progress == [(1, 2), (2, 4)]
+
+    assert _balance(db, weekly) == 2000
+    assert _balance(db, lifetime) == 3000
+    assert _balance(db, both) == 3000  # one reward per user, lifetime wins
+    assert _balance(db, legacy) == 2000
+    assert _balance(db, cancelled) == 0
+
+    rows = db.exec(select(PointTransaction).where(PointTransaction.reward_week == "2026-W42")).all()
+    assert sorted(r.balance_after for r in rows) == [2000, 2000, 3000, 3000]
+    assert crud.get_user_count(session=db, user_id=both, model=PointTransaction) == 1
+
+    # Rerunning the same week credits nobody twice.
+    again = job.run_reward("2026-W42", amounts=AMOUNTS, chunk_size=10)
+    assert (again.users, again.awarded, again.skipped) == (4, 0, 4)
+    assert _balance(db, weekly) == 2000
+
+    # A range-bounded run only touches its slice of user ids.
+    bounded = job.run_reward("2026-W43", amounts=AMOUNTS, until=min(weekly, lifetime, both, legacy))
+    assert bounded.awarded == 1
+
+
+def test_weekly_reward_postgres_statement_uses_conflict_index():
+    sql = str(job._REWARD_CHUNK_SQL)
+    assert "ON CONFLICT (user_id, reward_week) WHERE reward_week IS NOT NULL DO NOTHING" in sql
+    assert "FOR UPDATE OF up" in sql
+    assert "unnest(" in sql
+
+
+class _FakeRedis:
+    def __init__(self) -> None:
+        self.kv: dict[str, str] = {}
+        self.hashes: dict[str, dict[str, str]] = {}
+
+    def set(self, key, value, nx=False, ex=None):  # noqa: ARG002
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def delete(self, key):
+        self.kv.pop(key, None)
+
+    def expire(self, key, seconds):  # noqa: ARG002
+        return True
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hmget(self, key, *fields):
+        h = self.hashes.get(key, {})
+        return [h.get(f) for f in fields]
+
+
+def test_weekly_reward_shards_resume_from_checkpoint(reward_db, monkeypatch):
+    db = reward_db
+    active = SubscriptionStatus.active
+    users = [_subscriber(db, f"device_shard_{i}", (VipType.weekly, active)) for i in range(6)]
+    fake = _FakeRedis()
+    monkeypatch.setattr(job, "get_redis", lambda: fake)
+    week = "2026-W44"
+
+    # Shard `k` crashed after its first user: the checkpoint says where to resume.
+    k = users[0] % 2
+    mine = sorted(u for u in users if u % 2 == k)
+    job.run_reward(week, amounts=AMOUNTS, until=mine[0], shard=(k, 2))
+    job.save_checkpoint(fake, week, k, last=mine[0])
+    # Another instance holds the other shard's lease, so this worker skips it.
+    assert job.claim_shard(fake, week, 1 - k, "other:1")
+
+    stats = job.run_worker(week, shards=2, amounts=AMOUNTS)
+    assert stats.users == len(mine) - 1
+    assert job.load_checkpoint(fake, week, k) == (mine[-1], True)
+    assert job.load_checkpoint(fake, week, 1 - k)[1] is False
+    assert fake.get(job._lease_key(week, k)) is None  # lease released
+
+    job.release_shard(fake, week, 1 - k, "other:1")
+    job.run_worker(week, shards=2, amounts=AMOUNTS)
+    assert all(_balance(db, u) == 2000 for u in users)
+    # Done shards are skipped on a rerun.
+    assert job.run_worker(week, shards=2, amounts=AMOUNTS).users == 0
+
+
+def test_weekly_reward_lost_lease_skips_shard(reward_db, monkeypatch):
+    db = reward_db
+    active = SubscriptionStatus.active
+    users = [_subscriber(db, f"device_lease_{i}", (VipType.weekly, active)) for i in range(6)]
+    fake = _FakeRedis()
+    monkeypatch.setattr(job, "get_redis", lambda: fake)
+    monkeypatch.setattr(job.settings, "WEEKLY_REWARD_CHUNK_SIZE", 1)
+    week = "2026-W45"
+    k = users[0] % 2
+
+    # After shard k's first chunk its lease expires and another worker takes it.
+    save = job.save_checkpoint
+
+    def save_and_steal(r, reward_week, shard, *, last, done=False):  # type: ignore[no-untyped-def]
+        save(r, reward_week, shard, last=last, done=done)
+        if shard == k and not done:
+            fake.kv[job._lease_key(reward_week, shard)] = "other:2"
+
+    monkeypatch.setattr(job, "save_checkpoint", save_and_steal)
+    stats = job.run_worker(week, shards=2, amounts=AMOUNTS)
+
+    # The other shard still ran; shard k is left to its new owner, unfinished.
+    assert stats.users == len([u for u in users if u % 2 != k])
+    assert job.unfinished_shards(fake, week, 2) == [k]
+    assert fake.get(job._lease_key(week, k)) == "other:2"  # not released by the loser
@@ -1,28 +1,73 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import queue
+import secrets
+import socket
+import threading
 import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
 
+from redis import Redis
+from redis.client import PubSub
 from redis.exceptions import ResponseError
+from sqlalchemy import inspect as sa_inspect
 from sqlmodel import Session
 
 from app.core.config import settings
 from app.core.db import engine
-from app.core.redis import get_redis
+from app.core.redis import get_async_redis, get_redis
 from app.enums import EmojiTaskStatus
-from app.integrations.aliyun_emoji import aliyun_emoji_client
+from app.integrations.aliyun_emoji import EmojiTaskResult, aliyun_emoji_client
 from app.integrations.oss import upload_from_url
 from app.models import EmojiTask, utc_now
 from app.services.config_service import refresh_config
+from app.services.outbox import (
+    EMOJI_TASK_DEAD_LETTER_STREAM,
+    EMOJI_TASK_STREAM,
+    EmojiTaskMessage,
+    decode_emoji_task,
+)
+from app.services.task_events import POLL_HINT_CHANNEL, publish_task_event
+from worker import outbox_relay, reclaimer
+from worker.poll_scheduler import PollScheduler, poll_delay
+from worker.status_batcher import StatusBatcher, task_row, write_rows
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("emoji_worker")
 
-STREAM = "emoji_tasks"
+STREAM = EMOJI_TASK_STREAM
 GROUP = "emoji_worker"
-CONSUMER = os.environ.get("EMOJI_WORKER_CONSUMER", "c1")
 CONFIG_REFRESH_INTERVAL_SECONDS = 60
+MOCK_RESULT_URL = "https://example.com/mock-result.mp4"
+
+
+def consumer_name() -> str:
+    """A consumer name unique to this process: host, pid and a random suffix."""
+    return f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+
+
+# Every process reads as its own consumer; worker/supervisor.py assigns a fresh
+# name to each child. Set EMOJI_WORKER_CONSUMER only to pin a single process.
+CONSUMER = os.environ.get("EMOJI_WORKER_CONSUMER") or consumer_name()
+
+# Completion-callback hints (EMOJI_CALLBACK_ENABLED): a sync pubsub in sync
+# mode, the shared PollScheduler in async mode.
+_hints: PubSub | None = None
+_scheduler: PollScheduler | None = None
+# Batched status writes for the fast path (EMOJI_WORKER_FAST_PATH).
+_batcher: StatusBatcher | None = None
+
+# Entries this process has read or claimed and not yet finished; the reclaim
+# loop keeps them from looking idle to other consumers.
+_owned: set[str] = set()
+# Stale entries claimed by the reclaim thread, drained by the sync loop.
+_reclaimed: queue.SimpleQueue[reclaimer.Message] = queue.SimpleQueue()
 
 
 def maybe_refresh_config(next_refresh_at: float) -> float:
@@ -45,151 +90,545 @@ def ensure_consumer_group() -> None:
             raise
 
 
-def handle_task(task_id: int) -> None:
-    with Session(engine) as session:
+# ---------------------------------------------------------------------------
+# Task state transitions. Each helper uses its own short-lived session so the
+# same code serves the blocking loop and the asyncio mode (via to_thread).
+# The *_async variants await fast-path flushes instead of blocking a thread.
+# Status changes are published after commit for the SSE endpoint.
+#
+# Fast path (EMOJI_WORKER_FAST_PATH, message carries the task data): the task
+# is built from the message and never loaded, and its transitions go through
+# the StatusBatcher. Such tasks are transient ORM objects, which is how the
+# helpers below tell them apart. Only first deliveries take the fast path; see
+# message_data().
+# ---------------------------------------------------------------------------
+
+
+def status_batcher() -> StatusBatcher:
+    """The process-wide status batcher (started on first use)."""
+    global _batcher
+    if _batcher is None:
+        _batcher = StatusBatcher()
+        _batcher.start_in_background()
+    return _batcher
+
+
+def _batched(task: EmojiTask) -> bool:
+    return sa_inspect(task).transient
+
+
+def message_data(message: EmojiTaskMessage, *, redelivered: bool) -> dict[str, Any] | None:
+    """The task data for the fast path, or None to load the task from the DB.
+
+    A redelivered entry (claimed by the reclaimer, so delivered more than
+    once) may belong to a task that already has a DashScope job or is already
+    final. It goes through the DB path, which skips final tasks and resumes
+    from the stored aliyun_task_id instead of submitting a new paid job.
+    """
+    return None if redelivered else message.data
+
+
+def task_from_message(task_id: int, data: dict[str, Any]) -> EmojiTask:
+    return EmojiTask(
+        id=task_id,
+        user_id=data["user_id"],
+        source_image_url=data["image_url"],
+        driven_id=data["driven_id"],
+        detect_result={"face_bbox": data["face_bbox"], "ext_bbox": data["ext_bbox"]},
+        points_cost=data["points_cost"],
+        created_at=datetime.fromisoformat(data["created_at"]),
+        status=EmojiTaskStatus.processing,
+    )
+
+
+def start_task(task_id: int, data: dict[str, Any] | None = None) -> EmojiTask | None:
+    """Load the task and mark it processing; None when missing or already finished.
+
+    On the fast path (first delivery only, see message_data) the processing
+    transition is queued without waiting.
+    """
+    if data is not None and settings.EMOJI_WORKER_FAST_PATH:
+        task = task_from_message(task_id, data)
+        status_batcher().submit(task)
+        return task
+
+    with Session(engine, expire_on_commit=False) as session:
         task = session.get(EmojiTask, task_id)
         if not task:
             logger.warning("task not found: %s", task_id)
-            return
+            return None
         if task.status in (EmojiTaskStatus.completed, EmojiTaskStatus.failed):
-            return
+            return None
 
         task.status = EmojiTaskStatus.processing
         session.add(task)
         session.commit()
+    publish_task_event(task)
+    return task
+
+
+def save_aliyun_task_id(task: EmojiTask, aliyun_task_id: str) -> None:
+    task.aliyun_task_id = aliyun_task_id
+    if _batched(task):
+        # Wait for the flush: a redelivery resumes from the stored id, so it
+        # must be durable before polling starts.
+        status_batcher().submit(task).result()
+        return
+    _store_aliyun_task_id(task)
+
+
+async def save_aliyun_task_id_async(task: EmojiTask, aliyun_task_id: str) -> None:
+    """save_aliyun_task_id for the asyncio mode; awaits the flush without holding a thread."""
+    task.aliyun_task_id = aliyun_task_id
+    if _batched(task):
+        await asyncio.wrap_future(status_batcher().submit(task))
+        return
+    await asyncio.to_thread(_store_aliyun_task_id, task)
+
+
+def _store_aliyun_task_id(task: EmojiTask) -> None:
+    with Session(engine, expire_on_commit=False) as session:
+        session.add(task)
+        session.commit()
+
+
+def _set_final(
+    task: EmojiTask, status: EmojiTaskStatus, result_url: str | None, error_message: str | None
+) -> None:
+    task.status = status
+    if result_url is not None:
+        task.result_url = result_url
+    task.error_message = error_message
+    task.completed_at = utc_now()
+
+
+def finish_task(
+    task: EmojiTask,
+    status: EmojiTaskStatus,
+    *,
+    result_url: str | None = None,
+    error_message: str | None = None,
+) -> None:
+    """Write a final state unless the task is already final.
+
+    The UPDATE is conditional on the stored status, so a late writer (a poll
+    still in flight after the async timeout failed the task, or a redelivered
+    message) can't overwrite a result that is already stored.
+    """
+    _set_final(task, status, result_url, error_message)
+    if _batched(task):
+        # Block until flushed so the message is only acknowledged once stored.
+        status_batcher().submit(task).result()
+        return
+    _store_final(task)
+
+
+async def finish_task_async(
+    task: EmojiTask,
+    status: EmojiTaskStatus,
+    *,
+    result_url: str | None = None,
+    error_message: str | None = None,
+) -> None:
+    """finish_task for the asyncio mode; awaits the flush without holding a thread."""
+    _set_final(task, status, result_url, error_message)
+    if _batched(task):
+        await asyncio.wrap_future(status_batcher().submit(task))
+        return
+    await asyncio.to_thread(_store_final, task)
+
+
+def _store_final(task: EmojiTask) -> None:
+    with Session(engine) as session:
+        written = write_rows(session, [task_row(task)])
+        session.commit()
+    if written:
+        publish_task_event(task)
+    else:
+        logger.info("task %s already final, %s not written", task.id, EmojiTaskStatus(task.status).value)
+
+
+def fail_task(task_id: int, error_message: str) -> None:
+    """Mark a task failed unless it already finished."""
+    with Session(engine, expire_on_commit=False) as session:
+        task = session.get(EmojiTask, task_id)
+    if task is None or task.status in (EmojiTaskStatus.completed, EmojiTaskStatus.failed):
+        return
+    finish_task(task, EmojiTaskStatus.failed, error_message=error_message)
+
+
+def task_bboxes(task: EmojiTask) -> tuple[list[int], list[int]] | None:
+    detect = task.detect_result or {}
+    face_bbox = detect.get("face_bbox")
+    ext_bbox = detect.get("ext_bbox")
+    if not (isinstance(face_bbox, list) and isinstance(ext_bbox, list)):
+        return None
+    return face_bbox, ext_bbox
+
+
+# Final state for a poll result: (status, result_url, error_message).
+RemoteOutcome = tuple[EmojiTaskStatus, str | None, str | None]
+
+
+def remote_outcome(task: EmojiTask, result: EmojiTaskResult) -> RemoteOutcome | None:
+    """The final state for a DashScope poll result, or None while it is still running.
+
+    A succeeded task's video is copied to OSS here (blocking).
+    """
+    status = result.task_status.upper()
+
+    if status == "SUCCEEDED":
+        if not result.video_url:
+            return EmojiTaskStatus.failed, None, "DashScope succeeded but missing video_url"
+
+        key = f"{settings.OSS_RESULT_PREFIX}/{task.user_id}/{task.id}.mp4"
+        try:
+            result_url = upload_from_url(url=result.video_url, key=key)
+        except Exception as e:
+            return EmojiTaskStatus.failed, None, f"OSS upload failed: {e}"
+        return EmojiTaskStatus.completed, result_url, None
+
+    if status in ("FAILED", "CANCELED", "UNKNOWN"):
+        return EmojiTaskStatus.failed, None, result.error_message or f"DashScope task {status}"
+
+    return None
+
+
+def apply_remote_result(task: EmojiTask, result: EmojiTaskResult) -> bool:
+    """Persist a DashScope poll result. Returns True once the task reached a final state."""
+    outcome = remote_outcome(task, result)
+    if outcome is None:
+        return False
+    status, result_url, error_message = outcome
+    finish_task(task, status, result_url=result_url, error_message=error_message)
+    return True
+
+
+async def apply_remote_result_async(task: EmojiTask, result: EmojiTaskResult) -> bool:
+    """apply_remote_result for the asyncio mode; only the OSS copy runs in a thread."""
+    if result.task_status.upper() == "SUCCEEDED":
+        outcome = await asyncio.to_thread(remote_outcome, task, result)
+    else:
+        outcome = remote_outcome(task, result)
+    if outcome is None:
+        return False
+    status, result_url, error_message = outcome
+    await finish_task_async(task, status, result_url=result_url, error_message=error_message)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Sync mode: one task at a time, blocking poll loop.
+# ---------------------------------------------------------------------------
+
+
+def handle_task(task_id: int, data: dict[str, Any] | None = None) -> None:
+    task = start_task(task_id, data)
+    if task is None:
+        return
 
-        if settings.ALIYUN_EMOJI_MOCK:
-            task.result_url = "https://example.com/mock-result.mp4"
-            task.status = EmojiTaskStatus.completed
-            task.completed_at = utc_now()
-            session.add(task)
-            session.commit()
+    if settings.ALIYUN_EMOJI_MOCK:
+        finish_task(task, EmojiTaskStatus.completed, result_url=MOCK_RESULT_URL)
+        return
+
+    bboxes = task_bboxes(task)
+    if bboxes is None:
+        finish_task(task, EmojiTaskStatus.failed, error_message="Missing face bbox from detect_result")
+        return
+
+    # Create remote task if needed.
+    if not task.aliyun_task_id:
+        created = aliyun_emoji_client.create_task(
+            image_url=task.source_image_url,
+            driven_id=task.driven_id,
+            face_bbox=bboxes[0],
+            ext_bbox=bboxes[1],
+        )
+        save_aliyun_task_id(task, created.task_id)
+    aliyun_task_id = task.aliyun_task_id or ""
+
+    start = time.time()
+    attempt = 0
+    while True:
+        wait_for_poll(aliyun_task_id, poll_delay(attempt))
+        attempt += 1
+        if time.time() - start > settings.EMOJI_POLL_TIMEOUT_SECONDS:
+            finish_task(task, EmojiTaskStatus.failed, error_message="DashScope task timeout")
             return
 
-        detect = task.detect_result or {}
-        face_bbox = detect.get("face_bbox")
-        ext_bbox = detect.get("ext_bbox")
-        if not (isinstance(face_bbox, list) and isinstance(ext_bbox, list)):
-            task.status = EmojiTaskStatus.failed
-            task.error_message = "Missing face bbox from detect_result"
-            task.completed_at = utc_now()
-            session.add(task)
-            session.commit()
+        result = aliyun_emoji_client.get_task(task_id=aliyun_task_id)
+        if apply_remote_result(task, result):
             return
 
-        # Create remote task if needed.
-        if not task.aliyun_task_id:
-            created = aliyun_emoji_client.create_task(
-                image_url=task.source_image_url,
-                driven_id=task.driven_id,
-                face_bbox=face_bbox,
-                ext_bbox=ext_bbox,
-            )
-            task.aliyun_task_id = created.task_id
-            session.add(task)
-            session.commit()
-
-        start = time.time()
-        while True:
-            if time.time() - start > settings.EMOJI_POLL_TIMEOUT_SECONDS:
-                task.status = EmojiTaskStatus.failed
-                task.error_message = "DashScope task timeout"
-                task.completed_at = utc_now()
-                session.add(task)
-                session.commit()
-                return
-
-            result = aliyun_emoji_client.get_task(task_id=task.aliyun_task_id)
-            status = result.task_status.upper()
-
-            if status == "SUCCEEDED":
-                if not result.video_url:
-                    task.status = EmojiTaskStatus.failed
-                    task.error_message = "DashScope succeeded but missing video_url"
-                    task.completed_at = utc_now()
-                    session.add(task)
-                    session.commit()
-                    return
-
-                key = f"{settings.OSS_RESULT_PREFIX}/{task.user_id}/{task.id}.mp4"
-                try:
-                    task.result_url = upload_from_url(url=result.video_url, key=key)
-                except Exception as e:
-                    task.status = EmojiTaskStatus.failed
-                    task.error_message = f"OSS upload failed: {e}"
-                    task.completed_at = utc_now()
-                    session.add(task)
-                    session.commit()
-                    return
-
-                task.status = EmojiTaskStatus.completed
-                task.completed_at = utc_now()
-                session.add(task)
-                session.commit()
-                return
-
-            if status in ("FAILED", "CANCELED", "UNKNOWN"):
-                task.status = EmojiTaskStatus.failed
-                task.error_message = result.error_message or f"DashScope task {status}"
-                task.completed_at = utc_now()
-                session.add(task)
-                session.commit()
-                return
-
-            time.sleep(max(1, settings.EMOJI_POLL_INTERVAL_SECONDS))
+
+def wait_for_poll(aliyun_task_id: str, delay: float) -> None:
+    """Sleep until the next check; a completion callback for this task ends the wait early."""
+    if _hints is None:
+        time.sleep(delay)
+        return
+    deadline = time.monotonic() + delay
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            message = _hints.get_message(ignore_subscribe_messages=True, timeout=remaining)
+        except Exception:
+            logger.exception("poll hint read failed")
+            time.sleep(remaining)
+            return
+        if message and message["data"] == aliyun_task_id:
+            return
 
 
 def main() -> None:
+    global _hints
+    if settings.EMOJI_WORKER_MODE == "async":
+        asyncio.run(main_async())
+        return
+
     refresh_config()
     ensure_consumer_group()
+    if settings.OUTBOX_RELAY_IN_WORKER:
+        outbox_relay.start_in_background()
+    aliyun_emoji_client.open()
     r = get_redis()
     next_refresh_at = time.time() + CONFIG_REFRESH_INTERVAL_SECONDS
+    if settings.EMOJI_CALLBACK_ENABLED:
+        _hints = r.pubsub()
+        _hints.subscribe(POLL_HINT_CHANNEL)
+
+    threading.Thread(target=run_reclaimer, name="emoji-reclaimer", daemon=True).start()
 
     logger.info("emoji worker started: stream=%s group=%s consumer=%s", STREAM, GROUP, CONSUMER)
 
+    try:
+        run_sync_loop(r, next_refresh_at)
+    finally:
+        aliyun_emoji_client.close()
+
+
+def run_sync_loop(r: Redis, next_refresh_at: float) -> None:
     while True:
         try:
             next_refresh_at = maybe_refresh_config(next_refresh_at)
-            resp = r.xreadgroup(
-                GROUP,
-                CONSUMER,
-                {STREAM: ">"},
-                count=10,
-                block=5000,
-            )
-            messages: list[tuple[str, dict[str, str]]] = []
-            if resp:
-                for _stream, batch in resp:
-                    messages.extend(batch)
-            else:
-                # Reclaim stale pending messages (Redis 6.2+).
-                try:
-                    _next, claimed, _deleted = r.xautoclaim(
-                        STREAM,
-                        GROUP,
-                        CONSUMER,
-                        min_idle_time=60_000,
-                        start_id="0-0",
-                        count=10,
-                    )
-                    messages.extend(claimed)
-                except Exception:
-                    pass
-
+            messages: list[reclaimer.Message] = []
+            while not _reclaimed.empty():
+                messages.append(_reclaimed.get_nowait())
+            redelivered = bool(messages)
             if not messages:
-                continue
+                resp = r.xreadgroup(
+                    GROUP,
+                    CONSUMER,
+                    {STREAM: ">"},
+                    count=10,
+                    block=5000,
+                )
+                for _stream, batch in resp or []:
+                    messages.extend(batch)
+                _owned.update(msg_id for msg_id, _ in messages)
 
             for msg_id, fields in messages:
                 try:
-                    task_id = int(fields["task_id"])
-                    handle_task(task_id)
+                    message = decode_emoji_task(fields)
+                    handle_task(message.task_id, message_data(message, redelivered=redelivered))
                     r.xack(STREAM, GROUP, msg_id)
                 except Exception as e:
                     logger.exception("failed processing message %s: %s", msg_id, e)
+                finally:
+                    # Unacknowledged failures become idle and are retried by a reclaim loop.
+                    _owned.discard(msg_id)
         except Exception as e:
             logger.exception("worker loop error: %s", e)
             time.sleep(1)
 
 
+def reclaim_once(r: Redis) -> list[reclaimer.Message]:
+    """One reclaim tick (see worker/reclaimer.py); returns the entries to process."""
+    reclaimer.touch(r, stream=STREAM, group=GROUP, consumer=CONSUMER, ids=list(_owned))
+    result = reclaimer.reclaim_batch(
+        r,
+        stream=STREAM,
+        group=GROUP,
+        consumer=CONSUMER,
+        dead_letter_stream=EMOJI_TASK_DEAD_LETTER_STREAM,
+    )
+    for _msg_id, fields in result.dead:
+        fail_task(decode_emoji_task(fields).task_id, "Task processing retries exhausted")
+    _owned.update(msg_id for msg_id, _ in result.messages)
+    return result.messages
+
+
+def run_reclaimer(stop: threading.Event | None = None) -> None:
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            for message in reclaim_once(get_redis()):
+                _reclaimed.put(message)
+        except Exception as e:
+            logger.exception("reclaim error: %s", e)
+        stop.wait(settings.EMOJI_RECLAIM_INTERVAL_SECONDS)
+
+
+# ---------------------------------------------------------------------------
+# Async mode: many in-flight DashScope tasks per process. Remote calls share
+# one httpx.AsyncClient; blocking DB / OSS work is pushed to threads.
+# ---------------------------------------------------------------------------
+
+
+async def handle_task_async(task_id: int, data: dict[str, Any] | None = None) -> None:
+    task = await asyncio.to_thread(start_task, task_id, data)
+    if task is None:
+        return
+
+    if settings.ALIYUN_EMOJI_MOCK:
+        await finish_task_async(task, EmojiTaskStatus.completed, result_url=MOCK_RESULT_URL)
+        return
+
+    bboxes = task_bboxes(task)
+    if bboxes is None:
+        await finish_task_async(
+            task, EmojiTaskStatus.failed, error_message="Missing face bbox from detect_result"
+        )
+        return
+
+    if not task.aliyun_task_id:
+        created = await aliyun_emoji_client.create_task_async(
+            image_url=task.source_image_url,
+            driven_id=task.driven_id,
+            face_bbox=bboxes[0],
+            ext_bbox=bboxes[1],
+        )
+        await save_aliyun_task_id_async(task, created.task_id)
+    aliyun_task_id = task.aliyun_task_id or ""
+
+    async def poll_once() -> bool:
+        result = await aliyun_emoji_client.get_task_async(task_id=aliyun_task_id)
+        return await apply_remote_result_async(task, result)
+
+    done = poll_scheduler().track(aliyun_task_id, poll_once)
+    try:
+        await asyncio.wait_for(done, timeout=settings.EMOJI_POLL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        await finish_task_async(task, EmojiTaskStatus.failed, error_message="DashScope task timeout")
+
+
+def poll_scheduler() -> PollScheduler:
+    """The process-wide scheduler for the running event loop (created on first use)."""
+    global _scheduler
+    if _scheduler is None or _scheduler.loop is not asyncio.get_running_loop():
+        _scheduler = PollScheduler()
+        _scheduler.start()
+    return _scheduler
+
+
+async def listen_poll_hints() -> None:
+    """Forward completion callbacks to the scheduler so those tasks are checked now."""
+    while True:
+        try:
+            pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(POLL_HINT_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    poll_scheduler().poke(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("poll hint listener error: %s", e)
+            await asyncio.sleep(1)
+
+
+async def process_message_async(
+    msg_id: str, fields: dict[str, str], *, redelivered: bool = False
+) -> None:
+    try:
+        message = decode_emoji_task(fields)
+        await handle_task_async(message.task_id, message_data(message, redelivered=redelivered))
+        await get_async_redis().xack(STREAM, GROUP, msg_id)
+    except Exception as e:
+        logger.exception("failed processing message %s: %s", msg_id, e)
+    finally:
+        _owned.discard(msg_id)
+
+
+async def reclaim_loop(process: Callable[[reclaimer.Message], None]) -> None:
+    """Async-mode reclaim ticks; claimed entries are handed to `process`."""
+    while True:
+        try:
+            for message in await asyncio.to_thread(reclaim_once, get_redis()):
+                process(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("reclaim error: %s", e)
+        await asyncio.sleep(settings.EMOJI_RECLAIM_INTERVAL_SECONDS)
+
+
+async def main_async() -> None:
+    refresh_config()
+    ensure_consumer_group()
+    if settings.OUTBOX_RELAY_IN_WORKER:
+        outbox_relay.start_in_background()
+    aliyun_emoji_client.open()
+    r = get_async_redis()
+    next_refresh_at = time.time() + CONFIG_REFRESH_INTERVAL_SECONDS
+    concurrency = max(1, settings.EMOJI_WORKER_CONCURRENCY)
+    # to_thread runs on the loop's default executor, min(32, cpu + 4) threads
+    # unless replaced; size it so every in-flight task can get a thread for
+    # its DB / OSS work (plus the reclaim tick and config refresh).
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=concurrency + 2, thread_name_prefix="emoji-worker")
+    )
+    in_flight: set[asyncio.Task[None]] = set()
+    hints = asyncio.create_task(listen_poll_hints()) if settings.EMOJI_CALLBACK_ENABLED else None
+
+    def process(message: reclaimer.Message, redelivered: bool = False) -> None:
+        t = asyncio.create_task(process_message_async(*message, redelivered=redelivered))
+        in_flight.add(t)
+        t.add_done_callback(in_flight.discard)
+
+    # Reclaimed entries are taken even at the concurrency cap so recovery
+    # keeps pace under load; each tick adds at most EMOJI_RECLAIM_BATCH_SIZE.
+    reclaim = asyncio.create_task(reclaim_loop(lambda m: process(m, redelivered=True)))
+
+    logger.info(
+        "emoji worker started (async): stream=%s group=%s consumer=%s concurrency=%s",
+        STREAM,
+        GROUP,
+        CONSUMER,
+        concurrency,
+    )
+
+    try:
+        while True:
+            try:
+                if time.time() >= next_refresh_at:
+                    next_refresh_at = await asyncio.to_thread(maybe_refresh_config, next_refresh_at)
+                free = concurrency - len(in_flight)
+                if free <= 0:
+                    # At the cap: wait for a slot instead of pulling more work.
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                resp = await r.xreadgroup(
+                    GROUP,
+                    CONSUMER,
+                    {STREAM: ">"},
+                    count=min(free, 100),
+                    block=5000,
+                )
+                for _stream, batch in resp or []:
+                    _owned.update(msg_id for msg_id, _ in batch)
+                    for message in batch:
+                        process(message)
+            except Exception as e:
+                logger.exception("worker loop error: %s", e)
+                await asyncio.sleep(1)
+    finally:
+        reclaim.cancel()
+        for t in in_flight:
+            t.cancel()
+        if hints is not None:
+            hints.cancel()
+        await aliyun_emoji_client.aclose()
+
+
 if __name__ == "__main__":  # pragma: no cover
     main()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import logging
+import threading
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.redis import get_redis
+from app.services.outbox import relay_batch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("outbox_relay")
+
+
+def relay_once() -> int:
+    with Session(engine) as session:
+        return relay_batch(
+            session=session,
+            rds=get_redis(),
+            batch_size=settings.OUTBOX_RELAY_BATCH_SIZE,
+            maxlen=settings.EMOJI_STREAM_MAXLEN,
+        )
+
+
+def run(stop: threading.Event | None = None) -> None:
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            published = relay_once()
+        except Exception as e:
+            logger.exception("outbox relay error: %s", e)
+            stop.wait(1)
+            continue
+        # A full batch means there is likely more waiting; go again immediately.
+        if published < settings.OUTBOX_RELAY_BATCH_SIZE:
+            stop.wait(settings.OUTBOX_RELAY_INTERVAL_SECONDS)
+
+
+def start_in_background() -> threading.Thread:
+    t = threading.Thread(target=run, name="outbox-relay", daemon=True)
+    t.start()
+    logger.info("outbox relay started in background")
+    return t
+
+
+def main() -> None:
+    logger.info("outbox relay started")
+    run()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
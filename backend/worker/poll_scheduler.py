@@ -0,0 +1,144 @@
+"""Adaptive DashScope polling for all in-flight tasks of one worker process.
+
+Instead of every task sleeping a flat EMOJI_POLL_INTERVAL_SECONDS between
+checks, each remote task gets an adaptive schedule: the first check comes
+after EMOJI_POLL_INITIAL_SECONDS and the gap grows by EMOJI_POLL_BACKOFF_FACTOR
+up to EMOJI_POLL_INTERVAL_SECONDS. Short jobs are noticed quickly and long
+jobs cost fewer calls. In async mode a single PollScheduler keeps the
+next-check times of every in-flight task in one heap and wakes only when the
+earliest is due. A completion callback can pull a task's check forward with
+poke().
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import random
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+
+def poll_delay(attempt: int) -> float:
+    """Seconds to wait before check number `attempt` (0-based) of one remote task."""
+    if settings.EMOJI_CALLBACK_ENABLED:
+        # Callbacks report completion; polling is only a safety net.
+        base = float(settings.EMOJI_CALLBACK_FALLBACK_POLL_SECONDS)
+    else:
+        base = min(
+            float(settings.EMOJI_POLL_INTERVAL_SECONDS),
+            settings.EMOJI_POLL_INITIAL_SECONDS * settings.EMOJI_POLL_BACKOFF_FACTOR**attempt,
+        )
+    # +-10% jitter so tasks created together don't poll in lockstep.
+    return base * random.uniform(0.9, 1.1)
+
+
+@dataclass
+class _Tracked:
+    key: str
+    poll: Callable[[], Awaitable[bool]]
+    done: asyncio.Future[None]
+    attempt: int = 0
+    version: int = 0
+    polling: bool = False
+    poked: bool = False
+
+
+@dataclass(order=True)
+class _Slot:
+    due: float
+    seq: int
+    version: int = field(compare=False)
+    tracked: _Tracked = field(compare=False)
+
+
+class PollScheduler:
+    """Min-heap of next-check times; one loop drives the polls of every tracked task."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._heap: list[_Slot] = []
+        self._tracked: dict[str, _Tracked] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task[None] | None = None
+        self._polls: set[asyncio.Task[None]] = set()
+
+    def start(self) -> None:
+        self._runner = self.loop.create_task(self.run())
+
+    def __len__(self) -> int:
+        return len(self._tracked)
+
+    def track(self, key: str, poll: Callable[[], Awaitable[bool]]) -> asyncio.Future[None]:
+        """Poll `poll()` on the adaptive schedule until it returns True.
+
+        The returned future resolves when the task is final, or carries the
+        exception a poll raised. Cancelling it stops tracking.
+        """
+        tracked = _Tracked(key=key, poll=poll, done=self.loop.create_future())
+        tracked.done.add_done_callback(lambda _f: self._tracked.pop(key, None))
+        self._tracked[key] = tracked
+        self._push(tracked, poll_delay(0))
+        return tracked.done
+
+    def poke(self, key: str) -> bool:
+        """Check `key` now (e.g. on a completion callback). False if not tracked here."""
+        tracked = self._tracked.get(key)
+        if tracked is None:
+            return False
+        if tracked.polling:
+            tracked.poked = True  # check again right after the running poll
+            return True
+        tracked.version += 1  # the previously scheduled slot becomes stale
+        self._push(tracked, 0.0)
+        return True
+
+    def _push(self, tracked: _Tracked, delay: float) -> None:
+        slot = _Slot(self.loop.time() + delay, next(self._seq), tracked.version, tracked)
+        heapq.heappush(self._heap, slot)
+        if self._heap[0] is slot:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            wait = self._heap[0].due - self.loop.time()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            slot = heapq.heappop(self._heap)
+            tracked = slot.tracked
+            if tracked.done.done() or slot.version != tracked.version:
+                continue
+            tracked.polling = True
+            t = self.loop.create_task(self._poll(tracked))
+            self._polls.add(t)
+            t.add_done_callback(self._polls.discard)
+
+    async def _poll(self, tracked: _Tracked) -> None:
+        try:
+            final = await tracked.poll()
+        except Exception as e:
+            if not tracked.done.done():
+                tracked.done.set_exception(e)
+            return
+        finally:
+            tracked.polling = False
+        if tracked.done.done():
+            return
+        if final:
+            tracked.done.set_result(None)
+            return
+        tracked.attempt += 1
+        delay = 0.0 if tracked.poked else poll_delay(tracked.attempt)
+        tracked.poked = False
+        self._push(tracked, delay)
@@ -0,0 +1,98 @@
+"""Recover stream entries left pending by crashed or stuck consumers.
+
+Every worker process runs a reclaim loop on its own cadence
+(EMOJI_RECLAIM_INTERVAL_SECONDS), independent of how busy its read loop is.
+Each tick it:
+  - resets the idle time of the entries it still works on (XCLAIM JUSTID,
+    which does not count as a delivery), so long-running tasks are not taken
+    over by other consumers,
+  - claims up to EMOJI_RECLAIM_BATCH_SIZE entries idle for at least
+    EMOJI_RECLAIM_MIN_IDLE_SECONDS with XAUTOCLAIM. The scan cursor is kept
+    in Redis and shared by all workers, so successive ticks walk the whole
+    pending list instead of rescanning its head; it wraps to 0-0 after a
+    full pass,
+  - moves entries delivered more than EMOJI_RECLAIM_MAX_DELIVERIES times to
+    the dead-letter stream (with their source id and delivery count) and
+    acknowledges them.
+"""
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from redis import Redis
+
+from app.core.config import settings
+
+logger = logging.getLogger("emoji_worker.reclaimer")
+
+Message = tuple[str, dict[str, str]]
+
+
+def cursor_key(stream: str, group: str) -> str:
+    return f"{stream}:{group}:reclaim_cursor"
+
+
+@dataclass
+class Reclaimed:
+    messages: list[Message] = field(default_factory=list)  # claimed, to be processed
+    dead: list[Message] = field(default_factory=list)  # moved to the dead-letter stream
+
+
+def touch(r: Redis, *, stream: str, group: str, consumer: str, ids: Iterable[str]) -> None:
+    """Mark entries this consumer is still processing as recently active."""
+    ids = list(ids)
+    if ids:
+        r.xclaim(stream, group, consumer, min_idle_time=0, message_ids=ids, justid=True)
+
+
+def reclaim_batch(
+    r: Redis, *, stream: str, group: str, consumer: str, dead_letter_stream: str
+) -> Reclaimed:
+    """Claim the next batch of stale entries for `consumer`, dead-lettering poison ones."""
+    key = cursor_key(stream, group)
+    start = r.get(key) or "0-0"
+    resp: Any = r.xautoclaim(
+        stream,
+        group,
+        consumer,
+        min_idle_time=settings.EMOJI_RECLAIM_MIN_IDLE_SECONDS * 1000,
+        start_id=start,
+        count=settings.EMOJI_RECLAIM_BATCH_SIZE,
+    )
+    r.set(key, resp[0])
+    # Entries trimmed from the stream come back without an id on Redis 6.2.
+    claimed: list[Message] = [(i, f) for i, f in resp[1] if i is not None]
+    if not claimed:
+        return Reclaimed()
+
+    pipe: Any = r.pipeline(transaction=False)
+    for msg_id, _fields in claimed:
+        pipe.xpending_range(stream, group, min=msg_id, max=msg_id, count=1)
+    deliveries = [rows[0]["times_delivered"] if rows else 0 for rows in pipe.execute()]
+
+    result = Reclaimed()
+    pipe = r.pipeline(transaction=True)
+    for (msg_id, fields), n in zip(claimed, deliveries, strict=True):
+        if n <= settings.EMOJI_RECLAIM_MAX_DELIVERIES:
+            result.messages.append((msg_id, fields))
+            continue
+        pipe.xadd(
+            dead_letter_stream,
+            {**fields, "source_id": msg_id, "deliveries": str(n)},
+            maxlen=settings.EMOJI_DEAD_LETTER_MAXLEN,
+            approximate=True,
+        )
+        pipe.xack(stream, group, msg_id)
+        result.dead.append((msg_id, fields))
+    if result.dead:
+        pipe.execute()
+        logger.warning(
+            "moved %s entries to %s: %s",
+            len(result.dead),
+            dead_letter_stream,
+            ", ".join(msg_id for msg_id, _ in result.dead),
+        )
+    return result
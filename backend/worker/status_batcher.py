@@ -0,0 +1,154 @@
+"""Batched emoji task status writes for the worker fast path.
+
+With EMOJI_WORKER_FAST_PATH the worker builds tasks from the stream message
+instead of loading them, and status transitions (processing, completed,
+failed) are queued here rather than committed one by one. A background
+thread flushes the queue every EMOJI_STATUS_FLUSH_INTERVAL_SECONDS, or as
+soon as EMOJI_STATUS_BATCH_SIZE tasks are waiting. On PostgreSQL a flush is
+one statement:
+
+    UPDATE emoji_tasks AS t SET ... FROM (VALUES (...), (...)) AS v(...)
+    WHERE t.id = v.id AND t.status NOT IN ('completed', 'failed')
+
+Only the latest transition per task is written. Tasks that are already
+final are left untouched, so a redelivered message can't overwrite a
+finished task. Events are published for the rows actually updated, from a
+snapshot taken together with the row at submit time: the worker keeps
+mutating the task object, so publishing the live object could announce a
+state (e.g. completed with its result_url) that is not stored yet.
+
+submit() returns a future that resolves when the transition is committed.
+Callers wait on it for final states before acknowledging the message.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any
+
+from sqlalchemy import func, text, update
+from sqlmodel import Session, col
+
+from app.core.config import settings
+from app.core.db import engine
+from app.enums import EmojiTaskStatus
+from app.models import EmojiTask
+from app.services.task_events import publish_task_snapshot, task_snapshot
+
+logger = logging.getLogger("emoji_worker.status_batcher")
+
+_FINAL = (EmojiTaskStatus.completed.value, EmojiTaskStatus.failed.value)
+
+_ROW_SQL = (
+    "(CAST(:id_{i} AS BIGINT), CAST(:status_{i} AS VARCHAR), CAST(:aliyun_task_id_{i} AS VARCHAR),"
+    " CAST(:result_url_{i} AS VARCHAR), CAST(:error_message_{i} AS TEXT),"
+    " CAST(:completed_at_{i} AS TIMESTAMPTZ))"
+)
+
+_UPDATE_SQL = """
+    UPDATE emoji_tasks AS t
+    SET status = v.status,
+        aliyun_task_id = COALESCE(v.aliyun_task_id, t.aliyun_task_id),
+        result_url = COALESCE(v.result_url, t.result_url),
+        error_message = v.error_message,
+        completed_at = v.completed_at
+    FROM (VALUES {rows}) AS v(id, status, aliyun_task_id, result_url, error_message, completed_at)
+    WHERE t.id = v.id AND t.status NOT IN ('completed', 'failed')
+    RETURNING t.id
+"""
+
+
+def task_row(task: EmojiTask) -> dict[str, Any]:
+    return {
+        "id": task.id,
+        "status": EmojiTaskStatus(task.status).value,
+        "aliyun_task_id": task.aliyun_task_id,
+        "result_url": task.result_url,
+        "error_message": task.error_message,
+        "completed_at": task.completed_at,
+    }
+
+
+def write_rows(session: Session, rows: list[dict[str, Any]]) -> set[int]:
+    """Apply the rows (without committing); returns the ids actually updated."""
+    if session.get_bind().dialect.name == "postgresql":
+        sql = _UPDATE_SQL.format(rows=", ".join(_ROW_SQL.format(i=i) for i in range(len(rows))))
+        params = {f"{k}_{i}": v for i, row in enumerate(rows) for k, v in row.items()}
+        return set(session.exec(text(sql), params=params).scalars())  # type: ignore[call-overload]
+
+    # Portable path: one conditional UPDATE per task in the same transaction.
+    updated = set()
+    for row in rows:
+        stmt = (
+            update(EmojiTask)
+            .where(col(EmojiTask.id) == row["id"], col(EmojiTask.status).not_in(_FINAL))
+            .values(
+                status=row["status"],
+                aliyun_task_id=func.coalesce(row["aliyun_task_id"], EmojiTask.aliyun_task_id),
+                result_url=func.coalesce(row["result_url"], EmojiTask.result_url),
+                error_message=row["error_message"],
+                completed_at=row["completed_at"],
+            )
+        )
+        if session.exec(stmt).rowcount:  # type: ignore[call-overload]
+            updated.add(row["id"])
+    return updated
+
+
+class StatusBatcher:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # task id -> (row to write, event snapshot of the same state, waiting futures)
+        self._pending: dict[int, tuple[dict[str, Any], dict[str, Any], list[Future[None]]]] = {}
+        self._wakeup = threading.Event()
+
+    def submit(self, task: EmojiTask) -> Future[None]:
+        """Queue the task's current state; the future resolves once it is committed."""
+        future: Future[None] = Future()
+        with self._lock:
+            # A newer transition replaces a queued one; both callers are notified.
+            _, _, futures = self._pending.get(task.id, (None, None, []))
+            futures.append(future)
+            self._pending[task.id] = (task_row(task), task_snapshot(task), futures)
+            full = len(self._pending) >= settings.EMOJI_STATUS_BATCH_SIZE
+        if full:
+            self._wakeup.set()
+        return future
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        entries = list(batch.values())
+        try:
+            with Session(engine) as session:
+                updated = write_rows(session, [row for row, _, _ in entries])
+                session.commit()
+        except Exception as e:
+            for _, _, futures in entries:
+                for f in futures:
+                    f.set_exception(e)
+            raise
+        for row, snapshot, futures in entries:
+            if row["id"] in updated:
+                publish_task_snapshot(snapshot)
+            for f in futures:
+                f.set_result(None)
+        return len(entries)
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self._wakeup.wait(settings.EMOJI_STATUS_FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("status flush failed: %s", e)
+
+    def start_in_background(self) -> threading.Thread:
+        t = threading.Thread(target=self.run, name="emoji-status-batcher", daemon=True)
+        t.start()
+        return t
@@ -0,0 +1,92 @@
+"""Retention for the emoji task stream.
+
+XACK only clears a consumer group's pending list; the entries themselves
+stay in the stream. Two mechanisms keep the stream, and Redis memory, flat:
+
+  - the outbox relay adds entries with an approximate MAXLEN of
+    EMOJI_STREAM_MAXLEN, a hard cap that should sit well above any real backlog;
+  - trim_once() drops entries that every consumer group has acknowledged and
+    that are older than EMOJI_STREAM_RETENTION_SECONDS, using XTRIM MINID.
+    The trim point never passes a group's oldest pending entry or its
+    last-delivered id, so unprocessed entries are never removed.
+
+The worker supervisor calls trim_once() on every metrics tick; main() runs it
+standalone for deployments without the supervisor.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from redis import Redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services.outbox import EMOJI_TASK_STREAM
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("stream_janitor")
+
+
+@dataclass
+class StreamUsage:
+    length: int
+    memory_bytes: int | None
+    trimmed: int
+
+
+def _parse_id(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def trim_point(r: Redis, stream: str, *, now: float | None = None) -> str:
+    """The lowest id still needed: entries below it are acknowledged and past the horizon."""
+    now = time.time() if now is None else now
+    horizon_ms = int((now - settings.EMOJI_STREAM_RETENTION_SECONDS) * 1000)
+    groups = r.xinfo_groups(stream)
+    if not groups:
+        return "0-0"  # nobody has read the stream yet
+    point = (max(horizon_ms, 0), 0)
+    for group in groups:
+        # Entries after last-delivered-id have not been read by this group yet.
+        ms, seq = _parse_id(group["last-delivered-id"])
+        point = min(point, (ms, seq + 1))
+        if group["pending"]:
+            oldest = r.xpending(stream, group["name"])["min"]
+            point = min(point, _parse_id(oldest))
+    return f"{point[0]}-{point[1]}"
+
+
+def trim_once(r: Redis, stream: str = EMOJI_TASK_STREAM) -> StreamUsage:
+    trimmed = r.xtrim(stream, minid=trim_point(r, stream), approximate=True)
+    usage = StreamUsage(length=r.xlen(stream), memory_bytes=r.memory_usage(stream), trimmed=trimmed)
+    logger.info(
+        "stream %s: length=%s memory_bytes=%s trimmed=%s",
+        stream,
+        usage.length,
+        usage.memory_bytes,
+        usage.trimmed,
+    )
+    return usage
+
+
+def run(stop: threading.Event | None = None) -> None:
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            trim_once(get_redis())
+        except Exception as e:
+            logger.exception("stream janitor error: %s", e)
+        stop.wait(settings.EMOJI_WORKER_METRICS_INTERVAL_SECONDS)
+
+
+def main() -> None:
+    logger.info("stream janitor started")
+    run()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,167 @@
+"""Run a pool of emoji worker processes on one host and report queue metrics.
+
+Each child is a regular emoji worker (sync or async mode) reading the stream
+as its own consumer with a freshly generated name, so throughput scales by
+raising EMOJI_WORKER_PROCESSES or by running the supervisor on more hosts.
+Children that exit are replaced under a new name.
+
+Every EMOJI_WORKER_METRICS_INTERVAL_SECONDS the supervisor:
+  - collects queue depth (XLEN, group lag), pending entries (XPENDING) and
+    per-consumer pending / idle time / age of the oldest pending entry,
+  - logs them and stores them as JSON under METRICS_KEY for autoscalers,
+  - trims acknowledged entries past the retention horizon (stream_janitor),
+  - removes dead consumers (XGROUP DELCONSUMER): its own exited children and
+    any consumer idle for EMOJI_WORKER_DEAD_CONSUMER_SECONDS, but only once
+    their pending list is empty. Deleting a consumer drops its pending
+    entries, so those are left for XAUTOCLAIM to move to a live consumer first.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from redis import Redis
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.redis import get_redis
+from worker import emoji_worker, stream_janitor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("emoji_worker_supervisor")
+
+METRICS_KEY = "emoji_worker:metrics"
+
+
+def run_consumer(name: str) -> None:
+    # Children inherit the supervisor's stop handlers; restore the defaults so
+    # terminate() ends them.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Forked children must not reuse the parent's pooled DB connections.
+    engine.dispose(close=False)
+    emoji_worker.CONSUMER = name
+    emoji_worker.main()
+
+
+def collect_metrics(r: Redis) -> dict[str, Any]:
+    """Queue depth, pending counts and per-consumer lag of the emoji worker group."""
+    stream, group = emoji_worker.STREAM, emoji_worker.GROUP
+    length, memory = r.xlen(stream), r.memory_usage(stream)
+    info = next((g for g in r.xinfo_groups(stream) if g["name"] == group), None)
+    if info is None:
+        return {
+            "stream_length": length,
+            "memory_bytes": memory,
+            "lag": None,
+            "pending": 0,
+            "consumers": [],
+        }
+
+    consumers = r.xinfo_consumers(stream, group)
+    pipe: Any = r.pipeline(transaction=False)
+    for c in consumers:
+        pipe.xpending_range(stream, group, min="-", max="+", count=1, consumername=c["name"])
+    oldest = pipe.execute() if consumers else []
+
+    return {
+        "stream_length": length,
+        "memory_bytes": memory,
+        # Entries not yet delivered to any consumer (Redis 7+; None when unknown).
+        "lag": info.get("lag"),
+        "pending": info["pending"],
+        "consumers": [
+            {
+                "name": c["name"],
+                "pending": c["pending"],
+                "idle_ms": c["idle"],
+                "oldest_pending_ms": head[0]["time_since_delivered"] if head else 0,
+            }
+            for c, head in zip(consumers, oldest, strict=True)
+        ],
+    }
+
+
+def publish_metrics(r: Redis, metrics: dict[str, Any]) -> None:
+    r.set(METRICS_KEY, json.dumps(metrics), ex=settings.EMOJI_WORKER_METRICS_INTERVAL_SECONDS * 4)
+    logger.info(
+        "emoji queue: length=%s memory_bytes=%s lag=%s pending=%s consumers=%s max_oldest_pending_ms=%s",
+        metrics["stream_length"],
+        metrics["memory_bytes"],
+        metrics["lag"],
+        metrics["pending"],
+        len(metrics["consumers"]),
+        max((c["oldest_pending_ms"] for c in metrics["consumers"]), default=0),
+    )
+
+
+def cleanup_dead_consumers(
+    r: Redis, metrics: dict[str, Any], *, live: set[str], exited: set[str]
+) -> list[str]:
+    """Delete consumers that are gone and hold no pending entries; returns their names."""
+    dead_after_ms = settings.EMOJI_WORKER_DEAD_CONSUMER_SECONDS * 1000
+    removed = []
+    for c in metrics["consumers"]:
+        name = c["name"]
+        if name in live or c["pending"]:
+            continue
+        if name in exited or c["idle_ms"] >= dead_after_ms:
+            r.xgroup_delconsumer(emoji_worker.STREAM, emoji_worker.GROUP, name)
+            exited.discard(name)
+            removed.append(name)
+    if removed:
+        logger.info("removed dead consumers: %s", ", ".join(removed))
+    return removed
+
+
+def supervise(processes: int, stop: threading.Event) -> None:
+    ctx = multiprocessing.get_context("fork")
+    children: dict[str, BaseProcess] = {}
+    exited: set[str] = set()
+    r = get_redis()
+    try:
+        while not stop.is_set():
+            for name, p in list(children.items()):
+                if not p.is_alive():
+                    logger.warning("consumer %s exited with code %s", name, p.exitcode)
+                    del children[name]
+                    exited.add(name)
+            while len(children) < processes:
+                name = emoji_worker.consumer_name()
+                p = ctx.Process(target=run_consumer, args=(name,), name=name, daemon=True)
+                p.start()
+                children[name] = p
+                logger.info("started consumer %s (pid %s)", name, p.pid)
+
+            try:
+                stream_janitor.trim_once(r)
+                metrics = collect_metrics(r)
+                publish_metrics(r, metrics)
+                cleanup_dead_consumers(r, metrics, live=set(children), exited=exited)
+            except Exception as e:
+                logger.exception("metrics / cleanup failed: %s", e)
+            stop.wait(settings.EMOJI_WORKER_METRICS_INTERVAL_SECONDS)
+    finally:
+        for p in children.values():
+            p.terminate()
+        for p in children.values():
+            p.join(timeout=10)
+
+
+def main() -> None:
+    emoji_worker.ensure_consumer_group()
+    processes = max(1, settings.EMOJI_WORKER_PROCESSES)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    logger.info("emoji worker supervisor started: processes=%s", processes)
+    supervise(processes, stop)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,66 +1,476 @@
 from __future__ import annotations
 
 import logging
+import os
+import socket
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
-from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from redis import Redis
+from sqlalchemy import case, func, text, update
+from sqlmodel import Session, col, select
 
-from app import crud
+from app.core.config import settings
 from app.core.db import engine
+from app.core.redis import get_redis
+from app.core.snowflake import generate_id
+from app.crud import bump_user_stats
 from app.enums import PointTransactionType, SubscriptionStatus, VipType
-from app.models import Subscription
+from app.models import PointTransaction, Subscription, UserPoints
+from app.services import points_cache
 from app.services.config_service import get_config, refresh_config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("weekly_points_reward")
 
+# One statement per chunk on PostgreSQL:
+#   chunk  - the chunk's users with their reward amount (lifetime wins over weekly)
+#            and a pre-generated snowflake id for the ledger row
+#   locked - their user_points rows, locked so balance_after matches the update
+#   ins    - ledger rows; idx_user_reward_week + ON CONFLICT DO NOTHING makes
+#            reruns and overlapping runs no-ops for users already rewarded
+#   stats  - bumps the per-user ledger counter for the inserted rows; a missing
+#            counter row is seeded from the real counts (the ledger rows inserted
+#            by this statement aren't visible to count(*) yet, hence the + 1)
+#   UPDATE - credits only the users whose ledger row was actually inserted and
+#            returns the new balances for the balance cache
+_REWARD_CHUNK_SQL = text(
+    """
+    WITH chunk AS (
+        SELECT c.user_id, c.tx_id,
+               MAX(CASE WHEN s.plan_type = :weekly_plan THEN :weekly_amount
+                        ELSE :lifetime_amount END) AS amount
+        FROM unnest(CAST(:user_ids AS bigint[]), CAST(:tx_ids AS bigint[])) AS c(user_id, tx_id)
+        JOIN subscriptions s ON s.user_id = c.user_id AND s.status = :active
+        GROUP BY c.user_id, c.tx_id
+    ),
+    locked AS (
+        SELECT up.user_id, up.balance, chunk.tx_id, chunk.amount
+        FROM user_points up
+        JOIN chunk ON chunk.user_id = up.user_id
+        FOR UPDATE OF up
+    ),
+    ins AS (
+        INSERT INTO point_transactions
+            (id, user_id, type, amount, balance_after, reward_week, created_at)
+        SELECT tx_id, user_id, :reward_type, amount, balance + amount, :reward_week, :now
+        FROM locked
+        ON CONFLICT (user_id, reward_week) WHERE reward_week IS NOT NULL DO NOTHING
+        RETURNING user_id, amount
+    ),
+    stats AS (
+        UPDATE user_stats s
+        SET point_transactions = s.point_transactions + 1, updated_at = :now
+        FROM ins
+        WHERE s.user_id = ins.user_id
+    ),
+    -- counts only run for users that have no user_stats row yet
+    stats_seed AS (
+        INSERT INTO user_stats (user_id, emoji_tasks, point_transactions, orders, updated_at)
+        SELECT ins.user_id,
+               (SELECT count(*) FROM emoji_tasks t WHERE t.user_id = ins.user_id),
+               (SELECT count(*) FROM point_transactions p WHERE p.user_id = ins.user_id) + 1,
+               (SELECT count(*) FROM orders o WHERE o.user_id = ins.user_id),
+               :now
+        FROM ins
+        WHERE NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = ins.user_id)
+        ON CONFLICT (user_id) DO UPDATE
+        SET point_transactions = user_stats.point_transactions + 1, updated_at = :now
+    )
+    UPDATE user_points up
+    SET balance = up.balance + ins.amount, version = up.version + 1, updated_at = :now
+    FROM ins
+    WHERE up.user_id = ins.user_id
+    RETURNING up.user_id, up.balance, up.version
+    """
+)
+
+
+@dataclass
+class RewardAmounts:
+    weekly: int
+    lifetime: int
+
+
+@dataclass
+class RewardStats:
+    chunks: int = 0
+    users: int = 0
+    awarded: int = 0
+    last_user_id: int = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.users - self.awarded
+
 
 def _current_reward_week(now: datetime) -> str:
     iso = now.isocalendar()
     return f"{iso.year}-W{iso.week:02d}"
 
 
-def main() -> None:
-    refresh_config()
-    now = datetime.now(timezone.utc)
-    reward_week = _current_reward_week(now)
+def _reward_amounts() -> RewardAmounts:
     cfg = get_config()
+    return RewardAmounts(
+        weekly=int(cfg.get("weekly_reward", {}).get("weekly", 2000)),
+        lifetime=int(cfg.get("weekly_reward", {}).get("lifetime", 3000)),
+    )
+
+
+def next_chunk(
+    session: Session,
+    *,
+    after: int,
+    limit: int,
+    until: int | None = None,
+    shard: tuple[int, int] | None = None,
+) -> list[int]:
+    """Next `limit` user ids with an active subscription, keyset-paginated by user_id.
+
+    `shard=(k, n)` restricts to user_id % n == k.
+    """
+    stmt = (
+        select(Subscription.user_id)
+        .where(Subscription.status == SubscriptionStatus.active, Subscription.user_id > after)
+        .distinct()
+        .order_by(col(Subscription.user_id))
+        .limit(limit)
+    )
+    if until is not None:
+        stmt = stmt.where(Subscription.user_id <= until)
+    if shard is not None:
+        index, count = shard
+        stmt = stmt.where(col(Subscription.user_id) % count == index)
+    return list(session.exec(stmt).all())
 
-    weekly_amount = int(cfg.get("weekly_reward", {}).get("weekly", 2000))
-    lifetime_amount = int(cfg.get("weekly_reward", {}).get("lifetime", 3000))
 
+def _ensure_points_rows(session: Session, user_ids: list[int]) -> None:
+    # create_user always creates the account; this only covers legacy rows.
+    existing = set(
+        session.exec(select(UserPoints.user_id).where(col(UserPoints.user_id).in_(user_ids))).all()
+    )
+    for user_id in user_ids:
+        if user_id not in existing:
+            session.add(UserPoints(user_id=user_id, balance=0))
+    if len(existing) < len(user_ids):
+        session.flush()
+
+
+def _reward_chunk_portable(
+    session: Session, user_ids: list[int], *, reward_week: str, amounts: RewardAmounts, now: datetime
+) -> list[tuple[int, int, int]]:
+    # Fallback for databases without DML in CTEs (SQLite in tests): same result,
+    # a handful of statements per chunk inside one transaction.
+    amount_expr = func.max(
+        case((Subscription.plan_type == VipType.weekly, amounts.weekly), else_=amounts.lifetime)
+    )
+    per_user = dict(
+        session.exec(
+            select(Subscription.user_id, amount_expr)
+            .where(
+                Subscription.status == SubscriptionStatus.active,
+                col(Subscription.user_id).in_(user_ids),
+            )
+            .group_by(col(Subscription.user_id))
+        ).all()
+    )
+    done = set(
+        session.exec(
+            select(PointTransaction.user_id).where(
+                PointTransaction.reward_week == reward_week,
+                col(PointTransaction.user_id).in_(user_ids),
+            )
+        ).all()
+    )
+    balances = dict(
+        session.exec(
+            select(UserPoints.user_id, UserPoints.balance)
+            .where(col(UserPoints.user_id).in_(user_ids))
+            .with_for_update()
+        ).all()
+    )
+
+    awarded: list[int] = []
+    for user_id, amount in per_user.items():
+        if user_id in done or user_id not in balances:
+            continue
+        session.add(
+            PointTransaction(
+                user_id=user_id,
+                type=PointTransactionType.reward,
+                amount=amount,
+                balance_after=balances[user_id] + amount,
+                reward_week=reward_week,
+                created_at=now,
+            )
+        )
+        session.exec(  # type: ignore[call-overload]
+            update(UserPoints)
+            .where(col(UserPoints.user_id) == user_id)
+            .values(
+                balance=UserPoints.balance + amount, version=UserPoints.version + 1, updated_at=now
+            )
+        )
+        bump_user_stats(session=session, user_id=user_id, point_transactions=1)
+        awarded.append(user_id)
+    if not awarded:
+        return []
+    rows = session.exec(
+        select(UserPoints.user_id, UserPoints.balance, UserPoints.version).where(
+            col(UserPoints.user_id).in_(awarded)
+        )
+    ).all()
+    return [(row.user_id, row.balance, row.version) for row in rows]
+
+
+def reward_chunk(
+    session: Session, user_ids: list[int], *, reward_week: str, amounts: RewardAmounts
+) -> int:
+    """Reward one chunk of users in a single transaction. Returns how many were credited."""
+    now = datetime.now(timezone.utc)
+    _ensure_points_rows(session, user_ids)
+    if session.get_bind().dialect.name == "postgresql":
+        rows = session.exec(  # type: ignore[call-overload]
+            _REWARD_CHUNK_SQL,
+            params={
+                "user_ids": user_ids,
+                "tx_ids": [generate_id() for _ in user_ids],
+                "weekly_plan": VipType.weekly.value,
+                "weekly_amount": amounts.weekly,
+                "lifetime_amount": amounts.lifetime,
+                "active": SubscriptionStatus.active.value,
+                "reward_type": PointTransactionType.reward.value,
+                "reward_week": reward_week,
+                "now": now,
+            },
+        ).all()
+        balances = [(row.user_id, row.balance, row.version) for row in rows]
+    else:
+        balances = _reward_chunk_portable(
+            session, user_ids, reward_week=reward_week, amounts=amounts, now=now
+        )
+    session.commit()
+    points_cache.store_balances(balances)
+    return len(balances)
+
+
+def run_reward(
+    reward_week: str,
+    *,
+    amounts: RewardAmounts,
+    after: int = 0,
+    until: int | None = None,
+    shard: tuple[int, int] | None = None,
+    chunk_size: int | None = None,
+    on_chunk: Callable[[RewardStats], None] | None = None,
+) -> RewardStats:
+    """Reward every active subscriber with after < user_id <= until (optionally one shard)."""
+    size = max(1, chunk_size or settings.WEEKLY_REWARD_CHUNK_SIZE)
+    stats = RewardStats(last_user_id=after)
     with Session(engine) as session:
-        stmt = select(Subscription).where(
-            Subscription.status == SubscriptionStatus.active,
+        while True:
+            user_ids = next_chunk(
+                session, after=stats.last_user_id, limit=size, until=until, shard=shard
+            )
+            if not user_ids:
+                break
+            awarded = reward_chunk(session, user_ids, reward_week=reward_week, amounts=amounts)
+            stats.chunks += 1
+            stats.users += len(user_ids)
+            stats.awarded += awarded
+            stats.last_user_id = user_ids[-1]
+            logger.info(
+                "weekly reward chunk %s: week=%s shard=%s users=%s awarded=%s skipped=%s last_user_id=%s",
+                stats.chunks,
+                reward_week,
+                shard[0] if shard else "-",
+                len(user_ids),
+                awarded,
+                len(user_ids) - awarded,
+                stats.last_user_id,
+            )
+            if on_chunk is not None:
+                on_chunk(stats)
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Sharded, resumable execution. Subscribers are split into hash shards
+# (user_id % WEEKLY_REWARD_SHARDS). Workers - processes of one run or several
+# machines running the job at once - claim shards through a Redis lease and
+# checkpoint the last processed user_id per shard and reward_week, so a crash
+# resumes from the last finished chunk. Redoing a chunk is harmless: the
+# ledger insert is idempotent on idx_user_reward_week.
+# ---------------------------------------------------------------------------
+
+CHECKPOINT_TTL_SECONDS = 14 * 24 * 3600
+
+
+class LeaseLost(RuntimeError):
+    """The shard's lease expired and was taken by another worker."""
+
+
+def _checkpoint_key(reward_week: str) -> str:
+    return f"weekly_reward:{reward_week}:checkpoint"
+
+
+def _lease_key(reward_week: str, shard: int) -> str:
+    return f"weekly_reward:{reward_week}:lease:{shard}"
+
+
+def load_checkpoint(r: Redis, reward_week: str, shard: int) -> tuple[int, bool]:
+    """(last finished user_id, shard done) for this week."""
+    last, done = r.hmget(_checkpoint_key(reward_week), f"{shard}:last", f"{shard}:done")
+    return int(last or 0), bool(done)
+
+
+def save_checkpoint(r: Redis, reward_week: str, shard: int, *, last: int, done: bool = False) -> None:
+    key = _checkpoint_key(reward_week)
+    mapping = {f"{shard}:last": str(last)}
+    if done:
+        mapping[f"{shard}:done"] = "1"
+    r.hset(key, mapping=mapping)
+    r.expire(key, CHECKPOINT_TTL_SECONDS)
+
+
+def claim_shard(r: Redis, reward_week: str, shard: int, owner: str) -> bool:
+    return bool(
+        r.set(
+            _lease_key(reward_week, shard),
+            owner,
+            nx=True,
+            ex=settings.WEEKLY_REWARD_SHARD_LEASE_SECONDS,
+        )
+    )
+
+
+def renew_lease(r: Redis, reward_week: str, shard: int, owner: str) -> None:
+    key = _lease_key(reward_week, shard)
+    if r.get(key) != owner:
+        # Lease expired and another worker took the shard; stop to avoid duplicate work.
+        raise LeaseLost(f"lost lease on shard {shard}")
+    r.expire(key, settings.WEEKLY_REWARD_SHARD_LEASE_SECONDS)
+
+
+def release_shard(r: Redis, reward_week: str, shard: int, owner: str) -> None:
+    key = _lease_key(reward_week, shard)
+    if r.get(key) == owner:
+        r.delete(key)
+
+
+def run_shard(
+    r: Redis, reward_week: str, shard: int, *, shards: int, amounts: RewardAmounts, owner: str
+) -> RewardStats:
+    after, _done = load_checkpoint(r, reward_week, shard)
+    if after:
+        logger.info("weekly reward shard %s resuming after user_id=%s", shard, after)
+
+    def on_chunk(stats: RewardStats) -> None:
+        save_checkpoint(r, reward_week, shard, last=stats.last_user_id)
+        renew_lease(r, reward_week, shard, owner)
+
+    stats = run_reward(
+        reward_week, amounts=amounts, after=after, shard=(shard, shards), on_chunk=on_chunk
+    )
+    save_checkpoint(r, reward_week, shard, last=stats.last_user_id, done=True)
+    return stats
+
+
+def run_worker(reward_week: str, *, shards: int, amounts: RewardAmounts) -> RewardStats:
+    """Claim and run shards until none is left unclaimed and unfinished."""
+    r = get_redis()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    total = RewardStats()
+    # Start at a pid-dependent offset so concurrent workers spread over the shards.
+    offset = os.getpid() % shards
+    for i in range(shards):
+        shard = (offset + i) % shards
+        if load_checkpoint(r, reward_week, shard)[1]:
+            continue
+        if not claim_shard(r, reward_week, shard, owner):
+            continue
+        try:
+            if load_checkpoint(r, reward_week, shard)[1]:
+                continue
+            stats = run_shard(
+                r, reward_week, shard, shards=shards, amounts=amounts, owner=owner
+            )
+        except LeaseLost:
+            # The new owner resumes from the checkpoint; move on to the next shard.
+            logger.warning("weekly reward shard %s/%s: lease lost, skipping", shard, shards)
+            continue
+        finally:
+            release_shard(r, reward_week, shard, owner)
+        total.chunks += stats.chunks
+        total.users += stats.users
+        total.awarded += stats.awarded
+        logger.info(
+            "weekly reward shard %s/%s done: users=%s awarded=%s",
+            shard,
+            shards,
+            stats.users,
+            stats.awarded,
+        )
+    return total
+
+
+def unfinished_shards(r: Redis, reward_week: str, shards: int) -> list[int]:
+    return [shard for shard in range(shards) if not load_checkpoint(r, reward_week, shard)[1]]
+
+
+def _init_process() -> None:
+    # Forked children must not reuse the parent's pooled DB connections.
+    engine.dispose(close=False)
+
+
+def main() -> None:
+    refresh_config()
+    reward_week = _current_reward_week(datetime.now(timezone.utc))
+    amounts = _reward_amounts()
+    shards = max(1, settings.WEEKLY_REWARD_SHARDS)
+    processes = max(1, min(settings.WEEKLY_REWARD_PROCESSES, shards))
+
+    results: list[RewardStats] = []
+    if processes == 1:
+        results.append(run_worker(reward_week, shards=shards, amounts=amounts))
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_process) as pool:
+            futures = [
+                pool.submit(run_worker, reward_week, shards=shards, amounts=amounts)
+                for _ in range(processes)
+            ]
+            for f in futures:
+                try:
+                    results.append(f.result())
+                except Exception as e:
+                    # Its shards stay unfinished and are picked up below.
+                    logger.exception("weekly reward worker failed: %s", e)
+
+    # Shards whose worker failed or lost its lease: one more in-process pass
+    # resumes them from their checkpoints (shards still leased elsewhere are skipped).
+    r = get_redis()
+    if unfinished_shards(r, reward_week, shards):
+        results.append(run_worker(reward_week, shards=shards, amounts=amounts))
+    unfinished = unfinished_shards(r, reward_week, shards)
+
+    logger.info(
+        "weekly reward done: week=%s shards=%s processes=%s awarded=%s skipped=%s",
+        reward_week,
+        shards,
+        processes,
+        sum(s.awarded for s in results),
+        sum(s.skipped for s in results),
+    )
+    if unfinished:
+        # Rerunning the job resumes these shards from their checkpoints.
+        logger.error(
+            "weekly reward incomplete: week=%s unfinished shards=%s",
+            reward_week,
+            ", ".join(map(str, unfinished)),
         )
-        subs = session.exec(stmt).all()
-
-        awarded = 0
-        skipped = 0
-        for sub in subs:
-            if sub.plan_type == VipType.weekly:
-                amount = weekly_amount
-            else:
-                amount = lifetime_amount
-
-            try:
-                crud.change_points(
-                    session=session,
-                    user_id=sub.user_id,
-                    delta=amount,
-                    tx_type=PointTransactionType.reward,
-                    reward_week=reward_week,
-                )
-                awarded += 1
-            except IntegrityError:
-                session.rollback()
-                skipped += 1
-            except Exception as e:
-                session.rollback()
-                logger.exception("failed rewarding user %s: %s", sub.user_id, e)
-
-        logger.info("weekly reward done: week=%s awarded=%s skipped=%s", reward_week, awarded, skipped)
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":  # pragma: no cover